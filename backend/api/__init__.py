@@ -0,0 +1,8 @@
+import sys
+import os
+
+# Make the backend directory importable once, so `config` and `utils` resolve
+# the same way whether the app is started as `api.main` or `backend.api.main`
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _BACKEND_DIR not in sys.path:
+    sys.path.append(_BACKEND_DIR)
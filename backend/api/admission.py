@@ -0,0 +1,186 @@
+"""
+Admission control and load shedding.
+
+Each limited endpoint gets a fixed number of concurrent slots and a short
+FIFO queue. When the queue is full, or the expected wait (queue depth times
+recent service time) exceeds the queue-time budget, the request is rejected
+immediately with 503 and Retry-After instead of piling up until everything
+times out.
+
+Requests that can't hit an upstream bypass the limits: /api/health and
+anything that isn't configured, plus requests an endpoint's cache probe says
+will be answered from the service cache.
+"""
+from collections import deque
+from urllib.parse import parse_qsl
+import asyncio
+import json
+import math
+import time
+
+from config import settings
+
+# Weight of the newest sample in the per-endpoint service time average
+SERVICE_TIME_ALPHA = 0.2
+
+BUSY_BODY = json.dumps({"detail": "Server is busy, please retry shortly"}).encode("utf-8")
+
+# Endpoint prefix -> EndpointLimiter, shared by every middleware instance
+_limiters = {}
+
+
+class EndpointLimiter:
+    """
+    Concurrency limit with a bounded wait queue for one endpoint.
+
+    Only touched from the event loop, so no locking is needed.
+    """
+
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self.active = 0
+        self.waiters = deque()
+        self.service_time = 0.0  # seconds, moving average
+        self.admitted = 0
+        self.shed = 0
+
+    def expected_wait(self):
+        """Seconds a newly queued request would likely wait for a slot."""
+        return (len(self.waiters) + 1) * self.service_time / self.limit
+
+    async def acquire(self):
+        """Wait for a slot. Returns False if the request should be shed."""
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            self.admitted += 1
+            return True
+
+        max_wait = settings.ADMISSION_MAX_QUEUE_MS / 1000
+        if len(self.waiters) >= settings.ADMISSION_MAX_QUEUE or self.expected_wait() > max_wait:
+            self.shed += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, max_wait)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up, so pass it on
+                self._hand_off()
+            elif waiter in self.waiters:
+                self.waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self.shed += 1
+                return False
+            raise
+        # release() handed its slot straight to us, so active is already counted
+        self.admitted += 1
+        return True
+
+    def release(self, elapsed):
+        """Free a slot, passing it to the oldest waiter if there is one."""
+        self.service_time += SERVICE_TIME_ALPHA * (elapsed - self.service_time)
+        self._hand_off()
+
+    def _hand_off(self):
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queued": len(self.waiters),
+            "service_ms": round(self.service_time * 1000, 1),
+            "admitted": self.admitted,
+            "shed": self.shed
+        }
+
+
+def get_limiters():
+    """Return the per-endpoint limiters, creating them from ADMISSION_LIMITS on first use."""
+    if not _limiters:
+        for prefix, limit in settings.ADMISSION_LIMITS.items():
+            _limiters[prefix] = EndpointLimiter(prefix, limit)
+    return _limiters
+
+
+def admission_stats():
+    """Per-endpoint admission counters."""
+    return {name: limiter.stats() for name, limiter in get_limiters().items()}
+
+
+class AdmissionControlMiddleware:
+    """
+    ASGI middleware applying per-endpoint limits from ADMISSION_LIMITS.
+
+    Args:
+        app: The wrapped ASGI application
+        cache_probes (dict, optional): Endpoint prefix -> function taking the
+            query parameters and returning True when the request will be
+            served from cache (and so skips the limit)
+    """
+
+    def __init__(self, app, cache_probes=None):
+        self.app = app
+        self.cache_probes = cache_probes or {}
+        self.limiters = get_limiters()
+
+    def limiter_for(self, path):
+        """Return the limiter for the most specific configured prefix of a path, or None."""
+        segments = path.rstrip("/").split("/")
+        # "/api/transit/plan" -> "/api/transit/plan", then "/api/transit"
+        for depth in (4, 3):
+            limiter = self.limiters.get("/".join(segments[:depth]))
+            if limiter is not None:
+                return limiter
+        return None
+
+    def is_cache_hit(self, limiter, scope):
+        probe = self.cache_probes.get(limiter.name)
+        if probe is None:
+            return False
+        try:
+            return probe(dict(parse_qsl(scope["query_string"].decode("latin-1"))))
+        except Exception:
+            # Malformed parameters: let the route produce its validation error
+            return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.ADMISSION_CONTROL_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        limiter = self.limiter_for(scope["path"])
+        if limiter is None or self.is_cache_hit(limiter, scope):
+            await self.app(scope, receive, send)
+            return
+
+        if not await limiter.acquire():
+            await self.reject(limiter, send)
+            return
+
+        start = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release(time.monotonic() - start)
+
+    async def reject(self, limiter, send):
+        retry_after = max(settings.ADMISSION_RETRY_AFTER_SECONDS, math.ceil(limiter.expected_wait()))
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(BUSY_BODY)).encode("latin-1")),
+                (b"retry-after", str(retry_after).encode("latin-1")),
+            ]
+        })
+        await send({"type": "http.response.body", "body": BUSY_BODY})
@@ -1,15 +1,33 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .routes import weather, traffic, transit, users
-import sys
-import os
+from .routes import weather, traffic, transit, users, routing, recommendations, alerts, commute, search, admin
 
-# Add the parent directory to sys.path to import config
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import settings
+from .admission import AdmissionControlMiddleware, admission_stats
+from .profiling import RequestTraceMiddleware, profiler
+from .services.gtfs_realtime_service import start_realtime_consumer, stop_realtime_consumer
+from .services.gtfs_service import start_gtfs_loader, stop_gtfs_loader
+from .services.delay_service import save_histograms
+from .services.alert_service import start_alert_evaluator, stop_alert_evaluator
+from .services.timeseries_service import stop_timeseries_writer, timeseries_stats
 
 app = FastAPI(title="Urban Commute Assistant API")
 
+# Shed load per endpoint before requests queue up behind slow upstreams.
+# Added before CORS so rejections still carry CORS headers.
+app.add_middleware(
+    AdmissionControlMiddleware,
+    cache_probes={
+        "/api/weather": weather.is_cached_request,
+        "/api/traffic": traffic.is_cached_request,
+        "/api/route": routing.is_cached_request,
+        "/api/commute": commute.is_cached_request,
+    },
+)
+
+# Outside admission control so time spent queued counts toward slow requests
+app.add_middleware(RequestTraceMiddleware)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -24,6 +42,30 @@ app.include_router(weather.router, prefix="/api")
 app.include_router(traffic.router, prefix="/api")
 app.include_router(transit.router, prefix="/api")
 app.include_router(users.router, prefix="/api")
+app.include_router(routing.router, prefix="/api")
+app.include_router(recommendations.router, prefix="/api")
+app.include_router(alerts.router, prefix="/api")
+app.include_router(commute.router, prefix="/api")
+app.include_router(search.router, prefix="/api")
+app.include_router(admin.router, prefix="/api")
+
+@app.on_event("startup")
+async def start_background_consumers():
+    # By default GTFS data and the realtime feed are loaded on first use,
+    # which keeps cold starts fast when nobody asks for transit
+    if settings.GTFS_PRELOAD:
+        start_gtfs_loader()
+        start_realtime_consumer()
+    start_alert_evaluator()
+
+@app.on_event("shutdown")
+async def stop_background_consumers():
+    stop_realtime_consumer()
+    stop_gtfs_loader()
+    stop_alert_evaluator()
+    save_histograms()
+    stop_timeseries_writer()
+    profiler.stop()
 
 @app.get("/")
 async def root():
@@ -31,4 +73,9 @@ async def root():
 
 @app.get("/api/health")
 async def health_check():
-    return {"status": "healthy", "version": "1.0.0"}
+    return {
+        "status": "healthy",
+        "version": "1.0.0",
+        "admission": admission_stats(),
+        "timeseries": timeseries_stats()
+    }
@@ -0,0 +1,275 @@
+"""
+On-demand profiling and slow-request capture.
+
+SamplingProfiler walks every thread's stack (sys._current_frames) a few
+times a second while it's running and counts the stacks in the folded
+format flamegraph.pl and speedscope read. It costs nothing while stopped
+and one stack walk per busy thread per sample while running, and it stops
+itself after PROFILER_MAX_SECONDS.
+
+Every request carries a RequestTrace in a context variable. Services note
+their upstream calls and cache decisions on it, and RequestTraceMiddleware
+keeps the requests slower than SLOW_REQUEST_MS in a bounded ring buffer.
+"""
+from collections import deque
+from contextlib import contextmanager
+import contextvars
+import os
+import sys
+import threading
+import time
+
+from config import settings
+
+# Files whose leaf frames mean a thread is parked, not working
+IDLE_FILES = ("threading.py", "selectors.py", "queue.py", os.path.join("concurrent", "futures", "thread.py"))
+
+_trace = contextvars.ContextVar("request_trace", default=None)
+
+# Requests slower than SLOW_REQUEST_MS, oldest first
+_slow_requests = deque(maxlen=settings.SLOW_REQUEST_BUFFER)
+
+# Source file -> path shown in stacks
+_short_paths = {}
+
+
+class RequestTrace:
+    """Timings and decisions collected while serving one request."""
+
+    __slots__ = ("method", "path", "query", "started", "duration_ms", "status", "bytes", "upstreams", "cache")
+
+    def __init__(self, method, path, query):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.started = time.time()
+        self.duration_ms = None
+        self.status = None
+        self.bytes = 0
+        # Appended to from threadpool threads; list.append is atomic
+        self.upstreams = []
+        self.cache = []
+
+    def as_dict(self):
+        return {
+            "method": self.method,
+            "path": self.path,
+            "query": self.query,
+            "started": self.started,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "bytes": self.bytes,
+            "upstreams": self.upstreams,
+            "cache": self.cache
+        }
+
+
+def current_trace():
+    """The RequestTrace of the request being served, or None outside a request."""
+    return _trace.get()
+
+
+@contextmanager
+def upstream(name):
+    """
+    Time an upstream call for the current request's trace.
+
+    Yields a dict the caller may add details to, such as "bytes".
+    """
+    call = {"name": name}
+    trace = _trace.get()
+    start = time.perf_counter()
+    try:
+        yield call
+    except Exception as e:
+        call["error"] = type(e).__name__
+        raise
+    finally:
+        if trace is not None:
+            call["ms"] = round((time.perf_counter() - start) * 1000, 1)
+            trace.upstreams.append(call)
+
+
+def record_cache(name, decision):
+    """
+    Note a cache decision on the current request's trace.
+
+    Args:
+        name (str): The cache, e.g. "traffic"
+        decision (str): "hit", "miss", or "coalesced" for a miss that
+            waited on another request's upstream call
+    """
+    trace = _trace.get()
+    if trace is not None:
+        trace.cache.append({"name": name, "decision": decision})
+
+
+def slow_requests(path=None, limit=None):
+    """
+    Recent slow requests, slowest first.
+
+    Args:
+        path (str, optional): Only requests whose path starts with this
+        limit (int, optional): At most this many
+
+    Returns:
+        list: RequestTrace dicts
+    """
+    traces = [trace for trace in list(_slow_requests) if path is None or trace.path.startswith(path)]
+    traces.sort(key=lambda trace: -trace.duration_ms)
+    return [trace.as_dict() for trace in traces[:limit]]
+
+
+def clear_slow_requests():
+    _slow_requests.clear()
+
+
+class RequestTraceMiddleware:
+    """ASGI middleware giving each request a RequestTrace and keeping the slow ones."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.REQUEST_TRACE_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace(scope["method"], scope["path"], scope["query_string"].decode("latin-1"))
+        token = _trace.set(trace)
+
+        async def traced_send(message):
+            if message["type"] == "http.response.start":
+                trace.status = message["status"]
+            elif message["type"] == "http.response.body":
+                trace.bytes += len(message.get("body", b""))
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, traced_send)
+        finally:
+            _trace.reset(token)
+            trace.duration_ms = round((time.perf_counter() - start) * 1000, 1)
+            if trace.duration_ms >= settings.SLOW_REQUEST_MS:
+                _slow_requests.append(trace)
+
+
+def _short_path(filename):
+    """A source path relative to the sys.path entry it was imported from."""
+    short = _short_paths.get(filename)
+    if short is None:
+        short = filename
+        for root in sorted((p for p in sys.path if p), key=len, reverse=True):
+            root = os.path.join(os.path.abspath(root), "")
+            if filename.startswith(root):
+                short = filename[len(root):]
+                break
+        _short_paths[filename] = short
+    return short
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler over all threads, exporting folded stacks.
+
+    Stacks are counted as tuples of code objects while sampling and only
+    formatted on export, so a sample is a dict update per busy thread.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.stacks = {}  # (thread name, code objects root first) -> samples
+        self.samples = 0
+        self.hz = 0
+        self.idle = False
+        self.started = None
+        self.stopped = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, hz, seconds, idle=False):
+        """
+        Start sampling, discarding the previous profile.
+
+        Args:
+            hz (int): Samples per second
+            seconds (int): Stop on its own after this long
+            idle (bool, optional): Also count threads parked in waits. Defaults to False.
+
+        Returns:
+            bool: False if the profiler was already running
+        """
+        with self.lock:
+            if self.running:
+                return False
+            self.stacks = {}
+            self.samples = 0
+            self.hz = hz
+            self.idle = idle
+            self.started = time.time()
+            self.stopped = None
+            self.stop_event.clear()
+            self.thread = threading.Thread(
+                target=self._run, args=(1 / hz, time.monotonic() + seconds), name="sampling-profiler", daemon=True
+            )
+            self.thread.start()
+            return True
+
+    def stop(self):
+        """Stop sampling and wait for the sampler thread. The profile is kept."""
+        with self.lock:
+            thread = self.thread
+            self.stop_event.set()
+        if thread is not None:
+            thread.join(timeout=5)
+
+    def _run(self, interval, deadline):
+        own = threading.get_ident()
+        while not self.stop_event.wait(interval) and time.monotonic() < deadline:
+            self.sample(own)
+        self.stopped = time.time()
+
+    def sample(self, skip=None):
+        """Record the current stack of every thread except skip."""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == skip:
+                continue
+            if not self.idle and frame.f_code.co_filename.endswith(IDLE_FILES):
+                continue
+            codes = []
+            while frame is not None:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            codes.reverse()
+            key = (names.get(ident, "thread"), tuple(codes))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+        self.samples += 1
+
+    def folded(self):
+        """The profile in folded-stack format: one "frame;frame;... count" line per stack."""
+        lines = {}
+        for (name, codes), count in list(self.stacks.items()):
+            frames = [name] + [f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})" for code in codes]
+            line = ";".join(frame.replace(";", ",") for frame in frames)
+            lines[line] = lines.get(line, 0) + count
+        return "".join(f"{line} {count}\n" for line, count in sorted(lines.items()))
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "hz": self.hz,
+            "idle": self.idle,
+            "samples": self.samples,
+            "stacks": len(self.stacks),
+            "started": self.started,
+            "stopped": self.stopped
+        }
+
+
+profiler = SamplingProfiler()
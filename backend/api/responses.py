@@ -0,0 +1,224 @@
+"""
+Fast JSON serialization, compression and HTTP caching for API responses.
+
+When FAST_RESPONSES_ENABLED is set, routes return pre-encoded bytes instead
+of letting FastAPI run its generic encoder. Encoded (and compressed) bodies
+are cached next to the service cache entry they came from, so a cache hit
+skips serialization and compression entirely.
+
+Clients that send "Accept: application/msgpack" get MessagePack instead of
+JSON, and routes can hand over already-encoded binary bodies such as
+vector tiles; both go through the same caching and compression.
+
+Routes that pass a max_age also get Cache-Control and a strong ETag derived
+from the body, and conditional requests are answered with 304.
+"""
+from fastapi import Request, Response
+from datetime import datetime
+import hashlib
+import gzip
+import json
+
+from config import settings
+from .profiling import record_cache
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+ENCODED_CACHE_SIZE = 1024
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+# cache_key (plus format) -> (payload object, {content encoding: body bytes}, etag hash)
+_encoded_cache = {}
+
+
+def canonical_coordinates(lat, lon, decimals):
+    """
+    Snap request coordinates to a fixed grid so nearby users share service
+    cache entries and (with matching client rounding) CDN cache entries.
+    """
+    return round(lat, decimals), round(lon, decimals)
+
+
+def cache_max_age(expiry, cache_key, ttl):
+    """
+    Seconds a response may be cached: what's left of the service cache
+    entry's lifetime, or the full TTL if the entry isn't found.
+    """
+    expires_at = expiry.get(cache_key)
+    if expires_at is None:
+        return int(ttl.total_seconds())
+    return max(0, int((expires_at - datetime.now()).total_seconds()))
+
+
+def _encode_default(value):
+    # Compact service records (e.g. traffic incidents) become dicts only here
+    to_dict = getattr(value, "to_dict", None)
+    if to_dict is not None:
+        return to_dict()
+    return str(value)
+
+
+def encode_json(payload):
+    """Serialize a payload to compact JSON bytes, using orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_encode_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, separators=(",", ":"), default=_encode_default).encode("utf-8")
+
+
+def encode_msgpack(payload):
+    """Serialize a payload to MessagePack bytes."""
+    return msgpack.packb(payload, default=_encode_default, use_bin_type=True)
+
+
+# Response body format -> (media type, encoder). "mvt" bodies are already bytes.
+FORMATS = {
+    "json": ("application/json", encode_json),
+    "msgpack": ("application/msgpack", encode_msgpack),
+    "mvt": ("application/vnd.mapbox-vector-tile", bytes),
+}
+
+
+def _accepted(header):
+    """Lower-cased names listed in an Accept-style header, minus those with q=0."""
+    offered = set()
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        offered.add(name.strip().lower())
+    return offered
+
+
+def negotiate_format(accept):
+    """Pick the body format from the Accept header: MessagePack if asked for (and installed), else JSON."""
+    if msgpack is not None and not _accepted(accept).isdisjoint(MSGPACK_MEDIA_TYPES):
+        return "msgpack"
+    return "json"
+
+
+def negotiate_encoding(accept_encoding):
+    """Pick the best content encoding the client accepts: br, then gzip, then identity."""
+    offered = _accepted(accept_encoding)
+    if brotli is not None and "br" in offered:
+        return "br"
+    if "gzip" in offered:
+        return "gzip"
+    return "identity"
+
+
+def compress(body, encoding):
+    """Compress a body with the given content encoding."""
+    if encoding == "br":
+        return brotli.compress(body, quality=settings.BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=settings.GZIP_LEVEL)
+    return body
+
+
+def encoded_body(payload, encoding="identity", cache_key=None, body_format="json"):
+    """
+    Get the encoded body for a payload, reusing cached bytes for the same
+    service cache entry.
+
+    Args:
+        payload: JSON-serializable response payload (bytes for "mvt")
+        encoding (str, optional): Content encoding. Defaults to "identity".
+        cache_key (str, optional): Service cache key the payload came from
+        body_format (str, optional): Key of FORMATS. Defaults to "json".
+
+    Returns:
+        tuple: (body bytes, content encoding actually applied, content hash)
+    """
+    if cache_key and body_format != "json":
+        cache_key = f"{cache_key}.{body_format}"
+    entry = _encoded_cache.get(cache_key) if cache_key else None
+    # Cache hits return the very same dict, so identity says the bytes are current
+    if cache_key:
+        record_cache("encoded_body", "hit" if entry is not None and entry[0] is payload else "miss")
+    if entry is None or entry[0] is not payload:
+        body = FORMATS[body_format][1](payload)
+        entry = (payload, {"identity": body}, hashlib.blake2b(body, digest_size=16).hexdigest())
+        if cache_key:
+            if len(_encoded_cache) >= ENCODED_CACHE_SIZE:
+                _encoded_cache.pop(next(iter(_encoded_cache)))
+            _encoded_cache[cache_key] = entry
+
+    variants = entry[1]
+    if len(variants["identity"]) < settings.COMPRESSION_MIN_BYTES:
+        encoding = "identity"
+    if encoding not in variants:
+        variants[encoding] = compress(variants["identity"], encoding)
+    return variants[encoding], encoding, entry[2]
+
+
+def _etag_matches(if_none_match, content_hash):
+    """Check an If-None-Match header against any representation of the content."""
+    if if_none_match.strip() == "*":
+        return True
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag.strip('"').split("-")[0] == content_hash:
+            return True
+    return False
+
+
+def encoded_response(request: Request, payload, cache_key=None, max_age=None, body_format=None):
+    """
+    Build the response for a route's payload.
+
+    Returns the payload unchanged (FastAPI's default path) unless the fast
+    path is enabled, caching headers are requested or the client asked for
+    MessagePack. Then it returns pre-encoded bytes, with Cache-Control and
+    ETag when max_age is given.
+
+    Args:
+        request (Request): Incoming request, for content negotiation
+        payload: JSON-serializable response payload (bytes for "mvt")
+        cache_key (str, optional): Service cache key the payload came from
+        max_age (int, optional): Seconds the response may be cached
+        body_format (str, optional): Fixed body format; negotiated from the
+            Accept header (JSON or MessagePack) when not given
+    """
+    vary = "Accept-Encoding"
+    if body_format is None:
+        body_format = negotiate_format(request.headers.get("accept", ""))
+        vary = "Accept, Accept-Encoding"
+    if body_format == "json" and not settings.FAST_RESPONSES_ENABLED and max_age is None:
+        return payload
+
+    encoding = "identity"
+    if settings.FAST_RESPONSES_ENABLED:
+        encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+    body, encoding, content_hash = encoded_body(payload, encoding, cache_key, body_format)
+
+    headers = {"Vary": vary}
+    if max_age is not None:
+        # Each content encoding is a distinct representation, so it gets its own strong ETag
+        headers["ETag"] = f'"{content_hash}"' if encoding == "identity" else f'"{content_hash}-{encoding}"'
+        headers["Cache-Control"] = f"public, max-age={max_age}, stale-while-revalidate={max_age}"
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and _etag_matches(if_none_match, content_hash):
+            return Response(status_code=304, headers=headers)
+
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=FORMATS[body_format][0], headers=headers)
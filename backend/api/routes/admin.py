@@ -0,0 +1,53 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+
+from config import settings
+from ..profiling import profiler, slow_requests, clear_slow_requests
+from .users import get_admin_user
+
+# Every endpoint needs an ADMIN_USERS account
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(get_admin_user)])
+
+@router.get("/profiler")
+async def profiler_status():
+    """Whether the sampling profiler is running, and what it has collected."""
+    return profiler.stats()
+
+@router.post("/profiler/start")
+async def start_profiler(
+    hz: int = Query(settings.PROFILER_DEFAULT_HZ, ge=1, le=settings.PROFILER_MAX_HZ, description="Samples per second"),
+    seconds: int = Query(60, ge=1, le=settings.PROFILER_MAX_SECONDS, description="Stop automatically after this long"),
+    idle: bool = Query(False, description="Also count threads parked in waits")
+):
+    """Start sampling every thread's stack, discarding the previous profile."""
+    if not profiler.start(hz, seconds, idle):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Profiler is already running")
+    return profiler.stats()
+
+@router.post("/profiler/stop")
+def stop_profiler():
+    """Stop the profiler; the profile stays available from /profiler/folded."""
+    profiler.stop()
+    return profiler.stats()
+
+@router.get("/profiler/folded", response_class=PlainTextResponse)
+def profiler_folded():
+    """The profile as folded stacks, for flamegraph.pl or speedscope."""
+    return PlainTextResponse(profiler.folded())
+
+@router.get("/slow-requests")
+async def get_slow_requests(
+    path: Optional[str] = Query(None, description="Only requests whose path starts with this, e.g. /api/transit"),
+    limit: int = Query(50, ge=1, le=500)
+):
+    """Recent requests slower than SLOW_REQUEST_MS, slowest first, with upstream timings and cache decisions."""
+    return {
+        "threshold_ms": settings.SLOW_REQUEST_MS,
+        "requests": slow_requests(path, limit)
+    }
+
+@router.delete("/slow-requests")
+async def delete_slow_requests():
+    clear_slow_requests()
+    return {"message": "Slow request buffer cleared"}
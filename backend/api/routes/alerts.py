@@ -0,0 +1,13 @@
+from fastapi import APIRouter, Depends
+from ..services.alert_service import get_user_alerts, get_last_cycle
+from .users import get_current_user, UserInDB
+
+router = APIRouter(prefix="/alerts", tags=["alerts"])
+
+@router.get("/me")
+async def read_my_alerts(current_user: UserInDB = Depends(get_current_user)):
+    """Current alerts for the user's commute profiles, from the latest evaluation cycle."""
+    return {
+        "alerts": get_user_alerts(current_user.id),
+        "evaluated_at": get_last_cycle().get("completed_at")
+    }
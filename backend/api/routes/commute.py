@@ -0,0 +1,35 @@
+from fastapi import APIRouter, HTTPException, Query
+from datetime import datetime
+from typing import Optional
+from ..services.commute_service import compare_commute, commute_cache_key, cache, cache_expiry
+from ..services.gtfs_service import agency_timestamp
+import time
+
+router = APIRouter(prefix="/commute", tags=["commute"])
+
+def is_cached_request(params):
+    """Admission-control probe: will this request be served from the commute cache?"""
+    depart_at = agency_timestamp(params["depart_at"]) if "depart_at" in params else time.time()
+    cache_key = commute_cache_key(
+        float(params["from_lat"]), float(params["from_lon"]), float(params["to_lat"]), float(params["to_lon"]),
+        depart_at
+    )
+    return cache_key in cache and cache_expiry.get(cache_key, datetime.min) > datetime.now()
+
+# Plain def: the comparison waits on several upstream calls in its own pool
+@router.get("/compare")
+def compare_modes(
+    from_lat: float = Query(..., ge=-90, le=90, description="Origin latitude"),
+    from_lon: float = Query(..., ge=-180, le=180, description="Origin longitude"),
+    to_lat: float = Query(..., ge=-90, le=90, description="Destination latitude"),
+    to_lon: float = Query(..., ge=-180, le=180, description="Destination longitude"),
+    depart_at: Optional[datetime] = Query(None, description="Departure time, local time unless it has an offset (defaults to now)")
+):
+    """Compare driving, transit, cycling and walking, ranked by traffic- and weather-adjusted time."""
+    try:
+        result = compare_commute(from_lat, from_lon, to_lat, to_lon, agency_timestamp(depart_at))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not result["options"]:
+        raise HTTPException(status_code=503, detail="No travel mode could be routed")
+    return result
@@ -0,0 +1,88 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from datetime import datetime
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from ..services.recommendation_service import score_commutes, recommend_for_user, MODES
+from ..services.gtfs_service import agency_timestamp
+from .users import get_current_user, UserInDB
+from config import settings
+
+router = APIRouter(prefix="/recommendations", tags=["recommendations"])
+
+# Largest batch scored in one request: admins running notifications, other users
+MAX_BATCH_SIZE = 10000
+MAX_USER_BATCH_SIZE = 50
+
+class Commute(BaseModel):
+    origin_lat: float = Field(..., ge=-90, le=90)
+    origin_lon: float = Field(..., ge=-180, le=180)
+    destination_lat: float = Field(..., ge=-90, le=90)
+    destination_lon: float = Field(..., ge=-180, le=180)
+    depart_at: Optional[datetime] = None
+    preferred_mode: Optional[str] = None
+
+class CommuteBatch(BaseModel):
+    commutes: List[Commute] = Field(..., max_length=MAX_BATCH_SIZE)
+
+def _check_mode(mode):
+    if mode is not None and mode not in MODES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Preferred mode must be one of: {', '.join(MODES)}"
+        )
+
+# Plain def handlers: scoring is CPU work, keep it off the event loop
+@router.get("/")
+def get_recommendation(
+    lat: float = Query(..., ge=-90, le=90, description="Origin latitude"),
+    lon: float = Query(..., ge=-180, le=180, description="Origin longitude"),
+    dest_lat: float = Query(..., ge=-90, le=90, description="Destination latitude"),
+    dest_lon: float = Query(..., ge=-180, le=180, description="Destination longitude"),
+    depart_at: Optional[datetime] = Query(None, description="Departure time (defaults to now)"),
+    preferred_mode: Optional[str] = Query(None, description=f"Mode to favour: {', '.join(MODES)}")
+):
+    """Rank every transport mode for a single commute."""
+    _check_mode(preferred_mode)
+    return score_commutes([{
+        "origin_lat": lat,
+        "origin_lon": lon,
+        "destination_lat": dest_lat,
+        "destination_lon": dest_lon,
+        "depart_at": agency_timestamp(depart_at),
+        "preferred_mode": preferred_mode
+    }])[0]
+
+@router.get("/me")
+def get_my_recommendations(
+    lat: float = Query(..., ge=-90, le=90, description="Current latitude"),
+    lon: float = Query(..., ge=-180, le=180, description="Current longitude"),
+    depart_at: Optional[datetime] = Query(None, description="Departure time (defaults to now)"),
+    preferred_mode: Optional[str] = Query(None, description=f"Mode to favour: {', '.join(MODES)}"),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """Rank every mode to each of the user's saved places in one pass."""
+    _check_mode(preferred_mode)
+    return recommend_for_user(
+        current_user.id, lat, lon, preferred_mode, agency_timestamp(depart_at)
+    )
+
+@router.post("/batch")
+def score_commute_batch(batch: CommuteBatch, current_user: UserInDB = Depends(get_current_user)):
+    """
+    Score many commutes at once, e.g. for a notification run.
+
+    Any signed-in user may score up to MAX_USER_BATCH_SIZE commutes;
+    users in ADMIN_USERS up to MAX_BATCH_SIZE.
+    """
+    limit = MAX_BATCH_SIZE if current_user.username in settings.ADMIN_USERS else MAX_USER_BATCH_SIZE
+    if len(batch.commutes) > limit:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {limit} commutes per batch"
+        )
+    for commute in batch.commutes:
+        _check_mode(commute.preferred_mode)
+    return score_commutes([
+        {**commute.model_dump(), "depart_at": agency_timestamp(commute.depart_at)}
+        for commute in batch.commutes
+    ])
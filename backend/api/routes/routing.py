@@ -0,0 +1,50 @@
+from fastapi import APIRouter, HTTPException, Query, status
+from datetime import datetime
+from typing import Optional
+from ..services.routing_service import get_route, route_cache_key, cache, cache_expiry, TRAVEL_MODES
+from ..services.gtfs_service import agency_timestamp
+import logging
+import time
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/route", tags=["routing"])
+
+def is_cached_request(params):
+    """Admission-control probe: will this request be served from the route cache?"""
+    depart_at = agency_timestamp(params["depart_at"]) if "depart_at" in params else time.time()
+    cache_key = route_cache_key(
+        float(params["from_lat"]), float(params["from_lon"]), float(params["to_lat"]), float(params["to_lon"]),
+        params.get("mode", "car"), depart_at
+    )
+    return cache_key in cache and cache_expiry.get(cache_key, datetime.min) > datetime.now()
+
+# Plain def so FastAPI runs it in the threadpool: concurrent identical
+# requests can then actually overlap and be coalesced by the service
+@router.get("/")
+def get_route_between(
+    from_lat: float = Query(..., ge=-90, le=90, description="Origin latitude"),
+    from_lon: float = Query(..., ge=-180, le=180, description="Origin longitude"),
+    to_lat: float = Query(..., ge=-90, le=90, description="Destination latitude"),
+    to_lon: float = Query(..., ge=-180, le=180, description="Destination longitude"),
+    mode: str = Query("car", description=f"Travel mode: {', '.join(TRAVEL_MODES)}"),
+    depart_at: Optional[datetime] = Query(None, description="Departure time, local time unless it has an offset (defaults to now)")
+):
+    """Get a route between two points with an encoded polyline geometry."""
+    if mode not in TRAVEL_MODES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Travel mode must be one of: {', '.join(TRAVEL_MODES)}"
+        )
+
+    result = get_route(from_lat, from_lon, to_lat, to_lon, mode, agency_timestamp(depart_at))
+
+    if "error" in result:
+        logger.error(f"Routing service error: {result['error']}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Routing service error: {result['error']}"
+        )
+
+    return result
@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from typing import Optional
+from ..services.search_service import search, KINDS
+from .users import get_optional_user, UserInDB
+
+router = APIRouter(prefix="/search", tags=["search"])
+
+# Plain def: the first query after a GTFS load builds the index
+@router.get("/")
+def search_places(
+    q: str = Query(..., min_length=1, max_length=100, description="Text typed so far"),
+    lat: Optional[float] = Query(None, ge=-90, le=90, description="Caller latitude, to rank nearby results first"),
+    lon: Optional[float] = Query(None, ge=-180, le=180, description="Caller longitude"),
+    types: Optional[str] = Query(None, description=f"Comma-separated result types: {', '.join(KINDS)}"),
+    limit: int = Query(10, ge=1, le=25, description="Maximum number of results"),
+    current_user: Optional[UserInDB] = Depends(get_optional_user)
+):
+    """Autocomplete stops, routes and (when signed in) saved places, with typo tolerance."""
+    kinds = None
+    if types:
+        kinds = {kind.strip() for kind in types.split(",") if kind.strip()}
+        unknown = kinds - set(KINDS)
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown result types: {', '.join(sorted(unknown))}"
+            )
+    return search(q, lat, lon, current_user.id if current_user else None, kinds, limit)
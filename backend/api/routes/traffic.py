@@ -1,5 +1,10 @@
-from fastapi import APIRouter, HTTPException, Query, status
-from ..services.traffic_service import get_traffic_data
+from fastapi import APIRouter, HTTPException, Path, Query, Request, status
+from datetime import datetime
+from ..services.traffic_service import (
+    get_traffic_data, traffic_cache_key, cache, cache_expiry, TRAFFIC_CACHE_TTL, TRAFFIC_COORD_DECIMALS
+)
+from ..services.tile_service import get_incident_tile, valid_tile
+from ..responses import encoded_response, canonical_coordinates, cache_max_age
 import logging
 
 # Set up logger
@@ -7,8 +12,16 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/traffic", tags=["traffic"])
 
+def is_cached_request(params):
+    """Admission-control probe: will this request be served from the traffic cache?"""
+    lat, lon = canonical_coordinates(float(params["lat"]), float(params["lon"]), TRAFFIC_COORD_DECIMALS)
+    cache_key = traffic_cache_key(lat, lon, int(params.get("radius", 5000)))
+    return cache_key in cache and cache_expiry.get(cache_key, datetime.min) > datetime.now()
+
+# Plain def so a slow upstream blocks a threadpool worker, not the event loop
 @router.get("/")
-async def get_traffic(
+def get_traffic(
+    request: Request,
     lat: float = Query(..., description="Latitude"),
     lon: float = Query(..., description="Longitude"),
     radius: int = Query(5000, description="Radius in meters")
@@ -28,6 +41,7 @@ async def get_traffic(
                 detail="Longitude must be between -180 and 180"
             )
             
+        lat, lon = canonical_coordinates(lat, lon, TRAFFIC_COORD_DECIMALS)
         result = get_traffic_data(lat, lon, radius)
         
         if "error" in result:
@@ -37,7 +51,8 @@ async def get_traffic(
                 detail=f"Traffic service error: {result['error']}"
             )
             
-        return result
+        cache_key = traffic_cache_key(lat, lon, radius)
+        return encoded_response(request, result, cache_key, cache_max_age(cache_expiry, cache_key, TRAFFIC_CACHE_TTL))
     except HTTPException:
         # Re-raise HTTP exceptions
         raise
@@ -47,3 +62,24 @@ async def get_traffic(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
             detail=f"Unexpected error: {str(e)}"
         )
+
+@router.get("/tiles/{z}/{x}/{y}.mvt")
+def get_traffic_map_tile(
+    request: Request,
+    z: int = Path(..., description="Zoom level"),
+    x: int = Path(..., description="Tile column"),
+    y: int = Path(..., description="Tile row")
+):
+    """Mapbox Vector Tile with the "incidents" layer (zoom 10+)."""
+    if not valid_tile(z, x, y):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Tile coordinates out of range")
+    result = get_incident_tile(z, x, y)
+    if "error" in result:
+        logger.error(f"Traffic service error: {result['error']}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Traffic service error: {result['error']}"
+        )
+    cache_key = result["cache_key"]
+    max_age = cache_max_age(cache_expiry, cache_key, TRAFFIC_CACHE_TTL) if cache_key else None
+    return encoded_response(request, result["tile"], cache_key and f"{cache_key}_{z}_{x}_{y}", max_age, body_format="mvt")
@@ -1,19 +1,141 @@
-from fastapi import APIRouter, HTTPException, Query
-from ..services.transit_service import get_transit_data
+from fastapi import APIRouter, HTTPException, Path, Query, Request
+from datetime import datetime
+from typing import Optional
+from ..services.transit_service import get_transit_data, TRANSIT_CACHE_TTL, TRANSIT_COORD_DECIMALS
+from ..services.trip_planner_service import plan_trip, get_reachable
+from ..services.gtfs_service import agency_timestamp
+from ..services.delay_service import predict_arrival
+from ..services.reliability_service import get_reliability
+from ..services.tile_service import get_transit_tile, valid_tile, TRANSIT_TILE_MAX_AGE
+from ..services.shape_service import get_route_shape, get_all_route_shapes, SHAPE_MAX_AGE
+import time
+from ..responses import encoded_response, canonical_coordinates
 
 router = APIRouter(prefix="/transit", tags=["transit"])
 
+# Plain def handlers: upstream calls and timetable searches run in the
+# threadpool instead of blocking the event loop
 @router.get("/")
-async def get_transit(
+def get_transit(
+    request: Request,
     lat: float = Query(..., description="Latitude"),
     lon: float = Query(..., description="Longitude"),
     radius: int = Query(500, description="Radius in meters")
 ):
     """Get transit data for a specific location."""
     try:
+        lat, lon = canonical_coordinates(lat, lon, TRANSIT_COORD_DECIMALS)
         result = get_transit_data(lat, lon, radius)
         if "error" in result:
             raise HTTPException(status_code=500, detail=result["error"])
-        return result
+        return encoded_response(request, result, max_age=int(TRANSIT_CACHE_TTL.total_seconds()))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/plan")
+def plan_transit_trip(
+    from_lat: float = Query(..., description="Origin latitude"),
+    from_lon: float = Query(..., description="Origin longitude"),
+    to_lat: float = Query(..., description="Destination latitude"),
+    to_lon: float = Query(..., description="Destination longitude"),
+    depart_at: Optional[datetime] = Query(None, description="Earliest departure time, agency local time unless it has an offset (defaults to now)"),
+    window_minutes: int = Query(30, ge=0, le=180, description="Departure window in minutes"),
+    max_transfers: int = Query(3, ge=0, le=4, description="Maximum number of transfers")
+):
+    """Plan transit journeys between two points over the GTFS timetable."""
+    try:
+        result = plan_trip(
+            from_lat, from_lon, to_lat, to_lon,
+            agency_timestamp(depart_at),
+            window_minutes, max_transfers
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=503, detail="Transit timetable is still loading")
+    return result
+
+@router.get("/reachable")
+def get_transit_reachable(
+    request: Request,
+    lat: float = Query(..., description="Origin latitude"),
+    lon: float = Query(..., description="Origin longitude"),
+    depart_at: Optional[datetime] = Query(None, description="Departure time, agency local time unless it has an offset (defaults to now)"),
+    budget_minutes: int = Query(30, ge=1, le=120, description="Travel time budget in minutes"),
+    grid: bool = Query(False, description="Include isochrone grid cells"),
+    cell_size: int = Query(250, ge=100, le=2000, description="Grid cell size in meters")
+):
+    """Get every stop (and optionally grid cell) reachable within a time budget."""
+    try:
+        result = get_reachable(
+            lat, lon,
+            agency_timestamp(depart_at),
+            budget_minutes, grid, cell_size
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=503, detail="Transit timetable is still loading")
+    return encoded_response(request, result)
+
+@router.get("/shapes")
+def get_transit_shapes(
+    request: Request,
+    zoom: int = Query(12, ge=0, le=22, description="Map zoom level the geometry is drawn at")
+):
+    """Every route's geometry as encoded polylines, simplified for a zoom level."""
+    result = get_all_route_shapes(zoom)
+    if result is None:
+        raise HTTPException(status_code=503, detail="Transit timetable is still loading")
+    return encoded_response(request, result, f"route_shapes_{result['zoom']}", SHAPE_MAX_AGE)
+
+@router.get("/routes/{route_id}/shape")
+def get_transit_route_shape(
+    request: Request,
+    route_id: str = Path(..., description="Route id (GTFS or OneBusAway form)"),
+    zoom: int = Query(12, ge=0, le=22, description="Map zoom level the geometry is drawn at")
+):
+    """One route's geometry as encoded polylines, simplified for a zoom level."""
+    result = get_route_shape(route_id, zoom)
+    if result is None:
+        raise HTTPException(status_code=503, detail="Transit timetable is still loading")
+    if "error" in result:
+        raise HTTPException(status_code=404, detail=result["error"])
+    return encoded_response(request, result, max_age=SHAPE_MAX_AGE)
+
+@router.get("/tiles/{z}/{x}/{y}.mvt")
+def get_transit_map_tile(
+    request: Request,
+    z: int = Path(..., description="Zoom level"),
+    x: int = Path(..., description="Tile column"),
+    y: int = Path(..., description="Tile row")
+):
+    """Mapbox Vector Tile with the "routes" (zoom 8+) and "stops" (zoom 13+) layers."""
+    if not valid_tile(z, x, y):
+        raise HTTPException(status_code=400, detail="Tile coordinates out of range")
+    tile = get_transit_tile(z, x, y)
+    if tile is None:
+        raise HTTPException(status_code=503, detail="Transit timetable is still loading")
+    return encoded_response(request, tile, f"transit_tile_{z}_{x}_{y}", TRANSIT_TILE_MAX_AGE, body_format="mvt")
+
+@router.get("/predict")
+def predict_transit_arrival(
+    route_id: str = Query(..., description="Route id (GTFS or OneBusAway form)"),
+    stop_id: str = Query(..., description="Stop id (GTFS or OneBusAway form)"),
+    scheduled_at: Optional[datetime] = Query(None, description="Scheduled arrival time (defaults to now)")
+):
+    """Predict when a scheduled arrival will actually happen, with confidence intervals."""
+    return predict_arrival(route_id, stop_id, agency_timestamp(scheduled_at) or time.time())
+
+@router.get("/reliability")
+def get_route_reliability(
+    route_id: str = Query(..., description="Route id (GTFS or OneBusAway form)"),
+    stop_id: Optional[str] = Query(None, description="Only this stop"),
+    hour: Optional[int] = Query(None, ge=0, le=23, description="Only this hour of the day"),
+    days: int = Query(1, ge=1, le=14, description="Days of history to include, ending today")
+):
+    """On-time percentage, headway variance and typical delay per stop and hour for a route."""
+    try:
+        return get_reliability(route_id, stop_id, hour, days)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,27 +1,21 @@
 from fastapi import APIRouter, HTTPException, Depends, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
-import jwt as pyjwt  # Import PyJWT with a more descriptive alias
-from pydantic import BaseModel
-import sys
-import os
-
-# Add the project root to the Python path to enable absolute imports
-sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from typing import List, Optional
+from pydantic import BaseModel, Field
+import threading
+import time
+
 from config import settings
+from utils.lazy import lazy_import
+from ..services import user_store
+from ..services.search_service import invalidate_places
 
-router = APIRouter(prefix="/users", tags=["users"])
+# PyJWT, imported on first token operation
+pyjwt = lazy_import("jwt")
 
-# Simplified user data store
-users_db = {
-    "testuser": {
-        "username": "testuser",
-        "email": "test@example.com",
-        "hashed_password": "testpassword123",  # In a real app, this would be hashed
-        "disabled": False,
-    }
-}
+router = APIRouter(prefix="/users", tags=["users"])
 
 class Token(BaseModel):
     access_token: str
@@ -33,22 +27,53 @@ class User(BaseModel):
     disabled: Optional[bool] = None
 
 class UserInDB(User):
+    id: int
     hashed_password: str
 
+class SavedPlace(BaseModel):
+    name: str
+    lat: float = Field(..., ge=-90, le=90)
+    lon: float = Field(..., ge=-180, le=180)
+    address: Optional[str] = None
+    category: Optional[str] = None
+
+class SavedPlaceInDB(SavedPlace):
+    id: int
+
+class CommuteProfile(BaseModel):
+    name: str
+    origin_lat: float = Field(..., ge=-90, le=90)
+    origin_lon: float = Field(..., ge=-180, le=180)
+    destination_lat: float = Field(..., ge=-90, le=90)
+    destination_lon: float = Field(..., ge=-180, le=180)
+    window_start: str = Field(..., pattern=r"^\d{2}:\d{2}$", description="Local time, HH:MM")
+    window_end: str = Field(..., pattern=r"^\d{2}:\d{2}$", description="Local time, HH:MM")
+    days: str = Field("12345", pattern=r"^[1-7]{1,7}$", description="ISO weekdays, 1 = Monday")
+    mode: str = "car"
+
+class CommuteProfileInDB(CommuteProfile):
+    id: int
+
 # Authentication settings
 SECRET_KEY = settings.SECRET_KEY
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/users/token")
+# Same token, but anonymous requests are let through
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/users/token", auto_error=False)
+
+# Verified token -> (user, token expiry), least recently used first
+_token_cache = OrderedDict()
+_token_cache_lock = threading.Lock()
 
-def get_user(db, username: str):
-    if username in db:
-        user_dict = db[username]
+def get_user(username: str):
+    user_dict = user_store.get_user(username)
+    if user_dict:
         return UserInDB(**user_dict)
 
-def authenticate_user(db, username: str, password: str):
-    user = get_user(db, username)
+def authenticate_user(username: str, password: str):
+    user = get_user(username)
     if not user:
         return False
     # In a real app, you would verify the hashed password here
@@ -63,9 +88,67 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = pyjwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def _cached_token_user(token: str):
+    """Return the user for a previously verified, unexpired token, or None."""
+    with _token_cache_lock:
+        entry = _token_cache.get(token)
+        if entry is None:
+            return None
+        user, expires_at = entry
+        if expires_at <= time.time():
+            del _token_cache[token]
+            return None
+        _token_cache.move_to_end(token)
+        return user
+
+def _cache_token_user(token: str, user: UserInDB, expires_at: float):
+    with _token_cache_lock:
+        _token_cache[token] = (user, expires_at)
+        _token_cache.move_to_end(token)
+        while len(_token_cache) > settings.TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+
+def get_current_user(token: str = Depends(oauth2_scheme)):
+    """
+    Resolve the bearer token to a user.
+
+    Verified tokens are kept in a small LRU until they expire, so repeat
+    requests skip the JWT decode and the database lookup.
+    """
+    user = _cached_token_user(token)
+    if user is not None:
+        return user
+
+    try:
+        payload = pyjwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        username = payload.get("sub")
+        if username is None:
+            raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+    except pyjwt.PyJWTError:
+        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+
+    user = get_user(username)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    _cache_token_user(token, user, payload["exp"])
+    return user
+
+def get_optional_user(token: Optional[str] = Depends(optional_oauth2_scheme)):
+    """The signed-in user, or None for anonymous requests."""
+    if not token:
+        return None
+    return get_current_user(token)
+
+def get_admin_user(current_user: UserInDB = Depends(get_current_user)):
+    """The signed-in user, if listed in ADMIN_USERS."""
+    if current_user.username not in settings.ADMIN_USERS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return current_user
+
 @router.post("/token", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = authenticate_user(users_db, form_data.username, form_data.password)
+def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
+    user = authenticate_user(form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -79,17 +162,41 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/me", response_model=User)
-async def read_users_me(token: str = Depends(oauth2_scheme)):
-    try:
-        payload = pyjwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-    except pyjwt.PyJWTError:
-        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-    
-    user = get_user(users_db, username)
-    if user is None:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    return user
+def read_users_me(current_user: UserInDB = Depends(get_current_user)):
+    return current_user
+
+@router.get("/me/places", response_model=List[SavedPlaceInDB])
+def read_saved_places(current_user: UserInDB = Depends(get_current_user)):
+    return user_store.list_saved_places(current_user.id)
+
+@router.post("/me/places", response_model=SavedPlaceInDB, status_code=status.HTTP_201_CREATED)
+def create_saved_place(place: SavedPlace, current_user: UserInDB = Depends(get_current_user)):
+    place_id = user_store.add_saved_place(
+        current_user.id, place.name, place.lat, place.lon, place.address, place.category
+    )
+    invalidate_places(current_user.id)
+    return {**place.model_dump(), "id": place_id}
+
+@router.delete("/me/places/{place_id}", status_code=status.HTTP_204_NO_CONTENT)
+def remove_saved_place(place_id: int, current_user: UserInDB = Depends(get_current_user)):
+    if not user_store.delete_saved_place(current_user.id, place_id):
+        raise HTTPException(status_code=404, detail="Saved place not found")
+    invalidate_places(current_user.id)
+
+@router.get("/me/commutes", response_model=List[CommuteProfileInDB])
+def read_commute_profiles(current_user: UserInDB = Depends(get_current_user)):
+    return user_store.list_commute_profiles(current_user.id)
+
+@router.post("/me/commutes", response_model=CommuteProfileInDB, status_code=status.HTTP_201_CREATED)
+def create_commute_profile(profile: CommuteProfile, current_user: UserInDB = Depends(get_current_user)):
+    profile_id = user_store.add_commute_profile(
+        current_user.id, profile.name,
+        profile.origin_lat, profile.origin_lon, profile.destination_lat, profile.destination_lon,
+        profile.window_start, profile.window_end, profile.days, profile.mode
+    )
+    return {**profile.model_dump(), "id": profile_id}
+
+@router.delete("/me/commutes/{profile_id}", status_code=status.HTTP_204_NO_CONTENT)
+def remove_commute_profile(profile_id: int, current_user: UserInDB = Depends(get_current_user)):
+    if not user_store.delete_commute_profile(current_user.id, profile_id):
+        raise HTTPException(status_code=404, detail="Commute profile not found")
@@ -1,18 +1,37 @@
-from fastapi import APIRouter, HTTPException, Query
-from ..services.weather_service import get_weather_data
+from fastapi import APIRouter, HTTPException, Query, Request
+from datetime import datetime
+from typing import Optional
+from ..services.weather_service import (
+    get_weather_data, weather_cache_key, forecast_hour, cache, cache_expiry, WEATHER_CACHE_TTL, WEATHER_COORD_DECIMALS
+)
+from ..services.gtfs_service import agency_timestamp
+from ..responses import encoded_response, canonical_coordinates, cache_max_age
 
 router = APIRouter(prefix="/weather", tags=["weather"])
 
+def is_cached_request(params):
+    """Admission-control probe: will this request be served from the weather cache?"""
+    lat, lon = canonical_coordinates(float(params["lat"]), float(params["lon"]), WEATHER_COORD_DECIMALS)
+    hour = forecast_hour(agency_timestamp(params["at"])) if "at" in params else None
+    cache_key = weather_cache_key(lat, lon, hour)
+    return cache_key in cache and cache_expiry.get(cache_key, datetime.min) > datetime.now()
+
+# Plain def so a slow upstream blocks a threadpool worker, not the event loop
 @router.get("/")
-async def get_weather(
+def get_weather(
+    request: Request,
     lat: float = Query(..., description="Latitude"),
-    lon: float = Query(..., description="Longitude")
+    lon: float = Query(..., description="Longitude"),
+    at: Optional[datetime] = Query(None, description="Departure time for forecast conditions, local time unless it has an offset (defaults to now)")
 ):
-    """Get weather data for a specific location."""
+    """Get weather data for a specific location, now or at a departure time."""
     try:
-        result = get_weather_data(lat, lon)
+        lat, lon = canonical_coordinates(lat, lon, WEATHER_COORD_DECIMALS)
+        at = agency_timestamp(at)
+        result = get_weather_data(lat, lon, at)
         if "error" in result:
             raise HTTPException(status_code=500, detail=result["error"])
-        return result
+        cache_key = weather_cache_key(lat, lon, forecast_hour(at))
+        return encoded_response(request, result, cache_key, cache_max_age(cache_expiry, cache_key, WEATHER_CACHE_TTL))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
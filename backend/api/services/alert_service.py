@@ -0,0 +1,351 @@
+from datetime import datetime
+import threading
+import time
+
+from config import settings
+from utils.lazy import lazy_import
+from .weather_service import get_weather_data
+from .traffic_service import get_traffic_data
+from .gtfs_service import get_gtfs_dataset, get_scheduled_arrivals, agency_timezone, agency_isoformat
+from .trip_planner_service import MAX_ACCESS_WALK
+from .recommendation_service import score_commutes
+from . import user_store
+
+np = lazy_import("numpy")
+
+# Commute profile modes each alert type applies to
+ROAD_MODES = ("car", "drive", "rideshare")
+EXPOSED_MODES = ("bike", "walk")
+TRANSIT_MODES = ("transit", "bus")
+
+# Upstream data is fetched per coarse cell, shared by every commute touching it.
+# A 0.1 degree cell is about 11 x 7.5 km in Seattle; the traffic radius covers
+# the whole cell from its center.
+WEATHER_CELL_DECIMALS = 1
+TRAFFIC_CELL_DEGREES = 0.1
+TRAFFIC_CELL_RADIUS = 7000  # meters
+# Incidents this close to the straight origin-destination line count against a commute
+CORRIDOR_METERS = 500
+# Transit origins are grouped to ~100 m before looking up their nearest stop
+TRANSIT_CELL_DECIMALS = 3
+# Commutes are scored in chunks to bound the (commutes x incidents) matrices
+CORRIDOR_CHUNK = 2048
+
+EARTH_RADIUS = 6371000
+
+_alerts = {}  # user_id -> list of alerts from the last cycle
+_last_cycle = {}
+_evaluator_thread = None
+_evaluator_stop = threading.Event()
+
+
+def _minutes(hhmm):
+    hours, minutes = hhmm.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def active_profiles(profiles, now=None):
+    """
+    Select the profiles whose commute window is under way or starts within
+    ALERT_LOOKAHEAD_MINUTES, on one of their days.
+    """
+    local = datetime.fromtimestamp(now or time.time(), agency_timezone())
+    weekday = str(local.isoweekday())
+    now_minutes = local.hour * 60 + local.minute
+
+    candidates = [p for p in profiles if weekday in p["days"]]
+    if not candidates:
+        return []
+    start = np.array([_minutes(p["window_start"]) for p in candidates])
+    end = np.array([_minutes(p["window_end"]) for p in candidates])
+    # Modular arithmetic so windows crossing midnight work too
+    until_start = (start - now_minutes) % 1440
+    into_window = (now_minutes - start) % 1440
+    active = (until_start <= settings.ALERT_LOOKAHEAD_MINUTES) | (into_window <= (end - start) % 1440)
+    return [candidates[i] for i in np.nonzero(active)[0].tolist()]
+
+
+def _traffic_cells(origin_lat, origin_lon, destination_lat, destination_lon):
+    """Coarse traffic cells touched by each commute's origin, midpoint and destination."""
+    cells = set()
+    for lats, lons in (
+        (origin_lat, origin_lon),
+        ((origin_lat + destination_lat) / 2, (origin_lon + destination_lon) / 2),
+        (destination_lat, destination_lon),
+    ):
+        keys = np.stack([np.floor(lats / TRAFFIC_CELL_DEGREES), np.floor(lons / TRAFFIC_CELL_DEGREES)], axis=1)
+        cells.update(map(tuple, np.unique(keys, axis=0).astype(np.int64).tolist()))
+    return cells
+
+
+def build_incident_index(cells):
+    """
+    Fetch traffic once per cell and merge the incidents into flat arrays.
+
+    Returns:
+        tuple: (lat, lon, delay seconds, magnitude) arrays
+    """
+    incidents = {}
+    for i, j in cells:
+        center_lat = round((i + 0.5) * TRAFFIC_CELL_DEGREES, 4)
+        center_lon = round((j + 0.5) * TRAFFIC_CELL_DEGREES, 4)
+        traffic = get_traffic_data(center_lat, center_lon, TRAFFIC_CELL_RADIUS)
+        for incident in traffic.get("incidents", []):
+            # Neighbouring cells overlap, so the same incident can come back twice
+            incidents[incident.id] = incident
+    values = list(incidents.values())
+    return (
+        np.array([v.lat for v in values], dtype=np.float64),
+        np.array([v.lon for v in values], dtype=np.float64),
+        np.array([v.delay for v in values], dtype=np.float64),
+        np.array([v.magnitude for v in values], dtype=np.float64),
+    )
+
+
+def corridor_incidents(origin_lat, origin_lon, destination_lat, destination_lon, incident_index):
+    """
+    Join commutes against the incident index.
+
+    For every commute, incidents within CORRIDOR_METERS of the straight
+    line from origin to destination are summed, with positions projected
+    to local meters around the origin.
+
+    Returns:
+        tuple: (total delay seconds, incident count, max magnitude) per commute
+    """
+    inc_lat, inc_lon, inc_delay, inc_severity = incident_index
+    n = len(origin_lat)
+    total_delay = np.zeros(n)
+    count = np.zeros(n, dtype=np.int64)
+    severity = np.zeros(n)
+    if len(inc_lat) == 0 or n == 0:
+        return total_delay, count, severity
+
+    scale = np.pi / 180 * EARTH_RADIUS
+    for lo in range(0, n, CORRIDOR_CHUNK):
+        hi = min(n, lo + CORRIDOR_CHUNK)
+        olat, olon = origin_lat[lo:hi, None], origin_lon[lo:hi, None]
+        cos_lat = np.cos(np.radians(olat))
+        # Segment vector and incident positions, in meters from the origin
+        dx = (destination_lon[lo:hi, None] - olon) * cos_lat * scale
+        dy = (destination_lat[lo:hi, None] - olat) * scale
+        px = (inc_lon[None, :] - olon) * cos_lat * scale
+        py = (inc_lat[None, :] - olat) * scale
+        length2 = np.maximum(dx * dx + dy * dy, 1.0)
+        t = np.clip((px * dx + py * dy) / length2, 0.0, 1.0)
+        ex, ey = px - t * dx, py - t * dy
+        near = ex * ex + ey * ey <= CORRIDOR_METERS * CORRIDOR_METERS
+
+        total_delay[lo:hi] = near @ inc_delay
+        count[lo:hi] = near.sum(axis=1)
+        severity[lo:hi] = np.max(np.where(near, inc_severity[None, :], 0), axis=1)
+    return total_delay, count, severity
+
+
+def _origin_stop_delays(origin_lat, origin_lon):
+    """
+    Worst realtime delay (seconds) among upcoming departures at the stop
+    nearest each origin, looked up once per stop. NaN without data.
+
+    Returns:
+        tuple: (delay per origin, number of stops looked up)
+    """
+    ds = get_gtfs_dataset()
+    if ds is None:
+        return np.full(len(origin_lat), np.nan), 0
+
+    cells = np.stack([np.round(origin_lat, TRANSIT_CELL_DECIMALS), np.round(origin_lon, TRANSIT_CELL_DECIMALS)], axis=1)
+    cells, inverse = np.unique(cells, axis=0, return_inverse=True)
+    stop_delay = {}
+    cell_delay = np.full(len(cells), np.nan)
+    for i, (lat, lon) in enumerate(cells.tolist()):
+        stops, _ = ds.nearby_stops(lat, lon, MAX_ACCESS_WALK)
+        if len(stops) == 0:
+            continue
+        stop_idx = int(stops[0])
+        if stop_idx not in stop_delay:
+            arrivals = get_scheduled_arrivals(ds.stop_ids[stop_idx], minutes_before=0, minutes_after=30) or []
+            known = [a["delay"] for a in arrivals if a.get("delay") is not None]
+            stop_delay[stop_idx] = max(known) if known else np.nan
+        cell_delay[i] = stop_delay[stop_idx]
+    return cell_delay[inverse], len(stop_delay)
+
+
+def _origin_weather(lats, lons):
+    """
+    Weather description per commute origin, fetched once per coarse cell.
+
+    Returns:
+        tuple: (description per origin, number of cells fetched)
+    """
+    cells = np.stack([np.round(lats, WEATHER_CELL_DECIMALS), np.round(lons, WEATHER_CELL_DECIMALS)], axis=1)
+    cells, inverse = np.unique(cells, axis=0, return_inverse=True)
+    descriptions = []
+    for lat, lon in cells.tolist():
+        weather = get_weather_data(lat, lon)
+        descriptions.append((weather.get("description") or "").lower() if "error" not in weather else "")
+    return [descriptions[i] for i in inverse.tolist()], len(cells)
+
+
+def evaluate_alerts(profiles=None, now=None):
+    """
+    Evaluate every active commute profile in one batch.
+
+    Upstream data is fetched once per shared cell (traffic, weather) or
+    stop (transit) and joined against all commutes with array operations.
+
+    Args:
+        profiles (list, optional): Commute profiles. Defaults to every stored profile.
+        now (float, optional): Reference unix time. Defaults to current time.
+
+    Returns:
+        tuple: (user_id -> list of alerts, cycle stats)
+    """
+    now = now or time.time()
+    if profiles is None:
+        profiles = user_store.list_all_commute_profiles()
+    active = active_profiles(profiles, now)
+    stats = {"profiles": len(profiles), "active": len(active), "traffic_cells": 0, "weather_cells": 0, "transit_stops": 0}
+    alerts = {}
+    if not active:
+        return alerts, stats
+
+    origin_lat = np.array([p["origin_lat"] for p in active])
+    origin_lon = np.array([p["origin_lon"] for p in active])
+    destination_lat = np.array([p["destination_lat"] for p in active])
+    destination_lon = np.array([p["destination_lon"] for p in active])
+    modes = np.array([p["mode"] for p in active])
+
+    road = np.isin(modes, ROAD_MODES)
+    total_delay = np.zeros(len(active))
+    incident_count = np.zeros(len(active), dtype=np.int64)
+    magnitude = np.zeros(len(active))
+    if road.any():
+        cells = _traffic_cells(origin_lat[road], origin_lon[road], destination_lat[road], destination_lon[road])
+        incident_index = build_incident_index(cells)
+        total_delay[road], incident_count[road], magnitude[road] = corridor_incidents(
+            origin_lat[road], origin_lon[road], destination_lat[road], destination_lon[road], incident_index
+        )
+        stats["traffic_cells"] = len(cells)
+
+    weather, stats["weather_cells"] = _origin_weather(origin_lat, origin_lon)
+
+    transit = np.isin(modes, TRANSIT_MODES)
+    stop_delay = np.full(len(active), np.nan)
+    if transit.any():
+        stop_delay[transit], stats["transit_stops"] = _origin_stop_delays(origin_lat[transit], origin_lon[transit])
+
+    traffic_threshold = settings.ALERT_TRAFFIC_DELAY_MINUTES * 60
+    transit_threshold = settings.ALERT_TRANSIT_DELAY_MINUTES * 60
+    created_at = agency_isoformat(now)
+
+    flagged = []
+    for row, profile in enumerate(active):
+        profile_alerts = []
+        if road[row] and total_delay[row] >= traffic_threshold:
+            profile_alerts.append({
+                "type": "traffic",
+                "severity": int(magnitude[row]),
+                "message": f"{int(incident_count[row])} incident(s) on your route, about "
+                           f"{round(total_delay[row] / 60)} min of delay"
+            })
+        description = weather[row]
+        if "snow" in description or "ice" in description or (
+            modes[row] in EXPOSED_MODES and ("rain" in description or "storm" in description)
+        ):
+            profile_alerts.append({"type": "weather", "severity": 2, "message": f"Expect {description} on your commute"})
+        if transit[row] and not np.isnan(stop_delay[row]) and stop_delay[row] >= transit_threshold:
+            profile_alerts.append({
+                "type": "transit",
+                "severity": 2,
+                "message": f"Buses at your stop are running up to {round(stop_delay[row] / 60)} min late"
+            })
+        for alert in profile_alerts:
+            alert.update({"profile_id": profile["id"], "profile_name": profile["name"], "created_at": created_at})
+        if profile_alerts:
+            flagged.append(row)
+            alerts.setdefault(profile["user_id"], []).extend(profile_alerts)
+
+    # Suggest a better mode for the commutes that got an alert, in one scoring pass
+    suggestions = score_commutes([
+        {
+            "origin_lat": active[row]["origin_lat"],
+            "origin_lon": active[row]["origin_lon"],
+            "destination_lat": active[row]["destination_lat"],
+            "destination_lon": active[row]["destination_lon"],
+            "depart_at": now,
+            # Score with what this cycle saw, not what happens to be in the request caches
+            "traffic_delay_minutes": total_delay[row] / 60 if road[row] else float("nan"),
+            "weather": weather[row] or None
+        }
+        for row in flagged
+    ], now)
+    suggested = {active[row]["id"]: result["recommended_mode"] for row, result in zip(flagged, suggestions)}
+    for user_alerts in alerts.values():
+        for alert in user_alerts:
+            alert["suggested_mode"] = suggested.get(alert["profile_id"])
+
+    return alerts, stats
+
+
+def run_alert_cycle():
+    """Evaluate all subscriptions and swap in the new alerts."""
+    global _alerts, _last_cycle
+    start = time.perf_counter()
+    alerts, stats = evaluate_alerts()
+
+    # Keep first_seen across cycles so clients can tell new alerts from ongoing ones
+    previous = {
+        (alert["profile_id"], alert["type"]): alert["first_seen"]
+        for user_alerts in _alerts.values() for alert in user_alerts
+    }
+    for user_alerts in alerts.values():
+        for alert in user_alerts:
+            alert["first_seen"] = previous.get((alert["profile_id"], alert["type"]), alert["created_at"])
+
+    _alerts = alerts
+    stats["alerts"] = sum(len(user_alerts) for user_alerts in alerts.values())
+    stats["computed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    stats["completed_at"] = agency_isoformat(time.time())
+    _last_cycle = stats
+    return stats
+
+
+def get_user_alerts(user_id):
+    """Alerts for a user from the most recent cycle."""
+    return _alerts.get(user_id, [])
+
+
+def get_last_cycle():
+    """Stats from the most recent evaluation cycle."""
+    return _last_cycle
+
+
+def _evaluator_loop():
+    while not _evaluator_stop.is_set():
+        try:
+            stats = run_alert_cycle()
+            print(f"Commute alerts evaluated: {stats['active']} active profiles, "
+                  f"{stats['alerts']} alerts in {stats['computed_ms']} ms")
+        except Exception as e:
+            print(f"Error evaluating commute alerts: {e}")
+        _evaluator_stop.wait(settings.ALERT_INTERVAL_SECONDS)
+
+
+def start_alert_evaluator():
+    """Start the background alert evaluator thread if it isn't running."""
+    global _evaluator_thread
+
+    if not settings.ALERTS_ENABLED:
+        return
+    if _evaluator_thread is not None and _evaluator_thread.is_alive():
+        return
+
+    _evaluator_stop.clear()
+    _evaluator_thread = threading.Thread(target=_evaluator_loop, name="commute-alerts", daemon=True)
+    _evaluator_thread.start()
+
+
+def stop_alert_evaluator():
+    """Signal the background evaluator to stop."""
+    _evaluator_stop.set()
@@ -0,0 +1,242 @@
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+from datetime import datetime, timedelta
+from math import asin, cos, radians, sin, sqrt
+import time
+
+from utils.lazy import lazy_import
+from utils.polyline import decode_polyline
+from .routing_service import get_route, quantize, ROUTE_DEPARTURE_BUCKET
+from .trip_planner_service import plan_trip
+from .gtfs_service import agency_isoformat
+from .traffic_service import get_traffic_data, TRAFFIC_COORD_DECIMALS
+from .weather_service import get_weather_data, WEATHER_COORD_DECIMALS
+from .recommendation_service import weather_penalty, MODES
+from ..profiling import record_cache
+
+np = lazy_import("numpy")
+
+COMMUTE_CACHE_TTL = timedelta(minutes=5)
+COMMUTE_CACHE_SIZE = 2048
+
+# Compared modes -> TomTom travel mode (transit comes from the trip planner)
+COMPARED_MODES = {"drive": "car", "transit": None, "bike": "bicycle", "walk": "pedestrian"}
+
+# Incidents further than this from the driving route don't slow it down
+ROUTE_INCIDENT_METERS = 150
+# Traffic is fetched around the trip midpoint, in whole kilometres so nearby trips share it
+MAX_TRAFFIC_RADIUS = 15000
+EARTH_RADIUS = 6371000
+
+# Answers that aren't failures: a comparison missing these modes is still cached
+NO_RESULT_ERRORS = ("No route found", "No transit journey found")
+
+# Simple memory cache
+cache = {}
+cache_expiry = {}
+
+# Every upstream call for one comparison runs at once
+_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="commute-compare")
+
+
+def _submit(fn, *args):
+    """Run fn on the pool in a copy of the caller's context, so it reports to the request's trace."""
+    return _pool.submit(contextvars.copy_context().run, fn, *args)
+
+
+def commute_cache_key(from_lat, from_lon, to_lat, to_lon, depart_at):
+    """Build the cache key for a quantized comparison."""
+    bucket = int(depart_at // ROUTE_DEPARTURE_BUCKET)
+    return f"commute_{quantize(from_lat)}_{quantize(from_lon)}_{quantize(to_lat)}_{quantize(to_lon)}_{bucket}"
+
+
+def _distance(lat1, lon1, lat2, lon2):
+    """Great-circle distance in meters."""
+    dlat, dlon = radians(lat2 - lat1), radians(lon2 - lon1)
+    a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS * asin(sqrt(a))
+
+
+def _traffic_around(from_lat, from_lon, to_lat, to_lon):
+    """Traffic for a circle covering the trip, snapped so nearby trips share the cache entry."""
+    lat = round((from_lat + to_lat) / 2, TRAFFIC_COORD_DECIMALS)
+    lon = round((from_lon + to_lon) / 2, TRAFFIC_COORD_DECIMALS)
+    radius = _distance(from_lat, from_lon, to_lat, to_lon) / 2 + 1000
+    radius = int(min(MAX_TRAFFIC_RADIUS, 1000 * -(-radius // 1000)))
+    return get_traffic_data(lat, lon, radius)
+
+
+def route_incidents(polyline, incidents):
+    """
+    Incidents within ROUTE_INCIDENT_METERS of a route.
+
+    Distances are measured to every segment of the route at once, in meters
+    projected around the route start.
+
+    Returns:
+        list: The incidents on the route
+    """
+    points = decode_polyline(polyline) if polyline else []
+    if len(points) < 2 or not incidents:
+        return []
+    route = np.array(points)
+    scale = np.pi / 180 * EARTH_RADIUS
+    cos_lat = np.cos(np.radians(route[0, 0]))
+    x = (route[:, 1] - route[0, 1]) * cos_lat * scale
+    y = (route[:, 0] - route[0, 0]) * scale
+    px = (np.array([i.lon for i in incidents]) - route[0, 1]) * cos_lat * scale
+    py = (np.array([i.lat for i in incidents]) - route[0, 0]) * scale
+
+    # (incidents x segments) distance from each incident to each segment
+    sx, sy = x[:-1][None, :], y[:-1][None, :]
+    dx, dy = np.diff(x)[None, :], np.diff(y)[None, :]
+    rx, ry = px[:, None] - sx, py[:, None] - sy
+    t = np.clip((rx * dx + ry * dy) / np.maximum(dx * dx + dy * dy, 1e-9), 0.0, 1.0)
+    ex, ey = rx - t * dx, ry - t * dy
+    near = ((ex * ex + ey * ey).min(axis=1) <= ROUTE_INCIDENT_METERS ** 2).tolist()
+    return [incident for incident, on_route in zip(incidents, near) if on_route]
+
+
+def _route_option(mode, route):
+    if "error" in route:
+        return None, route["error"]
+    return {
+        "mode": mode,
+        "eta_minutes": round(route["eta_seconds"] / 60, 1),
+        "distance_meters": route["distance_meters"],
+        "polyline": route["polyline"],
+        "traffic_delay_seconds": route.get("traffic_delay_seconds", 0)
+    }, None
+
+
+def _transit_option(plan, depart_at):
+    if plan is None:
+        return None, "Transit timetable is still loading"
+    if not plan["journeys"]:
+        return None, "No transit journey found"
+    # Earliest arrival, counting the wait for the first departure
+    journey = min(plan["journeys"], key=lambda j: (datetime.fromisoformat(j["arrival_time"]), j["transfers"]))
+    arrival = datetime.fromisoformat(journey["arrival_time"]).timestamp()
+    return {
+        "mode": "transit",
+        "eta_minutes": round((arrival - depart_at) / 60, 1),
+        "departure_time": journey["departure_time"],
+        "arrival_time": journey["arrival_time"],
+        "transfers": journey["transfers"],
+        "legs": journey["legs"]
+    }, None
+
+
+def compare_commute(from_lat, from_lon, to_lat, to_lon, depart_at=None):
+    """
+    Compare driving, transit, cycling and walking for one trip.
+
+    Every mode's route, plus traffic and weather for the trip, is fetched
+    concurrently. Driving time is stretched by incidents on the route that
+    TomTom's own traffic delay doesn't already cover, and every mode gets
+    the recommendation scorer's weather penalty. Results are cached per
+    quantized origin/destination and 15-minute departure bucket.
+
+    Args:
+        from_lat (float): Origin latitude
+        from_lon (float): Origin longitude
+        to_lat (float): Destination latitude
+        to_lon (float): Destination longitude
+        depart_at (float, optional): Departure as unix time. Defaults to now.
+
+    Returns:
+        dict: Options ranked by adjusted minutes, plus modes that failed
+    """
+    depart_at = depart_at or time.time()
+    cache_key = commute_cache_key(from_lat, from_lon, to_lat, to_lon, depart_at)
+
+    # Check cache
+    if cache_key in cache and cache_expiry.get(cache_key, datetime.min) > datetime.now():
+        record_cache("commute", "hit")
+        return {**cache[cache_key], "cached": True}
+    record_cache("commute", "miss")
+
+    from_lat, from_lon, to_lat, to_lon = quantize(from_lat), quantize(from_lon), quantize(to_lat), quantize(to_lon)
+    futures = {
+        mode: _submit(get_route, from_lat, from_lon, to_lat, to_lon, travel_mode, depart_at)
+        for mode, travel_mode in COMPARED_MODES.items() if travel_mode
+    }
+    futures["transit"] = _submit(plan_trip, from_lat, from_lon, to_lat, to_lon, depart_at)
+    traffic_future = _submit(_traffic_around, from_lat, from_lon, to_lat, to_lon)
+    weather_future = _submit(
+        get_weather_data, round(from_lat, WEATHER_COORD_DECIMALS), round(from_lon, WEATHER_COORD_DECIMALS), depart_at
+    )
+
+    options = []
+    unavailable = []
+    for mode in COMPARED_MODES:
+        try:
+            result = futures[mode].result(timeout=20)
+            if mode == "transit":
+                option, error = _transit_option(result, depart_at)
+            else:
+                option, error = _route_option(mode, result)
+        except Exception as e:
+            option, error = None, str(e)
+        if option is None:
+            unavailable.append({"mode": mode, "error": error})
+        else:
+            options.append(option)
+
+    try:
+        traffic = traffic_future.result(timeout=20)
+    except Exception as e:
+        traffic = {"error": str(e)}
+    try:
+        weather = weather_future.result(timeout=20)
+    except Exception as e:
+        weather = {"error": str(e)}
+
+    penalties = np.zeros(len(MODES))
+    if "error" not in weather:
+        penalties = weather_penalty(weather.get("description", "").lower(), weather.get("temperature"))
+
+    incidents_on_route = []
+    for option in options:
+        incident_minutes = 0.0
+        if option["mode"] == "drive" and "error" not in traffic:
+            incidents_on_route = route_incidents(option["polyline"], traffic.get("incidents", []))
+            # TomTom's ETA already includes the delays it knows about; only add what's beyond them
+            reported = sum(incident.delay for incident in incidents_on_route)
+            incident_minutes = max(0.0, reported - option.pop("traffic_delay_seconds")) / 60
+        option.pop("traffic_delay_seconds", None)
+        option["incident_delay_minutes"] = round(incident_minutes, 1)
+        option["weather_penalty_minutes"] = float(penalties[MODES.index(option["mode"])])
+        option["adjusted_minutes"] = round(
+            option["eta_minutes"] + option["incident_delay_minutes"] + option["weather_penalty_minutes"], 1
+        )
+    options.sort(key=lambda o: o["adjusted_minutes"])
+    for rank, option in enumerate(options, 1):
+        option["rank"] = rank
+
+    comparison = {
+        "origin": {"lat": from_lat, "lon": from_lon},
+        "destination": {"lat": to_lat, "lon": to_lon},
+        "depart_at": agency_isoformat(depart_at),
+        "best_mode": options[0]["mode"] if options else None,
+        "options": options,
+        "unavailable": unavailable,
+        "weather": None if "error" in weather else {
+            "description": weather.get("description"),
+            "temperature": weather.get("temperature")
+        },
+        "incidents_on_route": [incident.to_dict() for incident in incidents_on_route],
+        "timestamp": datetime.now().isoformat()
+    }
+
+    # Don't cache answers with a failed upstream, so it's retried next time
+    failed = [u for u in unavailable if u["error"] not in NO_RESULT_ERRORS]
+    if not failed and "error" not in traffic and "error" not in weather:
+        # Evict the entries closest to expiry once the cache is full
+        if len(cache) >= COMMUTE_CACHE_SIZE:
+            for old_key in sorted(cache_expiry, key=cache_expiry.get)[:COMMUTE_CACHE_SIZE // 4]:
+                cache.pop(old_key, None)
+                cache_expiry.pop(old_key, None)
+        cache[cache_key] = comparison
+        cache_expiry[cache_key] = datetime.now() + COMMUTE_CACHE_TTL
+    return {**comparison, "cached": False}
@@ -0,0 +1,284 @@
+from datetime import datetime
+from zoneinfo import ZoneInfo
+import threading
+import time
+import os
+
+from config import settings
+from utils.lazy import lazy_import
+from .timeseries_service import record
+
+np = lazy_import("numpy")
+
+LOCAL_TIMEZONE = ZoneInfo("America/Los_Angeles")
+
+# Deviation histogram bins: 30 s wide from 10 min early to 30 min late,
+# plus one underflow and one overflow bin at the ends
+BIN_SECONDS = 30
+MIN_DEVIATION = -600
+MAX_DEVIATION = 1800
+BIN_COUNT = (MAX_DEVIATION - MIN_DEVIATION) // BIN_SECONDS + 2
+
+# Quantiles precomputed for every histogram, in this column order
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+# Hour of day, split by weekday/weekend: 48 time-of-day buckets
+BUCKETS_PER_DAY_TYPE = 24
+
+# Stop-level histograms need this many samples before predictions use them
+# instead of the route-level histogram for the same bucket
+MIN_STOP_SAMPLES = 20
+# Halve a histogram once it holds this many samples, so old behaviour fades out
+MAX_HISTOGRAM_SAMPLES = 5000
+
+# Only record predictions this close to the arrival; earlier ones are still moving
+RECORD_HORIZON_SECONDS = 120
+SEEN_TTL_SECONDS = 3600
+
+
+class DelayHistograms:
+    """
+    Arrival deviation histograms keyed by (route, stop, time-of-day bucket).
+
+    Counts live in one growable (histograms x bins) int32 array and each
+    histogram's quantiles are recomputed whenever it changes, so lookups are
+    a dict hit and a row read. Route-level histograms use stop "".
+    """
+
+    def __init__(self):
+        self.index = {}  # (route_id, stop_id, bucket) -> row
+        self.counts = np.zeros((0, BIN_COUNT), dtype=np.int32)
+        self.quantiles = np.zeros((0, len(QUANTILES) + 1), dtype=np.float32)  # quantiles + mean
+        self.totals = np.zeros(0, dtype=np.int64)
+
+    def _row(self, key):
+        row = self.index.get(key)
+        if row is None:
+            row = len(self.index)
+            if row >= len(self.counts):
+                capacity = max(1024, 2 * len(self.counts))
+                self.counts = np.resize(self.counts, (capacity, BIN_COUNT))
+                self.counts[row:] = 0
+                self.quantiles = np.resize(self.quantiles, (capacity, len(QUANTILES) + 1))
+                self.totals = np.resize(self.totals, capacity)
+                self.totals[row:] = 0
+            self.index[key] = row
+        return row
+
+    def add(self, key, deviation):
+        """Count one deviation (seconds) without refreshing quantiles."""
+        row = self._row(key)
+        bin_idx = 0 if deviation < MIN_DEVIATION else min(
+            BIN_COUNT - 1, 1 + int((deviation - MIN_DEVIATION) // BIN_SECONDS)
+        )
+        self.counts[row, bin_idx] += 1
+        self.totals[row] += 1
+        if self.totals[row] >= MAX_HISTOGRAM_SAMPLES:
+            self.counts[row] //= 2
+            self.totals[row] = int(self.counts[row].sum())
+        return row
+
+    def refresh(self, rows):
+        """Recompute quantiles and means for the given histogram rows."""
+        rows = np.fromiter(rows, dtype=np.int64)
+        if len(rows) == 0:
+            return
+        counts = self.counts[rows].astype(np.float64)
+        totals = counts.sum(axis=1)
+        cumulative = np.cumsum(counts, axis=1)
+
+        # Bin i (1..BIN_COUNT-2) covers [MIN + (i-1) * BIN, MIN + i * BIN); the
+        # under/overflow bins are pinned to the range ends
+        lower_edges = np.concatenate((
+            [MIN_DEVIATION], MIN_DEVIATION + BIN_SECONDS * np.arange(BIN_COUNT - 2), [MAX_DEVIATION]
+        ))
+        widths = np.concatenate(([0], np.full(BIN_COUNT - 2, BIN_SECONDS), [0]))
+        centers = lower_edges + widths / 2
+
+        for column, q in enumerate(QUANTILES):
+            target = q * totals
+            bins = np.argmax(cumulative >= target[:, None], axis=1)
+            below = np.take_along_axis(cumulative, bins[:, None], axis=1)[:, 0] - counts[np.arange(len(rows)), bins]
+            inside = counts[np.arange(len(rows)), bins]
+            fraction = np.divide(target - below, inside, out=np.zeros_like(target), where=inside > 0)
+            self.quantiles[rows, column] = lower_edges[bins] + fraction * widths[bins]
+        self.quantiles[rows, -1] = np.divide(
+            counts @ centers, totals, out=np.zeros_like(totals), where=totals > 0
+        )
+
+    def lookup(self, key):
+        """Return (quantiles row, sample count) for a histogram, or (None, 0)."""
+        row = self.index.get(key)
+        if row is None:
+            return None, 0
+        return self.quantiles[row], int(self.totals[row])
+
+
+_histograms = None
+_histograms_lock = threading.Lock()
+# (trip_id, stop_id, scheduled_ts) -> time recorded, so each arrival counts once
+_seen = {}
+
+
+def time_bucket(ts):
+    """Time-of-day bucket for a unix time: hour of day, offset by 24 on weekends."""
+    local = datetime.fromtimestamp(ts, LOCAL_TIMEZONE)
+    return local.hour + (BUCKETS_PER_DAY_TYPE if local.weekday() >= 5 else 0)
+
+
+def local_id(feed_id):
+    """Strip the OneBusAway agency prefix ('1_100228' -> '100228') from a route, stop or trip id."""
+    agency, sep, rest = feed_id.partition("_")
+    return rest if sep and agency.isdigit() else feed_id
+
+
+def histogram_path():
+    return settings.DELAY_HISTOGRAM_PATH or os.path.join(settings.GTFS_DATA_DIR, "delay_histograms.npz")
+
+
+def get_histograms():
+    """Return the delay histograms, loading the last saved snapshot on first use."""
+    global _histograms
+    if _histograms is None:
+        with _histograms_lock:
+            if _histograms is None:
+                histograms = DelayHistograms()
+                path = histogram_path()
+                if os.path.exists(path):
+                    try:
+                        histograms = load_histograms(path)
+                    except Exception as e:
+                        print(f"Error loading delay histograms: {e}")
+                _histograms = histograms
+    return _histograms
+
+
+def load_histograms(path):
+    """Load histograms saved by save_histograms()."""
+    data = np.load(path, allow_pickle=False)
+    histograms = DelayHistograms()
+    for key, counts in zip(data["keys"].tolist(), data["counts"]):
+        route_id, stop_id, bucket = key.split("|")
+        row = histograms._row((route_id, stop_id, int(bucket)))
+        histograms.counts[row] = counts
+        histograms.totals[row] = int(counts.sum())
+    histograms.refresh(range(len(histograms.index)))
+    return histograms
+
+
+def save_histograms(path=None):
+    """Write the histograms to a compressed .npz snapshot."""
+    path = path or histogram_path()
+    with _histograms_lock:
+        histograms = _histograms
+        if histograms is None or not histograms.index:
+            return
+        keys = sorted(histograms.index, key=histograms.index.get)
+        counts = histograms.counts[:len(keys)].copy()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp.npz"
+    np.savez_compressed(tmp_path, keys=np.array([f"{r}|{s}|{b}" for r, s, b in keys]), counts=counts)
+    os.replace(tmp_path, path)
+
+
+def record_deviations(observations, now=None):
+    """
+    Record arrival deviations, once per trip and stop.
+
+    Predictions are only counted when the arrival is at most
+    RECORD_HORIZON_SECONDS away (or just passed), when they're close to the
+    final deviation.
+
+    Args:
+        observations: Iterable of (route_id, stop_id, trip_id, scheduled_ts, delay_seconds)
+        now (float, optional): Reference unix time. Defaults to current time.
+
+    Returns:
+        int: Number of deviations recorded
+    """
+    now = now or time.time()
+    histograms = get_histograms()
+    touched = set()
+    history = []
+    with _histograms_lock:
+        for route_id, stop_id, trip_id, scheduled_ts, delay in observations:
+            predicted_ts = scheduled_ts + delay
+            if not now - RECORD_HORIZON_SECONDS <= predicted_ts <= now + RECORD_HORIZON_SECONDS:
+                continue
+            # OneBusAway and GTFS-Realtime report the same arrival under differently prefixed ids
+            route_id, stop_id, trip_id = local_id(route_id), local_id(stop_id), local_id(trip_id)
+            seen_key = (trip_id, stop_id, int(scheduled_ts))
+            if seen_key in _seen:
+                continue
+            _seen[seen_key] = now
+
+            bucket = time_bucket(scheduled_ts)
+            touched.add(histograms.add((route_id, stop_id, bucket), delay))
+            touched.add(histograms.add((route_id, "", bucket), delay))
+            history.append((now, scheduled_ts, delay, route_id, stop_id, trip_id))
+
+        if touched:
+            histograms.refresh(touched)
+        if len(_seen) > 50000:
+            for key in [k for k, seen_at in _seen.items() if seen_at < now - SEEN_TTL_SECONDS]:
+                del _seen[key]
+    record("arrivals", history)
+    return len(history)
+
+
+def record_realtime_index(index, now=None):
+    """Record deviations for arrivals in a GTFS-Realtime index that are about to happen."""
+    now = now or time.time()
+    observations = []
+    for stop_id, arrivals in index.stops.items():
+        for arrival_ts, trip_id, route_id, delay in arrivals:
+            if arrival_ts > now + RECORD_HORIZON_SECONDS:
+                break
+            if route_id:
+                observations.append((route_id, stop_id, trip_id, arrival_ts - delay, delay))
+    return record_deviations(observations, now)
+
+
+def predict_arrival(route_id, stop_id, scheduled_ts):
+    """
+    Predict the arrival of a scheduled trip from recorded deviations.
+
+    Uses the stop's histogram for the scheduled time-of-day bucket when it
+    has enough samples, otherwise the route's histogram for that bucket.
+
+    Returns:
+        dict: Expected arrival, delay quantiles and 50%/80% intervals
+    """
+    histograms = get_histograms()
+    route_id, stop_id = local_id(route_id), local_id(stop_id)
+    bucket = time_bucket(scheduled_ts)
+
+    level = "stop"
+    quantiles, samples = histograms.lookup((route_id, stop_id, bucket))
+    if samples < MIN_STOP_SAMPLES:
+        level = "route"
+        quantiles, samples = histograms.lookup((route_id, "", bucket))
+    if samples == 0:
+        quantiles, level = None, None
+
+    def at(delay):
+        return datetime.fromtimestamp(round(scheduled_ts + float(delay)), LOCAL_TIMEZONE).isoformat()
+
+    result = {
+        "route_id": route_id,
+        "stop_id": stop_id,
+        "scheduled_time": at(0),
+        "expected_time": at(quantiles[2]) if quantiles is not None else at(0),
+        "samples": samples,
+        "level": level,
+        "delay_seconds": None,
+        "intervals": None
+    }
+    if quantiles is not None:
+        p10, p25, p50, p75, p90, mean = (round(float(v)) for v in quantiles)
+        result["delay_seconds"] = {"p10": p10, "p25": p25, "p50": p50, "p75": p75, "p90": p90, "mean": mean}
+        result["intervals"] = {
+            "50": [at(p25), at(p75)],
+            "80": [at(p10), at(p90)]
+        }
+    return result
@@ -0,0 +1,269 @@
+from datetime import datetime
+import threading
+import time
+
+from config import settings
+from utils.lazy import lazy_import
+from .delay_service import record_realtime_index
+
+requests = lazy_import("requests")
+
+
+class RealtimeIndex:
+    """
+    Immutable snapshot of the decoded GTFS-Realtime feeds.
+
+    The consumer thread builds a complete new index on every poll and swaps
+    it in with a single assignment, so readers never see a half-built index.
+    """
+
+    __slots__ = ("stops", "trips", "vehicles", "feed_timestamp", "loaded_at")
+
+    def __init__(self, stops=None, trips=None, vehicles=None, feed_timestamp=0, loaded_at=0.0):
+        # stop_id -> list of (arrival_ts, trip_id, route_id, delay_seconds) sorted by arrival_ts
+        self.stops = stops or {}
+        # trip_id -> {"route_id", "vehicle_id", "start_date", "updates": [(stop_id, stop_sequence, arrival_ts, delay)]}
+        self.trips = trips or {}
+        # trip_id -> {"vehicle_id", "label", "lat", "lon", "bearing", "speed", "stop_id", "timestamp"}
+        self.vehicles = vehicles or {}
+        self.feed_timestamp = feed_timestamp
+        self.loaded_at = loaded_at
+
+
+# Current snapshot, replaced atomically by refresh_realtime_index()
+_index = RealtimeIndex()
+_consumer_thread = None
+_consumer_stop = threading.Event()
+
+
+def read_feed(source):
+    """
+    Read raw protobuf bytes from a feed URL or a local (recorded) .pb file.
+
+    Args:
+        source (str): http(s) URL, file:// URL or filesystem path
+
+    Returns:
+        bytes: Raw feed contents
+    """
+    if source.startswith(("http://", "https://")):
+        response = requests.get(source, timeout=10)
+        response.raise_for_status()
+        return response.content
+    if source.startswith("file://"):
+        source = source[len("file://"):]
+    with open(source, "rb") as f:
+        return f.read()
+
+
+def parse_feed(raw):
+    """Decode a GTFS-Realtime FeedMessage from raw protobuf bytes."""
+    from google.transit import gtfs_realtime_pb2
+
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.ParseFromString(raw)
+    return feed
+
+
+def build_index(trip_updates_feed, vehicle_positions_feed=None):
+    """
+    Build a RealtimeIndex from decoded TripUpdates and VehiclePositions feeds.
+
+    Args:
+        trip_updates_feed: FeedMessage containing trip_update entities
+        vehicle_positions_feed: Optional FeedMessage containing vehicle entities
+
+    Returns:
+        RealtimeIndex: Index keyed by stop_id and trip_id
+    """
+    stops = {}
+    trips = {}
+    vehicles = {}
+
+    for entity in trip_updates_feed.entity:
+        if not entity.HasField("trip_update"):
+            continue
+        trip_update = entity.trip_update
+        trip_id = trip_update.trip.trip_id
+        if not trip_id:
+            continue
+        route_id = trip_update.trip.route_id
+        updates = []
+
+        for stu in trip_update.stop_time_update:
+            # Skipped stops and stops without an absolute time can't be served from memory
+            if stu.schedule_relationship == stu.SKIPPED:
+                continue
+            event = stu.arrival if stu.HasField("arrival") else stu.departure
+            arrival_ts = event.time
+            delay = event.delay
+            updates.append((stu.stop_id, stu.stop_sequence, arrival_ts, delay))
+            if arrival_ts and stu.stop_id:
+                stops.setdefault(stu.stop_id, []).append((arrival_ts, trip_id, route_id, delay))
+
+        trips[trip_id] = {
+            "route_id": route_id,
+            "vehicle_id": trip_update.vehicle.id,
+            "start_date": trip_update.trip.start_date,
+            "updates": updates
+        }
+
+    if vehicle_positions_feed is not None:
+        for entity in vehicle_positions_feed.entity:
+            if not entity.HasField("vehicle"):
+                continue
+            vehicle = entity.vehicle
+            trip_id = vehicle.trip.trip_id
+            if not trip_id:
+                continue
+            vehicles[trip_id] = {
+                "vehicle_id": vehicle.vehicle.id,
+                "label": vehicle.vehicle.label,
+                "lat": vehicle.position.latitude,
+                "lon": vehicle.position.longitude,
+                "bearing": vehicle.position.bearing,
+                "speed": vehicle.position.speed,
+                "stop_id": vehicle.stop_id,
+                "timestamp": vehicle.timestamp
+            }
+
+    for stop_arrivals in stops.values():
+        stop_arrivals.sort()
+
+    return RealtimeIndex(
+        stops=stops,
+        trips=trips,
+        vehicles=vehicles,
+        feed_timestamp=trip_updates_feed.header.timestamp,
+        loaded_at=time.time()
+    )
+
+
+def refresh_realtime_index(trip_updates_source=None, vehicle_positions_source=None):
+    """
+    Fetch, decode and swap in a fresh realtime index.
+
+    Sources default to the configured feed URLs; pass local paths to replay
+    recorded .pb files, and an empty vehicle_positions_source to skip
+    vehicle positions.
+
+    Returns:
+        RealtimeIndex: The newly installed index
+    """
+    global _index
+
+    if trip_updates_source is None:
+        trip_updates_source = settings.GTFS_RT_TRIP_UPDATES_URL
+    if vehicle_positions_source is None:
+        vehicle_positions_source = settings.GTFS_RT_VEHICLE_POSITIONS_URL
+
+    trip_updates_feed = parse_feed(read_feed(trip_updates_source))
+    vehicle_positions_feed = None
+    if vehicle_positions_source:
+        try:
+            vehicle_positions_feed = parse_feed(read_feed(vehicle_positions_source))
+        except Exception as e:
+            # Vehicle positions are optional enrichment; arrivals only need trip updates
+            print(f"Error fetching vehicle positions feed: {e}")
+
+    new_index = build_index(trip_updates_feed, vehicle_positions_feed)
+    _index = new_index
+    return new_index
+
+
+def get_realtime_index():
+    """Return the current realtime index snapshot."""
+    return _index
+
+
+def is_realtime_fresh(now=None):
+    """
+    Check whether the realtime index was refreshed recently enough to serve from.
+
+    The consumer is started on first use, so the first check after startup
+    kicks off polling and reports stale until the first feed arrives.
+    """
+    start_realtime_consumer()
+    now = now or time.time()
+    return _index.loaded_at > 0 and now - _index.loaded_at <= settings.GTFS_RT_MAX_AGE_SECONDS
+
+
+def gtfs_stop_id(stop_id):
+    """Convert a OneBusAway stop id (e.g. '1_75403') to a GTFS stop_id ('75403')."""
+    agency, sep, local_id = stop_id.partition("_")
+    return local_id if sep and agency.isdigit() else stop_id
+
+
+def get_realtime_arrivals(stop_id, now=None, minutes_after=60):
+    """
+    Get upcoming arrivals for a stop from the in-memory realtime index.
+
+    Args:
+        stop_id (str): GTFS or OneBusAway stop id
+        now (float, optional): Reference unix time. Defaults to current time.
+        minutes_after (int, optional): Look-ahead window in minutes. Defaults to 60.
+
+    Returns:
+        list: Arrivals in the same shape as get_onebusaway_arrivals
+    """
+    index = _index
+    now = now or time.time()
+    horizon = now + minutes_after * 60
+
+    arrivals_data = []
+    for arrival_ts, trip_id, route_id, delay in index.stops.get(gtfs_stop_id(stop_id), []):
+        if arrival_ts < now - 60:
+            continue
+        if arrival_ts > horizon:
+            break
+
+        arrival_datetime = datetime.fromtimestamp(arrival_ts)
+        vehicle = index.vehicles.get(trip_id)
+        arrivals_data.append({
+            "route_id": route_id,
+            "route_name": route_id,
+            "route_short_name": route_id,
+            "route_long_name": "",
+            "headsign": "",
+            "minutes_away": max(0, int((arrival_ts - now) / 60)),
+            "arrival_time": arrival_datetime.isoformat(),
+            "status": "REAL_TIME" if abs(delay) < 60 else "DELAYED",
+            "real_time": True,
+            "trip_id": trip_id,
+            "delay": delay,
+            "vehicle_id": vehicle["vehicle_id"] if vehicle else None
+        })
+
+    return arrivals_data
+
+
+def _consumer_loop():
+    """Poll the GTFS-Realtime feeds until stop_realtime_consumer() is called."""
+    while not _consumer_stop.is_set():
+        try:
+            index = refresh_realtime_index()
+            recorded = record_realtime_index(index)
+            print(f"GTFS-RT index refreshed: {len(index.trips)} trips, {len(index.stops)} stops, "
+                  f"{recorded} delays recorded")
+        except Exception as e:
+            print(f"Error refreshing GTFS-RT index: {e}")
+        _consumer_stop.wait(settings.GTFS_RT_POLL_SECONDS)
+
+
+def start_realtime_consumer():
+    """Start the background GTFS-Realtime consumer thread if it isn't running."""
+    global _consumer_thread
+
+    if not settings.GTFS_RT_ENABLED:
+        return
+    if _consumer_thread is not None and _consumer_thread.is_alive():
+        return
+
+    _consumer_stop.clear()
+    _consumer_thread = threading.Thread(target=_consumer_loop, name="gtfs-rt-consumer", daemon=True)
+    _consumer_thread.start()
+
+
+def stop_realtime_consumer():
+    """Signal the background consumer to stop."""
+    _consumer_stop.set()
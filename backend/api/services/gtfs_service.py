@@ -0,0 +1,845 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, time as dt_time, timedelta
+from zoneinfo import ZoneInfo
+import multiprocessing
+import threading
+import hashlib
+import zipfile
+import shutil
+import json
+import csv
+import io
+import math
+import time
+import os
+
+from config import settings
+from utils.lazy import lazy_import
+from .gtfs_realtime_service import get_realtime_index, is_realtime_fresh, gtfs_stop_id
+
+requests = lazy_import("requests")
+np = lazy_import("numpy")
+
+# Size of a stop spatial index cell in degrees (roughly 1 km)
+STOP_GRID_DEGREES = 0.01
+
+# Agency time zone until a feed says otherwise
+DEFAULT_TIMEZONE = ZoneInfo("America/Los_Angeles")
+
+# Loaded dataset, replaced atomically once a load completes
+_dataset = None
+_loader_thread = None
+_loader_stop = threading.Event()
+_last_load_attempt = 0.0
+
+# Bumped when the snapshot layout changes, so old snapshots aren't reused
+SNAPSHOT_FORMAT = 1
+
+# Wait this long before retrying a failed load triggered by a request
+GTFS_LOAD_RETRY_SECONDS = 600
+
+
+def equirectangular_distance(lat, lon, lats, lons):
+    """Vectorized distance in meters from one point to arrays of points (accurate at city scale)."""
+    x = np.radians(lons - lon) * math.cos(math.radians(lat))
+    y = np.radians(lats - lat)
+    return 6371000 * np.sqrt(x * x + y * y)
+
+
+def parse_gtfs_time(value, _cache={}):
+    """
+    Convert a GTFS 'HH:MM:SS' time (hours may exceed 24) to seconds after
+    the service day's reference midnight. Blank times return -1.
+    """
+    seconds = _cache.get(value)
+    if seconds is None:
+        value = value.strip()
+        if not value:
+            seconds = -1
+        else:
+            h, m, s = value.split(":")
+            seconds = int(h) * 3600 + int(m) * 60 + int(s)
+        _cache[value] = seconds
+    return seconds
+
+
+def parse_gtfs_date(value):
+    """Convert a GTFS 'YYYYMMDD' date to an int that sorts like the date."""
+    return int(value.strip())
+
+
+class GtfsDataset:
+    """
+    Static GTFS timetable held in compact numpy arrays.
+
+    stop_times are stored twice: once ordered by (trip, stop_sequence) for
+    walking a trip, and once as per-stop departure arrays sorted by time so a
+    stop's departures in a window are found with a binary search.
+
+    Datasets are immutable once built: they're saved as a versioned snapshot
+    and served from read-only memory maps, and a feed update builds a new
+    dataset rather than changing this one.
+    """
+
+    # Saved in snapshots; the id -> index maps and the stop grid are rebuilt from these
+    ARRAY_FIELDS = (
+        "stop_lat", "stop_lon", "route_types", "trip_route", "trip_service",
+        "shape_offsets", "shape_lat", "shape_lon", "service_weekdays", "service_start", "service_end",
+        "trip_offsets", "st_trip", "st_stop", "st_seq", "st_arrival", "st_departure",
+        "stop_offsets", "stop_departures", "stop_departure_rows"
+    )
+    LIST_FIELDS = (
+        "stop_ids", "stop_names", "route_ids", "route_short_names", "route_long_names", "route_colors",
+        "route_text_colors", "trip_ids", "trip_headsigns", "trip_shape_ids", "shape_ids", "service_ids"
+    )
+
+    def __init__(self):
+        self.timezone = DEFAULT_TIMEZONE
+
+        # Stops
+        self.stop_ids = []
+        self.stop_index = {}
+        self.stop_names = []
+        self.stop_lat = None
+        self.stop_lon = None
+        self.stop_grid = {}  # (lat cell, lon cell) -> array of stop indices
+
+        # Routes
+        self.route_ids = []
+        self.route_index = {}
+        self.route_short_names = []
+        self.route_long_names = []
+        self.route_types = None
+        self.route_colors = []
+        self.route_text_colors = []
+
+        # Trips
+        self.trip_ids = []
+        self.trip_index = {}
+        self.trip_headsigns = []
+        self.trip_shape_ids = []
+        self.trip_route = None
+        self.trip_service = None
+
+        # Shapes: points ordered by (shape, sequence); shape s spans shape_offsets[s]:shape_offsets[s+1]
+        self.shape_ids = []
+        self.shape_index = {}
+        self.shape_offsets = None
+        self.shape_lat = None
+        self.shape_lon = None
+
+        # Services: weekday mask (bit 0 = Monday), date range and exceptions
+        self.service_ids = []
+        self.service_weekdays = None
+        self.service_start = None
+        self.service_end = None
+        self.service_exceptions = {}  # date int -> list of (service idx, exception_type)
+        self._active_cache = {}
+
+        # stop_times ordered by (trip, stop_sequence); trip t spans trip_offsets[t]:trip_offsets[t+1]
+        self.trip_offsets = None
+        self.st_trip = None
+        self.st_stop = None
+        self.st_seq = None
+        self.st_arrival = None
+        self.st_departure = None
+
+        # Per-stop departures; stop s spans stop_offsets[s]:stop_offsets[s+1]
+        self.stop_offsets = None
+        self.stop_departures = None
+        self.stop_departure_rows = None
+
+        # Snapshot version, and structures other services build from this dataset
+        self.version = None
+        self.derived = {}
+        self._derived_builders = {}
+        self._derived_locks = {}
+        self._derived_lock = threading.Lock()
+        # Set once a newer dataset has been swapped in
+        self.retired = False
+
+    def derived_value(self, key, build):
+        """
+        Return a structure derived from this dataset (a timetable, an index),
+        calling build(dataset) the first time it's asked for.
+
+        Derived structures live and die with their dataset, and the ones in
+        use are rebuilt for a new dataset before it's swapped in.
+        """
+        value = self.derived.get(key)
+        if value is None:
+            # One lock per structure: builders may need other derived structures
+            with self._derived_lock:
+                lock = self._derived_locks.setdefault(key, threading.Lock())
+            with lock:
+                value = self.derived.get(key)
+                if value is None:
+                    value = build(self)
+                    self._derived_builders[key] = build
+                    self.derived[key] = value
+        return value
+
+    def active_services(self, service_date):
+        """
+        Return a boolean array of services running on a date, applying
+        calendar.txt ranges and calendar_dates.txt exceptions.
+        """
+        key = service_date.toordinal()
+        active = self._active_cache.get(key)
+        if active is not None:
+            return active
+
+        date_int = service_date.year * 10000 + service_date.month * 100 + service_date.day
+        weekday_bit = 1 << service_date.weekday()
+        active = ((self.service_weekdays & weekday_bit) != 0) & \
+            (self.service_start <= date_int) & (self.service_end >= date_int)
+
+        for service_idx, exception_type in self.service_exceptions.get(date_int, []):
+            active[service_idx] = exception_type == 1
+
+        # Only a handful of dates are ever queried at once; keep the cache small
+        if len(self._active_cache) > 14:
+            self._active_cache.clear()
+        self._active_cache[key] = active
+        return active
+
+    def service_day_start(self, service_date):
+        """Unix time of a service day's reference point (noon minus 12h, local time)."""
+        noon = datetime.combine(service_date, dt_time(12), tzinfo=self.timezone)
+        # Elapsed time, not wall-clock arithmetic, so DST change days are right
+        return noon.timestamp() - 12 * 3600
+
+    def service_dates(self, start_ts, end_ts):
+        """
+        Service dates whose trips can run between two unix times, oldest first.
+
+        Trips from the day before can still be running after midnight
+        (times >= 24:00:00), and a window past midnight reaches into the
+        next service day.
+        """
+        service_date = datetime.fromtimestamp(start_ts, self.timezone).date() - timedelta(days=1)
+        last_date = datetime.fromtimestamp(end_ts, self.timezone).date()
+        while service_date <= last_date:
+            yield service_date
+            service_date += timedelta(days=1)
+
+    def build_stop_grid(self):
+        """Bucket stops into a fixed lat/lon grid for radius queries."""
+        cells = {}
+        lat_cells = np.floor(self.stop_lat / STOP_GRID_DEGREES).astype(np.int64)
+        lon_cells = np.floor(self.stop_lon / STOP_GRID_DEGREES).astype(np.int64)
+        for stop_idx, cell in enumerate(zip(lat_cells.tolist(), lon_cells.tolist())):
+            cells.setdefault(cell, []).append(stop_idx)
+        self.stop_grid = {cell: np.array(stops, dtype=np.int32) for cell, stops in cells.items()}
+
+    def nearby_stops(self, lat, lon, radius):
+        """
+        Find stops within a radius using the stop grid.
+
+        Args:
+            lat (float): Latitude
+            lon (float): Longitude
+            radius (float): Radius in meters
+
+        Returns:
+            tuple: (stop indices, distances in meters), sorted by distance
+        """
+        lat_span = radius / 111111
+        lon_span = radius / (111111 * max(math.cos(math.radians(lat)), 0.01))
+        lat_lo, lat_hi = math.floor((lat - lat_span) / STOP_GRID_DEGREES), math.floor((lat + lat_span) / STOP_GRID_DEGREES)
+        lon_lo, lon_hi = math.floor((lon - lon_span) / STOP_GRID_DEGREES), math.floor((lon + lon_span) / STOP_GRID_DEGREES)
+
+        candidates = [
+            self.stop_grid[(i, j)]
+            for i in range(lat_lo, lat_hi + 1)
+            for j in range(lon_lo, lon_hi + 1)
+            if (i, j) in self.stop_grid
+        ]
+        if not candidates:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float64)
+
+        stops = np.concatenate(candidates)
+        distances = equirectangular_distance(lat, lon, self.stop_lat[stops], self.stop_lon[stops])
+        within = distances <= radius
+        stops, distances = stops[within], distances[within]
+        order = np.argsort(distances)
+        return stops[order], distances[order]
+
+    def departures_between(self, stop_idx, start_ts, end_ts):
+        """
+        Find scheduled departures from a stop between two unix times.
+
+        Returns:
+            list: (departure_ts, stop_time_row) tuples sorted by departure time
+        """
+        lo_offset = self.stop_offsets[stop_idx]
+        hi_offset = self.stop_offsets[stop_idx + 1]
+        times = self.stop_departures[lo_offset:hi_offset]
+        rows = self.stop_departure_rows[lo_offset:hi_offset]
+
+        results = []
+        for service_date in self.service_dates(start_ts, end_ts):
+            day_start = self.service_day_start(service_date)
+            lo = np.searchsorted(times, start_ts - day_start, side="left")
+            hi = np.searchsorted(times, end_ts - day_start, side="right")
+            if lo >= hi:
+                continue
+            active = self.active_services(service_date)
+            for i in range(lo, hi):
+                row = rows[i]
+                trip_idx = self.st_trip[row]
+                if active[self.trip_service[trip_idx]]:
+                    results.append((day_start + times[i], row))
+
+        results.sort()
+        return results
+
+    def next_departure(self, stop_idx, start_ts, end_ts):
+        """
+        Find the first scheduled departure from a stop between two unix times.
+
+        Returns:
+            float: Departure unix time, or None if there is none in the window
+        """
+        lo_offset = self.stop_offsets[stop_idx]
+        hi_offset = self.stop_offsets[stop_idx + 1]
+        times = self.stop_departures[lo_offset:hi_offset]
+        rows = self.stop_departure_rows[lo_offset:hi_offset]
+
+        best = None
+        for service_date in self.service_dates(start_ts, end_ts):
+            day_start = self.service_day_start(service_date)
+            lo = np.searchsorted(times, start_ts - day_start, side="left")
+            hi = np.searchsorted(times, end_ts - day_start, side="right")
+            active = self.active_services(service_date)
+            for i in range(lo, hi):
+                if active[self.trip_service[self.st_trip[rows[i]]]]:
+                    departure = day_start + times[i]
+                    if best is None or departure < best:
+                        best = departure
+                    break
+        return best
+
+
+def _open_gtfs_table(source, name):
+    """Open a GTFS table from a zip file or directory as a text stream, or None if missing."""
+    if os.path.isdir(source):
+        path = os.path.join(source, name)
+        if not os.path.exists(path):
+            return None
+        return open(path, encoding="utf-8-sig", newline="")
+    archive = zipfile.ZipFile(source)
+    if name not in archive.namelist():
+        return None
+    return io.TextIOWrapper(archive.open(name), encoding="utf-8-sig", newline="")
+
+
+def _read_table(source, name):
+    """Yield rows of a GTFS table as dicts."""
+    f = _open_gtfs_table(source, name)
+    if f is None:
+        return
+    with f:
+        yield from csv.DictReader(f)
+
+
+def load_gtfs_dataset(source):
+    """
+    Parse a GTFS feed into a GtfsDataset.
+
+    Args:
+        source (str): Path to a GTFS zip file or extracted directory
+
+    Returns:
+        GtfsDataset: The parsed timetable
+    """
+    started = time.time()
+    ds = GtfsDataset()
+
+    for agency in _read_table(source, "agency.txt"):
+        if agency.get("agency_timezone"):
+            ds.timezone = ZoneInfo(agency["agency_timezone"])
+        break
+
+    # Stops
+    lats, lons = [], []
+    for stop in _read_table(source, "stops.txt"):
+        ds.stop_index[stop["stop_id"]] = len(ds.stop_ids)
+        ds.stop_ids.append(stop["stop_id"])
+        ds.stop_names.append(stop.get("stop_name", ""))
+        lats.append(float(stop.get("stop_lat") or 0))
+        lons.append(float(stop.get("stop_lon") or 0))
+    ds.stop_lat = np.array(lats, dtype=np.float64)
+    ds.stop_lon = np.array(lons, dtype=np.float64)
+    ds.build_stop_grid()
+
+    # Routes
+    route_types = []
+    for route in _read_table(source, "routes.txt"):
+        ds.route_index[route["route_id"]] = len(ds.route_ids)
+        ds.route_ids.append(route["route_id"])
+        ds.route_short_names.append(route.get("route_short_name", ""))
+        ds.route_long_names.append(route.get("route_long_name", ""))
+        route_types.append(int(route.get("route_type") or 3))
+        ds.route_colors.append("#" + (route.get("route_color") or "003f7f"))
+        ds.route_text_colors.append("#" + (route.get("route_text_color") or "ffffff"))
+    ds.route_types = np.array(route_types, dtype=np.int16)
+
+    # Services from calendar.txt
+    weekdays, starts, ends = [], [], []
+    service_index = {}
+    day_columns = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+    for service in _read_table(source, "calendar.txt"):
+        service_index[service["service_id"]] = len(ds.service_ids)
+        ds.service_ids.append(service["service_id"])
+        mask = 0
+        for bit, column in enumerate(day_columns):
+            if service.get(column, "0").strip() == "1":
+                mask |= 1 << bit
+        weekdays.append(mask)
+        starts.append(parse_gtfs_date(service["start_date"]))
+        ends.append(parse_gtfs_date(service["end_date"]))
+
+    # Exceptions from calendar_dates.txt; services may exist only here
+    for exception in _read_table(source, "calendar_dates.txt"):
+        service_id = exception["service_id"]
+        if service_id not in service_index:
+            service_index[service_id] = len(ds.service_ids)
+            ds.service_ids.append(service_id)
+            weekdays.append(0)
+            starts.append(0)
+            ends.append(0)
+        ds.service_exceptions.setdefault(parse_gtfs_date(exception["date"]), []).append(
+            (service_index[service_id], int(exception["exception_type"]))
+        )
+    ds.service_weekdays = np.array(weekdays, dtype=np.int16)
+    ds.service_start = np.array(starts, dtype=np.int32)
+    ds.service_end = np.array(ends, dtype=np.int32)
+
+    # Trips
+    trip_route, trip_service = [], []
+    for trip in _read_table(source, "trips.txt"):
+        ds.trip_index[trip["trip_id"]] = len(ds.trip_ids)
+        ds.trip_ids.append(trip["trip_id"])
+        ds.trip_headsigns.append(trip.get("trip_headsign", ""))
+        ds.trip_shape_ids.append(trip.get("shape_id", ""))
+        trip_route.append(ds.route_index.get(trip["route_id"], 0))
+        trip_service.append(service_index.get(trip["service_id"], 0))
+    ds.trip_route = np.array(trip_route, dtype=np.int32)
+    ds.trip_service = np.array(trip_service, dtype=np.int32)
+
+    # Shapes (optional), also read with csv.reader; feeds carry hundreds of thousands of points
+    shapes_col, shape_seqs_col, shape_lats_col, shape_lons_col = [], [], [], []
+    f = _open_gtfs_table(source, "shapes.txt")
+    if f is not None:
+        with f:
+            reader = csv.reader(f)
+            header = next(reader, None) or []
+            if "shape_id" in header:
+                id_col = header.index("shape_id")
+                lat_col = header.index("shape_pt_lat")
+                lon_col = header.index("shape_pt_lon")
+                seq_col = header.index("shape_pt_sequence")
+                shape_index = ds.shape_index
+                for row in reader:
+                    shape_idx = shape_index.get(row[id_col])
+                    if shape_idx is None:
+                        shape_idx = shape_index[row[id_col]] = len(ds.shape_ids)
+                        ds.shape_ids.append(row[id_col])
+                    shapes_col.append(shape_idx)
+                    shape_seqs_col.append(int(row[seq_col]))
+                    shape_lats_col.append(float(row[lat_col]))
+                    shape_lons_col.append(float(row[lon_col]))
+    shape_pt = np.array(shapes_col, dtype=np.int32)
+    order = np.lexsort((np.array(shape_seqs_col, dtype=np.int64), shape_pt))
+    ds.shape_lat = np.array(shape_lats_col, dtype=np.float64)[order]
+    ds.shape_lon = np.array(shape_lons_col, dtype=np.float64)[order]
+    ds.shape_offsets = np.zeros(len(ds.shape_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(shape_pt, minlength=len(ds.shape_ids)), out=ds.shape_offsets[1:])
+    del shapes_col, shape_seqs_col, shape_lats_col, shape_lons_col
+
+    # stop_times, read with csv.reader since it is by far the largest table
+    trips_col, seqs_col, stops_col, arrivals_col, departures_col = [], [], [], [], []
+    f = _open_gtfs_table(source, "stop_times.txt")
+    with f:
+        reader = csv.reader(f)
+        header = next(reader)
+        trip_col = header.index("trip_id")
+        stop_col = header.index("stop_id")
+        seq_col = header.index("stop_sequence")
+        arr_col = header.index("arrival_time")
+        dep_col = header.index("departure_time")
+        trip_index = ds.trip_index
+        stop_index = ds.stop_index
+        for row in reader:
+            trip_idx = trip_index.get(row[trip_col])
+            stop_idx = stop_index.get(row[stop_col])
+            if trip_idx is None or stop_idx is None:
+                continue
+            trips_col.append(trip_idx)
+            stops_col.append(stop_idx)
+            seqs_col.append(int(row[seq_col]))
+            arrivals_col.append(parse_gtfs_time(row[arr_col]))
+            departures_col.append(parse_gtfs_time(row[dep_col]))
+
+    st_trip = np.array(trips_col, dtype=np.int32)
+    st_seq = np.array(seqs_col, dtype=np.int32)
+    order = np.lexsort((st_seq, st_trip))
+    ds.st_trip = st_trip[order]
+    ds.st_seq = st_seq[order]
+    ds.st_stop = np.array(stops_col, dtype=np.int32)[order]
+    ds.st_arrival = np.array(arrivals_col, dtype=np.int32)[order]
+    ds.st_departure = np.array(departures_col, dtype=np.int32)[order]
+    del trips_col, seqs_col, stops_col, arrivals_col, departures_col
+
+    ds.trip_offsets = np.zeros(len(ds.trip_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(ds.st_trip, minlength=len(ds.trip_ids)), out=ds.trip_offsets[1:])
+    _fill_missing_times(ds)
+
+    # Per-stop departure arrays sorted by time
+    by_stop = np.lexsort((ds.st_departure, ds.st_stop))
+    ds.stop_departures = ds.st_departure[by_stop]
+    ds.stop_departure_rows = by_stop.astype(np.int32)
+    ds.stop_offsets = np.zeros(len(ds.stop_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(ds.st_stop, minlength=len(ds.stop_ids)), out=ds.stop_offsets[1:])
+
+    print(f"Loaded GTFS dataset: {len(ds.stop_ids)} stops, {len(ds.trip_ids)} trips, "
+          f"{len(ds.st_trip)} stop_times, {len(ds.shape_lat)} shape points in {time.time() - started:.1f}s")
+    return ds
+
+
+def _fill_missing_times(ds):
+    """Linearly interpolate blank (non-timepoint) stop times within each trip."""
+    arrival_missing = ds.st_arrival < 0
+    departure_missing = ds.st_departure < 0
+    # A stop with only one of the two times given uses it for both
+    ds.st_arrival[arrival_missing & ~departure_missing] = ds.st_departure[arrival_missing & ~departure_missing]
+    ds.st_departure[departure_missing & ~arrival_missing] = ds.st_arrival[departure_missing & ~arrival_missing]
+
+    missing_rows = np.flatnonzero(ds.st_departure < 0)
+    if len(missing_rows) == 0:
+        return
+    for trip_idx in np.unique(ds.st_trip[missing_rows]):
+        lo, hi = ds.trip_offsets[trip_idx], ds.trip_offsets[trip_idx + 1]
+        times = ds.st_departure[lo:hi].astype(np.float64)
+        known = times >= 0
+        if known.sum() < 2:
+            continue
+        positions = np.arange(hi - lo)
+        filled = np.interp(positions, positions[known], times[known]).astype(np.int32)
+        ds.st_departure[lo:hi] = filled
+        ds.st_arrival[lo:hi] = np.where(ds.st_arrival[lo:hi] < 0, filled, ds.st_arrival[lo:hi])
+
+
+def resolve_gtfs_source():
+    """Return a local path to the static GTFS feed, downloading it if needed."""
+    if settings.GTFS_STATIC_PATH:
+        return settings.GTFS_STATIC_PATH
+
+    path = os.path.join(settings.GTFS_DATA_DIR, "gtfs.zip")
+    # Refresh the cached download once a day
+    if os.path.exists(path) and time.time() - os.path.getmtime(path) < 24 * 3600:
+        return path
+
+    os.makedirs(settings.GTFS_DATA_DIR, exist_ok=True)
+    print(f"Downloading GTFS feed from {settings.KC_METRO_GTFS_URL}")
+    response = requests.get(settings.KC_METRO_GTFS_URL, stream=True, timeout=60)
+    response.raise_for_status()
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        for chunk in response.iter_content(chunk_size=1 << 20):
+            f.write(chunk)
+    os.replace(tmp_path, path)
+    return path
+
+
+def feed_version(source):
+    """
+    Version of a feed: a hash of the zip's content, or of file names, sizes
+    and modification times for an extracted directory.
+    """
+    digest = hashlib.blake2b(f"format-{SNAPSHOT_FORMAT}".encode(), digest_size=8)
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            stat = os.stat(os.path.join(source, name))
+            digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    else:
+        with open(source, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def snapshot_root():
+    return os.path.join(settings.GTFS_DATA_DIR, "snapshots")
+
+
+def save_snapshot(ds, directory):
+    """Write a dataset as a snapshot directory: one .npy per array plus meta.json."""
+    os.makedirs(directory)
+    for name in GtfsDataset.ARRAY_FIELDS:
+        np.save(os.path.join(directory, f"{name}.npy"), getattr(ds, name))
+    meta = {name: getattr(ds, name) for name in GtfsDataset.LIST_FIELDS}
+    meta["timezone"] = ds.timezone.key
+    meta["service_exceptions"] = list(ds.service_exceptions.items())
+    with open(os.path.join(directory, "meta.json"), "w") as f:
+        json.dump(meta, f, separators=(",", ":"))
+
+
+def open_snapshot(directory):
+    """
+    Open a snapshot as a GtfsDataset.
+
+    Arrays are memory-mapped read-only, so every worker process serving the
+    same snapshot shares one copy of the pages, and nothing can modify them.
+    """
+    ds = GtfsDataset()
+    for name in GtfsDataset.ARRAY_FIELDS:
+        # Plain ndarray views of the maps: np.memmap adds overhead to every slice
+        setattr(ds, name, np.asarray(np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")))
+    with open(os.path.join(directory, "meta.json")) as f:
+        meta = json.load(f)
+    for name in GtfsDataset.LIST_FIELDS:
+        setattr(ds, name, meta[name])
+    ds.timezone = ZoneInfo(meta["timezone"])
+    ds.service_exceptions = {date: [tuple(pair) for pair in pairs] for date, pairs in meta["service_exceptions"]}
+    ds.stop_index = {stop_id: i for i, stop_id in enumerate(ds.stop_ids)}
+    ds.route_index = {route_id: i for i, route_id in enumerate(ds.route_ids)}
+    ds.trip_index = {trip_id: i for i, trip_id in enumerate(ds.trip_ids)}
+    ds.shape_index = {shape_id: i for i, shape_id in enumerate(ds.shape_ids)}
+    ds.build_stop_grid()
+    ds.version = os.path.basename(directory)
+    return ds
+
+
+def build_snapshot(source, version):
+    """
+    Parse a feed and save it as snapshot `version`, returning its directory.
+
+    Runs in a separate process, so the parse's peak memory is returned to
+    the OS when it exits. The snapshot is written under a temporary name and
+    renamed into place, so readers see all of it or nothing.
+    """
+    directory = os.path.join(snapshot_root(), version)
+    if os.path.isdir(directory):
+        return directory
+    tmp_directory = f"{directory}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    save_snapshot(load_gtfs_dataset(source), tmp_directory)
+    try:
+        os.replace(tmp_directory, directory)
+    except OSError:
+        # Another worker finished the same version first
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+    return directory
+
+
+def _build_snapshot_in_process(source, version):
+    if not settings.GTFS_SNAPSHOT_PROCESS:
+        return build_snapshot(source, version)
+    # spawn, not fork: forking a threaded server process isn't safe
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(build_snapshot, source, version).result()
+
+
+def _remove_old_snapshots(keep):
+    """Delete snapshots other than the given versions (mapped files stay readable until unmapped)."""
+    root = snapshot_root()
+    for name in os.listdir(root):
+        if name not in keep and ".tmp-" not in name:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def refresh_gtfs_dataset(source=None):
+    """
+    Bring the dataset up to date with the static GTFS feed, swapping in a
+    new one if the feed changed.
+
+    A new feed is parsed into a snapshot by a separate process (or reused if
+    another worker already built it), then memory-mapped here. Whatever other
+    services had derived from the old dataset is rebuilt for the new one
+    before the swap, so requests keep using the old dataset until the new
+    one is completely ready, and the swap itself is a single assignment.
+
+    Returns:
+        GtfsDataset: The current dataset
+    """
+    global _dataset
+    source = source or resolve_gtfs_source()
+    version = feed_version(source)
+    current = _dataset
+    if current is not None and current.version == version:
+        return current
+
+    started = time.time()
+    dataset = open_snapshot(_build_snapshot_in_process(source, version))
+    if current is not None:
+        for key, build in list(current._derived_builders.items()):
+            dataset.derived_value(key, build)
+    _dataset = dataset
+    if current is not None:
+        current.retired = True
+        print(f"Swapped GTFS dataset {current.version} -> {version} in {time.time() - started:.1f}s")
+    _remove_old_snapshots({version} | ({current.version} if current is not None else set()))
+    return dataset
+
+
+def get_gtfs_dataset():
+    """
+    Return the loaded GtfsDataset, or None if it hasn't finished loading.
+
+    The dataset is loaded on first use rather than at startup, so the first
+    call starts the background loader and returns None until it's done.
+    """
+    if _dataset is None and time.time() - _last_load_attempt >= GTFS_LOAD_RETRY_SECONDS:
+        start_gtfs_loader()
+    return _dataset
+
+
+def agency_timezone():
+    """Time zone of the loaded feed's agency, or DEFAULT_TIMEZONE before it has loaded."""
+    ds = _dataset
+    return ds.timezone if ds is not None else DEFAULT_TIMEZONE
+
+
+def agency_timestamp(value):
+    """
+    Unix time of a datetime, reading a naive one as agency local time.
+
+    Args:
+        value (datetime or str): A datetime or ISO 8601 string, or None
+
+    Returns:
+        float: Unix time, or None for None
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=agency_timezone())
+    return value.timestamp()
+
+
+def agency_isoformat(ts):
+    """ISO 8601 string with a UTC offset for a unix time, in agency local time."""
+    return datetime.fromtimestamp(ts, agency_timezone()).isoformat()
+
+
+def _load_in_background():
+    while True:
+        try:
+            refresh_gtfs_dataset()
+        except Exception as e:
+            print(f"Error loading GTFS dataset: {e}")
+            if _dataset is None:
+                # get_gtfs_dataset starts a new attempt after GTFS_LOAD_RETRY_SECONDS
+                return
+        # Check the feed for updates; the old dataset keeps serving meanwhile
+        if not settings.GTFS_REFRESH_HOURS or _loader_stop.wait(settings.GTFS_REFRESH_HOURS * 3600):
+            return
+
+
+def start_gtfs_loader():
+    """Load the static GTFS dataset on a background thread, then check for feed updates."""
+    global _loader_thread, _last_load_attempt
+
+    if not settings.GTFS_STATIC_ENABLED:
+        return
+    if _loader_thread is not None and _loader_thread.is_alive():
+        return
+
+    _last_load_attempt = time.time()
+    _loader_stop.clear()
+    _loader_thread = threading.Thread(target=_load_in_background, name="gtfs-loader", daemon=True)
+    _loader_thread.start()
+
+
+def stop_gtfs_loader():
+    """Signal the background loader to stop checking for feed updates."""
+    _loader_stop.set()
+
+
+def _realtime_delay(index, trip_id, stop_id, stop_sequence):
+    """
+    Look up the realtime delay (seconds) for a trip at a stop, or None.
+
+    Follows GTFS-RT propagation: a stop without its own update inherits the
+    delay of the closest preceding update in the trip.
+    """
+    trip = index.trips.get(trip_id)
+    if trip is None:
+        return None
+    delay = None
+    for update_stop_id, update_sequence, _, update_delay in trip["updates"]:
+        if update_stop_id == stop_id or (update_sequence and update_sequence == stop_sequence):
+            return update_delay
+        if update_sequence and update_sequence < stop_sequence:
+            delay = update_delay
+    return delay
+
+
+def get_scheduled_arrivals(stop_id, now=None, minutes_before=5, minutes_after=60, apply_realtime=True):
+    """
+    Compute scheduled arrivals for a stop from the static GTFS timetable.
+
+    Realtime delays from the GTFS-RT index are applied on top of the
+    schedule when that index is fresh.
+
+    Args:
+        stop_id (str): GTFS or OneBusAway stop id
+        now (float, optional): Reference unix time. Defaults to current time.
+        minutes_before (int, optional): Look-back window in minutes. Defaults to 5.
+        minutes_after (int, optional): Look-ahead window in minutes. Defaults to 60.
+        apply_realtime (bool, optional): Adjust with realtime deltas. Defaults to True.
+
+    Returns:
+        list: Arrivals in the same shape as get_onebusaway_arrivals,
+            or None if the dataset isn't loaded or doesn't know the stop
+    """
+    ds = get_gtfs_dataset()
+    if ds is None:
+        return None
+    local_stop_id = gtfs_stop_id(stop_id)
+    stop_idx = ds.stop_index.get(local_stop_id)
+    if stop_idx is None:
+        return None
+
+    now = now or time.time()
+    index = get_realtime_index() if apply_realtime and is_realtime_fresh() else None
+
+    arrivals_data = []
+    for scheduled_ts, row in ds.departures_between(stop_idx, now - minutes_before * 60, now + minutes_after * 60):
+        trip_idx = ds.st_trip[row]
+        route_idx = ds.trip_route[trip_idx]
+        trip_id = ds.trip_ids[trip_idx]
+
+        status = "SCHEDULED"
+        delay = None
+        if index is not None:
+            delay = _realtime_delay(index, trip_id, local_stop_id, int(ds.st_seq[row]))
+        arrival_ts = scheduled_ts
+        if delay is not None:
+            arrival_ts += delay
+            status = "REAL_TIME" if abs(delay) < 60 else "DELAYED"
+
+        arrival_datetime = datetime.fromtimestamp(arrival_ts)
+        short_name = ds.route_short_names[route_idx]
+        long_name = ds.route_long_names[route_idx]
+        arrivals_data.append({
+            "route_id": ds.route_ids[route_idx],
+            "route_name": short_name or long_name,
+            "route_short_name": short_name,
+            "route_long_name": long_name,
+            "headsign": ds.trip_headsigns[trip_idx],
+            "minutes_away": max(0, int((arrival_ts - now) / 60)),
+            "arrival_time": arrival_datetime.isoformat(),
+            "scheduled_time": datetime.fromtimestamp(scheduled_ts).isoformat(),
+            "status": status,
+            "real_time": delay is not None,
+            "trip_id": trip_id,
+            "delay": delay
+        })
+
+    arrivals_data.sort(key=lambda x: x["arrival_time"])
+    return arrivals_data
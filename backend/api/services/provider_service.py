@@ -0,0 +1,185 @@
+"""
+Registry of transit providers and the spatial index over their coverage.
+
+Each provider (a OneBusAway instance, a GTFS-only agency, ...) declares a
+coverage polygon. Polygons are rasterized once, at registration, onto a
+fixed lat/lon grid: cells wholly inside a polygon list the provider
+outright, and only cells its boundary crosses need a point-in-polygon test.
+Finding the providers for a point is a dict lookup plus at most a few
+polygon tests, however many providers are registered.
+
+Provider types are looked up by name in PROVIDER_TYPES, so new kinds of
+provider plug in by adding a TransitProvider subclass there.
+"""
+from math import floor
+import threading
+
+from config import settings
+
+COVERAGE_CELL_DEGREES = 0.05
+
+# Provider type name -> TransitProvider subclass
+PROVIDER_TYPES = {}
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def point_in_polygon(lat, lon, polygon):
+    """Even-odd test of a point against a polygon of (lat, lon) vertices."""
+    inside = False
+    lat_j, lon_j = polygon[-1]
+    for lat_i, lon_i in polygon:
+        if (lat_i > lat) != (lat_j > lat):
+            if lon < (lon_j - lon_i) * (lat - lat_i) / (lat_j - lat_i) + lon_i:
+                inside = not inside
+        lat_j, lon_j = lat_i, lon_i
+    return inside
+
+
+def _segment_crosses_box(lat0, lon0, lat1, lon1, south, west, north, east):
+    """Liang-Barsky: does a segment touch the box?"""
+    t0, t1 = 0.0, 1.0
+    d_lat, d_lon = lat1 - lat0, lon1 - lon0
+    for p, q in ((-d_lon, lon0 - west), (d_lon, east - lon0), (-d_lat, lat0 - south), (d_lat, north - lat0)):
+        if p == 0:
+            if q < 0:
+                return False
+            continue
+        t = q / p
+        if p < 0:
+            t0 = max(t0, t)
+        else:
+            t1 = min(t1, t)
+        if t0 > t1:
+            return False
+    return True
+
+
+class TransitProvider:
+    """
+    A source of stops, routes and arrivals for the area inside its coverage.
+
+    Args:
+        name (str): Name shown to clients
+        coverage (list): Polygon as [lat, lon] vertices (at least three)
+    """
+
+    def __init__(self, name, coverage):
+        if len(coverage) < 3:
+            raise ValueError(f"Coverage of {name} needs at least three vertices")
+        self.name = name
+        self.coverage = [(float(lat), float(lon)) for lat, lon in coverage]
+        self.order = None  # Registration order, set by the registry
+
+    def covers(self, lat, lon):
+        return point_in_polygon(lat, lon, self.coverage)
+
+    def nearby(self, lat, lon, radius):
+        """
+        Get transit near a point.
+
+        Returns:
+            dict or None: {"stops", "routes", "arrivals"} in the shapes of
+                get_transit_data, or None if the provider can't answer now
+        """
+        raise NotImplementedError
+
+
+class CoverageIndex:
+    """Grid index from points to the providers whose coverage contains them."""
+
+    def __init__(self, cell_degrees=COVERAGE_CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self.inside = {}  # cell -> providers covering all of it
+        self.edge = {}  # cell -> providers whose boundary crosses it
+
+    def cell(self, lat, lon):
+        return floor(lat / self.cell_degrees), floor(lon / self.cell_degrees)
+
+    def add(self, provider):
+        size = self.cell_degrees
+        polygon = provider.coverage
+
+        # Cells the boundary passes through need an exact test per lookup
+        edge_cells = set()
+        for (lat0, lon0), (lat1, lon1) in zip(polygon, polygon[1:] + polygon[:1]):
+            (i0, j0), (i1, j1) = self.cell(lat0, lon0), self.cell(lat1, lon1)
+            for i in range(min(i0, i1), max(i0, i1) + 1):
+                for j in range(min(j0, j1), max(j0, j1) + 1):
+                    if _segment_crosses_box(lat0, lon0, lat1, lon1, i * size, j * size, (i + 1) * size, (j + 1) * size):
+                        edge_cells.add((i, j))
+
+        # Every other cell is wholly inside or wholly outside, so its center decides
+        lats = [lat for lat, _ in polygon]
+        lons = [lon for _, lon in polygon]
+        (i_lo, j_lo), (i_hi, j_hi) = self.cell(min(lats), min(lons)), self.cell(max(lats), max(lons))
+        for i in range(i_lo, i_hi + 1):
+            for j in range(j_lo, j_hi + 1):
+                if (i, j) in edge_cells:
+                    self.edge.setdefault((i, j), []).append(provider)
+                elif point_in_polygon((i + 0.5) * size, (j + 0.5) * size, polygon):
+                    self.inside.setdefault((i, j), []).append(provider)
+
+    def lookup(self, lat, lon):
+        """Providers covering a point, in registration order."""
+        cell = self.cell(lat, lon)
+        found = list(self.inside.get(cell, ()))
+        found.extend(provider for provider in self.edge.get(cell, ()) if provider.covers(lat, lon))
+        found.sort(key=lambda provider: provider.order)
+        return found
+
+
+class ProviderRegistry:
+    """Registered providers and their coverage index."""
+
+    def __init__(self, cell_degrees=COVERAGE_CELL_DEGREES):
+        self.providers = []
+        self.index = CoverageIndex(cell_degrees)
+
+    def register(self, provider):
+        provider.order = len(self.providers)
+        self.providers.append(provider)
+        self.index.add(provider)
+
+    def providers_at(self, lat, lon):
+        return self.index.lookup(lat, lon)
+
+
+def provider_from_config(config):
+    """
+    Build a provider from a TRANSIT_PROVIDERS entry.
+
+    Args:
+        config (dict): "type" (a key of PROVIDER_TYPES) plus the provider's
+            keyword arguments, including "name" and "coverage"
+    """
+    options = dict(config)
+    kind = options.pop("type", None)
+    provider_class = PROVIDER_TYPES.get(kind)
+    if provider_class is None:
+        raise ValueError(f"Unknown transit provider type: {kind}")
+    return provider_class(**options)
+
+
+def get_provider_registry():
+    """Return the provider registry, building it from TRANSIT_PROVIDERS on first use."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                registry = ProviderRegistry()
+                for config in settings.TRANSIT_PROVIDERS:
+                    try:
+                        registry.register(provider_from_config(config))
+                    except (TypeError, ValueError) as e:
+                        print(f"Skipping transit provider {config.get('name', '?')}: {e}")
+                _registry = registry
+    return _registry
+
+
+def register_provider(provider):
+    """Add a provider to the registry at runtime."""
+    registry = get_provider_registry()
+    with _registry_lock:
+        registry.register(provider)
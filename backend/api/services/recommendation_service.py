@@ -0,0 +1,327 @@
+from datetime import datetime
+import time
+
+from utils.lazy import lazy_import
+from .weather_service import (
+    weather_cache_key, cache as weather_cache, cache_expiry as weather_cache_expiry, WEATHER_COORD_DECIMALS
+)
+from .traffic_service import (
+    traffic_cache_key, cache as traffic_cache, cache_expiry as traffic_cache_expiry, TRAFFIC_COORD_DECIMALS
+)
+from .routing_service import route_cache_key, cache as route_cache, cache_expiry as route_cache_expiry
+from .gtfs_service import get_gtfs_dataset, agency_timezone
+from .trip_planner_service import WALK_SPEED, MAX_ACCESS_WALK
+from . import user_store
+
+np = lazy_import("numpy")
+
+# Mode names match the ones the frontend tracks in mlUtils.js
+MODES = ("drive", "transit", "bike", "walk", "rideshare")
+DRIVE, TRANSIT, BIKE, WALK, RIDESHARE = range(len(MODES))
+
+# Average door-to-door speeds along the street network (km/h)
+MODE_SPEED_KMH = (30.0, 20.0, 15.0, 5.0, 30.0)
+# Fixed minutes per trip: parking, bike lock-up, rideshare pickup
+MODE_OVERHEAD_MINUTES = (5.0, 0.0, 2.0, 0.0, 6.0)
+# Longest trip (km) a mode is considered for
+MODE_MAX_KM = (float("inf"), float("inf"), 20.0, 5.0, float("inf"))
+# Street distance is roughly this much longer than the straight line
+DETOUR_FACTOR = 1.3
+
+# Driving slows down this much at rush hour when no traffic data is cached
+PEAK_HOURS = (7, 8, 9, 16, 17, 18)
+PEAK_SLOWDOWN = 1.25
+# Incident delay near the origin stretches driving time, up to double
+CONGESTION_SCALE_MINUTES = 60.0
+MAX_CONGESTION = 1.0
+
+# Minutes-equivalent discomfort per mode in bad weather (weather is in Fahrenheit)
+RAIN_PENALTY = (0.0, 2.0, 15.0, 10.0, 0.0)
+SNOW_PENALTY = (10.0, 5.0, 30.0, 15.0, 10.0)
+TEMPERATURE_PENALTY = (0.0, 0.0, 5.0, 5.0, 0.0)
+COLD_F, HOT_F = 40.0, 90.0
+
+# Transit access when the timetable isn't loaded: walk to a stop plus half a headway
+TRANSIT_DEFAULT_ACCESS_MINUTES = 12.0
+TRANSIT_EGRESS_MINUTES = 5.0
+TRANSIT_LOOKAHEAD_SECONDS = 3600
+TRANSIT_DEPARTURE_BUCKET = 5 * 60  # seconds
+
+PREFERRED_MODE_BONUS = 5.0  # minutes
+# Softmax temperature (minutes) for turning costs into confidences
+SCORE_TEMPERATURE = 5.0
+
+
+def _fresh(cache, expiry, key, now):
+    """Return a cached service entry if it hasn't expired, without ever fetching."""
+    if key in cache and expiry.get(key, datetime.min) > now:
+        return cache[key]
+    return None
+
+
+def _cells(lats, lons, decimals, *columns):
+    """
+    Group rows by cache cell (plus any extra key columns).
+
+    Returns:
+        tuple: (unique keys, index of each row's key)
+    """
+    keys = np.stack([np.round(lats, decimals), np.round(lons, decimals), *columns], axis=1)
+    return np.unique(keys, axis=0, return_inverse=True)
+
+
+def weather_penalty(description, temperature=None):
+    """Per-mode penalty row for a weather description and temperature (Fahrenheit)."""
+    penalty = np.zeros(len(MODES))
+    if "snow" in description or "sleet" in description or "ice" in description:
+        penalty += SNOW_PENALTY
+    elif "rain" in description or "drizzle" in description or "storm" in description:
+        penalty += RAIN_PENALTY
+    if temperature is not None and not COLD_F <= temperature <= HOT_F:
+        penalty += TEMPERATURE_PENALTY
+    return penalty
+
+
+def _weather_features(lats, lons, now):
+    """Per-row (penalty matrix, description) from cached weather near each origin."""
+    cells, inverse = _cells(lats, lons, WEATHER_COORD_DECIMALS)
+    penalties = np.zeros((len(cells), len(MODES)))
+    descriptions = []
+    for i, (lat, lon) in enumerate(cells.tolist()):
+        weather = _fresh(weather_cache, weather_cache_expiry, weather_cache_key(lat, lon), now)
+        if weather is None:
+            descriptions.append(None)
+            continue
+        description = weather.get("description", "").lower()
+        penalties[i] = weather_penalty(description, weather.get("temperature"))
+        descriptions.append(description)
+    return penalties[inverse], [descriptions[i] for i in inverse.tolist()]
+
+
+def _traffic_features(lats, lons, now):
+    """Per-row incident delay (minutes) from cached traffic near each origin, NaN if none cached."""
+    cells, inverse = _cells(lats, lons, TRAFFIC_COORD_DECIMALS)
+    delays = np.full(len(cells), np.nan)
+    for i, (lat, lon) in enumerate(cells.tolist()):
+        traffic = _fresh(traffic_cache, traffic_cache_expiry, traffic_cache_key(lat, lon), now)
+        if traffic is not None:
+            delays[i] = sum(incident.delay for incident in traffic.get("incidents", [])) / 60
+    return delays[inverse]
+
+
+def _transit_features(lats, lons, depart_at):
+    """
+    Per-row minutes to walk to a stop and wait for the next departure,
+    from the in-memory timetable. Origins with no stop in reach get inf.
+    """
+    ds = get_gtfs_dataset()
+    if ds is None:
+        return np.full(len(lats), TRANSIT_DEFAULT_ACCESS_MINUTES)
+
+    # Commutes from the same cell in the same departure bucket share one search
+    buckets = depart_at // TRANSIT_DEPARTURE_BUCKET
+    keys, inverse = _cells(lats, lons, TRAFFIC_COORD_DECIMALS, buckets)
+    access = np.full(len(keys), np.inf)
+    for i, (lat, lon, bucket) in enumerate(keys.tolist()):
+        start = bucket * TRANSIT_DEPARTURE_BUCKET
+        stops, distances = ds.nearby_stops(lat, lon, MAX_ACCESS_WALK)
+        for stop_idx, distance in zip(stops[:3].tolist(), distances[:3].tolist()):
+            walk = distance / WALK_SPEED
+            departure = ds.next_departure(stop_idx, start + walk, start + walk + TRANSIT_LOOKAHEAD_SECONDS)
+            if departure is not None:
+                access[i] = min(access[i], (departure - start) / 60)
+    return access[inverse]
+
+
+def _local_hours(ts):
+    """
+    Agency local hour of day for an array of unix times.
+
+    Converted once per distinct quarter hour, the finest step UTC offsets
+    take, so each departure gets the offset in effect on its own date.
+    """
+    quarters, index = np.unique(np.floor(ts / 900).astype(np.int64), return_inverse=True)
+    tz = agency_timezone()
+    return np.array(
+        [datetime.fromtimestamp(q * 900, tz).hour for q in quarters.tolist()], dtype=np.int64
+    )[index.reshape(-1)]
+
+
+def score_matrix(origin_lat, origin_lon, destination_lat, destination_lon, depart_at, preferred_mode=None,
+                 traffic_delay=None, weather=None):
+    """
+    Estimate door-to-door minutes and a generalized cost for every mode of
+    every commute in one vectorized pass.
+
+    Features come only from what the services already hold in memory:
+    cached weather and traffic near the origin, cached car routes and the
+    loaded GTFS timetable. Nothing here calls an upstream API.
+
+    Args:
+        origin_lat, origin_lon, destination_lat, destination_lon: Arrays of coordinates
+        depart_at: Array of departure unix times
+        preferred_mode: Optional array of mode indices (-1 for none)
+        traffic_delay: Optional array of known incident delay minutes per
+            commute (NaN to use cached traffic)
+        weather: Optional list of known weather descriptions per commute
+            (None to use cached weather)
+
+    Returns:
+        tuple: (minutes, cost, features) where minutes and cost are
+            (commutes x modes) arrays, inf for infeasible modes
+    """
+    origin_lat = np.asarray(origin_lat, dtype=np.float64)
+    origin_lon = np.asarray(origin_lon, dtype=np.float64)
+    destination_lat = np.asarray(destination_lat, dtype=np.float64)
+    destination_lon = np.asarray(destination_lon, dtype=np.float64)
+    depart_at = np.asarray(depart_at, dtype=np.float64)
+    now = datetime.now()
+
+    x = np.radians(destination_lon - origin_lon) * np.cos(np.radians(origin_lat))
+    y = np.radians(destination_lat - origin_lat)
+    km = 6371.0 * np.sqrt(x * x + y * y) * DETOUR_FACTOR
+
+    minutes = km[:, None] / np.array(MODE_SPEED_KMH) * 60 + np.array(MODE_OVERHEAD_MINUTES)
+
+    # Driving: cached traffic incidents if we have them, otherwise a rush-hour guess
+    hours = _local_hours(depart_at)
+    incident_delay = _traffic_features(origin_lat, origin_lon, now)
+    if traffic_delay is not None:
+        traffic_delay = np.asarray(traffic_delay, dtype=np.float64)
+        incident_delay = np.where(np.isnan(traffic_delay), incident_delay, traffic_delay)
+    congestion = np.where(
+        np.isnan(incident_delay),
+        np.where(np.isin(hours, PEAK_HOURS), PEAK_SLOWDOWN, 1.0),
+        1.0 + np.minimum(MAX_CONGESTION, np.nan_to_num(incident_delay) / CONGESTION_SCALE_MINUTES)
+    )
+    minutes[:, DRIVE] = (minutes[:, DRIVE] - MODE_OVERHEAD_MINUTES[DRIVE]) * congestion + MODE_OVERHEAD_MINUTES[DRIVE]
+    minutes[:, RIDESHARE] = (minutes[:, RIDESHARE] - MODE_OVERHEAD_MINUTES[RIDESHARE]) * congestion + MODE_OVERHEAD_MINUTES[RIDESHARE]
+
+    # A cached TomTom route for the same cells and departure bucket beats the estimate
+    for row in range(len(km)):
+        route = _fresh(route_cache, route_cache_expiry, route_cache_key(
+            origin_lat[row], origin_lon[row], destination_lat[row], destination_lon[row], "car", depart_at[row]
+        ), now)
+        if route is not None:
+            eta = route["eta_seconds"] / 60
+            minutes[row, DRIVE] = eta + MODE_OVERHEAD_MINUTES[DRIVE]
+            minutes[row, RIDESHARE] = eta + MODE_OVERHEAD_MINUTES[RIDESHARE]
+
+    transit_access = _transit_features(origin_lat, origin_lon, depart_at)
+    minutes[:, TRANSIT] += transit_access + TRANSIT_EGRESS_MINUTES
+
+    minutes[km[:, None] > np.array(MODE_MAX_KM)] = np.inf
+
+    penalty_matrix, cached_weather = _weather_features(origin_lat, origin_lon, now)
+    if weather is not None:
+        known = {}
+        for row, description in enumerate(weather):
+            if description is not None:
+                if description not in known:
+                    known[description] = weather_penalty(description)
+                penalty_matrix[row] = known[description]
+                cached_weather[row] = description
+    weather = cached_weather
+    cost = minutes + penalty_matrix
+    if preferred_mode is not None:
+        preferred_mode = np.asarray(preferred_mode)
+        rows = np.nonzero(preferred_mode >= 0)[0]
+        cost[rows, preferred_mode[rows]] -= PREFERRED_MODE_BONUS
+
+    features = {
+        "distance_km": km,
+        "weather": weather,
+        "traffic_delay_minutes": incident_delay,
+        "transit_access_minutes": transit_access
+    }
+    return minutes, cost, features
+
+
+def _confidences(cost):
+    """Softmax over modes: cheaper modes get more of the probability mass."""
+    shifted = -(cost - np.min(cost, axis=1, keepdims=True)) / SCORE_TEMPERATURE
+    weights = np.exp(shifted)
+    return weights / np.sum(weights, axis=1, keepdims=True)
+
+
+def _json_number(value, digits=1):
+    return None if value is None or not np.isfinite(value) else round(float(value), digits)
+
+
+def score_commutes(commutes, now=None):
+    """
+    Recommend a mode for each of many commutes.
+
+    Args:
+        commutes (list): Dicts with origin_lat, origin_lon, destination_lat,
+            destination_lon and optional depart_at (unix time), preferred_mode,
+            and known traffic_delay_minutes / weather overriding cached data
+        now (float, optional): Default departure time. Defaults to current time.
+
+    Returns:
+        list: One result per commute, with modes ranked best first
+    """
+    if not commutes:
+        return []
+    now = now or time.time()
+
+    preferred = [MODES.index(c["preferred_mode"]) if c.get("preferred_mode") in MODES else -1 for c in commutes]
+    minutes, cost, features = score_matrix(
+        [c["origin_lat"] for c in commutes],
+        [c["origin_lon"] for c in commutes],
+        [c["destination_lat"] for c in commutes],
+        [c["destination_lon"] for c in commutes],
+        [c.get("depart_at") or now for c in commutes],
+        preferred,
+        [c.get("traffic_delay_minutes", float("nan")) for c in commutes],
+        [c.get("weather") for c in commutes]
+    )
+    confidence = _confidences(cost)
+    order = np.argsort(cost, axis=1, kind="stable")
+
+    minutes_list = minutes.tolist()
+    confidence_list = confidence.tolist()
+    results = []
+    for row, ranking in enumerate(order.tolist()):
+        modes = [
+            {
+                "mode": MODES[m],
+                "minutes": round(minutes_list[row][m]),
+                "confidence": round(confidence_list[row][m], 3)
+            }
+            for m in ranking if np.isfinite(minutes_list[row][m])
+        ]
+        results.append({
+            "recommended_mode": modes[0]["mode"] if modes else None,
+            "modes": modes,
+            "features": {
+                "distance_km": _json_number(features["distance_km"][row], 2),
+                "weather": features["weather"][row],
+                "traffic_delay_minutes": _json_number(features["traffic_delay_minutes"][row]),
+                "transit_access_minutes": _json_number(features["transit_access_minutes"][row])
+            }
+        })
+    return results
+
+
+def recommend_for_user(user_id, lat, lon, preferred_mode=None, depart_at=None):
+    """
+    Score every mode to every one of a user's saved places from their
+    current location.
+
+    Returns:
+        list: One entry per saved place, with its ranked modes
+    """
+    places = user_store.list_saved_places(user_id)
+    results = score_commutes([
+        {
+            "origin_lat": lat,
+            "origin_lon": lon,
+            "destination_lat": place["lat"],
+            "destination_lon": place["lon"],
+            "depart_at": depart_at,
+            "preferred_mode": preferred_mode
+        }
+        for place in places
+    ])
+    return [{"destination": place, **result} for place, result in zip(places, results)]
@@ -0,0 +1,234 @@
+from datetime import datetime, timedelta
+import threading
+import time
+
+from utils.lazy import lazy_import
+from .delay_service import LOCAL_TIMEZONE, MIN_DEVIATION, BIN_SECONDS, BIN_COUNT, local_id
+from .timeseries_service import read_new
+
+np = lazy_import("numpy")
+
+# King County Metro counts an arrival as on time from 1 minute early to 5 minutes late
+ON_TIME_EARLY_SECONDS = 60
+ON_TIME_LATE_SECONDS = 300
+
+# Gaps longer than this are breaks in service, not headways
+MAX_HEADWAY_SECONDS = 2 * 3600
+
+# Stored rows are written a few seconds after they're recorded, so a day
+# isn't complete until this long after its last arrivals could be recorded
+WRITE_LAG_SECONDS = 30
+# Arrivals are stored when they're recorded, which can be a little before
+# or well after the scheduled time, so a day's scan reaches past its edges
+EARLY_RECORD_SECONDS = 300
+LATE_RECORD_SECONDS = 3600
+
+# Days of aggregates kept in memory
+CACHED_DAYS = 14
+
+# Per-group sums; everything reported is derived from these, so days and
+# groups can be added together
+SUM_COLUMNS = ("count", "on_time", "delay_sum", "delay_sq", "headway_count", "headway_sum", "headway_sq")
+
+
+class DayReliability:
+    """
+    Additive reliability aggregates for one local day, keyed by
+    (route, stop, hour of scheduled arrival).
+
+    Rows from the time-series store are folded in as they're written
+    (see refresh), so a day is never aggregated from scratch twice, and
+    each refresh reads only the rows appended to the store since the last.
+    """
+
+    def __init__(self, day):
+        self.day = day
+        start = datetime.combine(day, datetime.min.time(), LOCAL_TIMEZONE)
+        self.start = start.timestamp()
+        self.end = (start + timedelta(days=1)).timestamp()
+        self.scan_end = self.end + LATE_RECORD_SECONDS
+        self.scan_start = self.start - EARLY_RECORD_SECONDS
+        self.scanned_until = self.scan_start
+        # Partition -> rows already folded in
+        self.offsets = {}
+        self.index = {}  # (route, stop, hour) -> row
+        self.sums = np.zeros((0, len(SUM_COLUMNS)), dtype=np.float64)
+        self.histograms = np.zeros((0, BIN_COUNT), dtype=np.int32)
+        # (route, stop) -> last actual arrival, so headways continue across refreshes
+        self.last_arrival = {}
+        self.lock = threading.Lock()
+
+    def is_complete(self):
+        return self.scanned_until >= self.scan_end
+
+    def _rows(self, keys):
+        rows = np.empty(len(keys), dtype=np.int64)
+        for i, key in enumerate(keys):
+            row = self.index.get(key)
+            if row is None:
+                row = self.index[key] = len(self.index)
+            rows[i] = row
+        if len(self.index) > len(self.sums):
+            grow = len(self.index) - len(self.sums)
+            self.sums = np.vstack((self.sums, np.zeros((grow, len(SUM_COLUMNS)))))
+            self.histograms = np.vstack((self.histograms, np.zeros((grow, BIN_COUNT), dtype=np.int32)))
+        return rows
+
+    def add(self, route, stop, scheduled, delay):
+        """Fold a batch of arrivals (parallel arrays) into the aggregates."""
+        if len(route) == 0:
+            return
+        # Local hour of day, converted once per distinct hour rather than per row
+        hours, hour_index = np.unique(np.floor(scheduled / 3600).astype(np.int64), return_inverse=True)
+        hour = np.array(
+            [datetime.fromtimestamp(h * 3600, LOCAL_TIMEZONE).hour for h in hours.tolist()], dtype=np.int64
+        )[hour_index.reshape(-1)]
+        groups = np.rec.fromarrays([route, stop, hour], names="route,stop,hour")
+        unique, inverse = np.unique(groups, return_inverse=True)
+        keys = [(r.decode(), s.decode(), int(h)) for r, s, h in unique.tolist()]
+        rows = self._rows(keys)[inverse.reshape(-1)]
+
+        n = len(self.sums)
+        on_time = (delay >= -ON_TIME_EARLY_SECONDS) & (delay <= ON_TIME_LATE_SECONDS)
+        self.sums[:, 0] += np.bincount(rows, minlength=n)
+        self.sums[:, 1] += np.bincount(rows, weights=on_time, minlength=n)
+        self.sums[:, 2] += np.bincount(rows, weights=delay, minlength=n)
+        self.sums[:, 3] += np.bincount(rows, weights=delay * delay, minlength=n)
+        bins = np.clip(1 + np.floor((delay - MIN_DEVIATION) / BIN_SECONDS), 0, BIN_COUNT - 1).astype(np.int64)
+        np.add.at(self.histograms, (rows, bins), 1)
+
+        # Headways: time since the previous arrival at the same stop on the same route
+        actual = scheduled + delay
+        order = np.lexsort((actual, stop, route))
+        route, stop, actual, rows = route[order], stop[order], actual[order], rows[order]
+        previous = np.empty_like(actual)
+        previous[1:] = actual[:-1]
+        first = np.ones(len(actual), dtype=bool)
+        first[1:] = (route[1:] != route[:-1]) | (stop[1:] != stop[:-1])
+        for i in np.flatnonzero(first).tolist():
+            previous[i] = self.last_arrival.get((route[i], stop[i]), np.nan)
+        last = np.append(np.flatnonzero(first)[1:], len(actual)) - 1
+        for i in last.tolist():
+            self.last_arrival[(route[i], stop[i])] = actual[i]
+
+        headway = actual - previous
+        valid = (headway > 0) & (headway <= MAX_HEADWAY_SECONDS)
+        headway, rows = headway[valid], rows[valid]
+        self.sums[:, 4] += np.bincount(rows, minlength=n)
+        self.sums[:, 5] += np.bincount(rows, weights=headway, minlength=n)
+        self.sums[:, 6] += np.bincount(rows, weights=headway * headway, minlength=n)
+
+    def refresh(self, now=None):
+        """Fold in arrivals stored since the last refresh."""
+        now = now or time.time()
+        until = min(self.scan_end, now - WRITE_LAG_SECONDS)
+        with self.lock:
+            if until <= self.scanned_until:
+                return
+            rows = read_new("arrivals", self.scan_start, self.scan_end, self.offsets)
+            # Keep only the arrivals scheduled on this day
+            keep = (rows["scheduled"] >= self.start) & (rows["scheduled"] < self.end)
+            keep &= (rows["ts"] >= self.scan_start) & (rows["ts"] < self.scan_end)
+            self.add(
+                rows["route"][keep], rows["stop"][keep], rows["scheduled"][keep], rows["delay"][keep].astype(np.float64)
+            )
+            self.scanned_until = until
+
+
+# date -> DayReliability
+_days = {}
+_days_lock = threading.Lock()
+
+
+def get_day(day, now=None):
+    """Return a day's aggregates, brought up to date with the store."""
+    with _days_lock:
+        aggregates = _days.get(day)
+        if aggregates is None:
+            aggregates = _days[day] = DayReliability(day)
+            for old in sorted(_days)[:-CACHED_DAYS]:
+                del _days[old]
+    if not aggregates.is_complete():
+        aggregates.refresh(now)
+    return aggregates
+
+
+def _summarize(sums, histogram):
+    """Turn summed aggregates into the reported statistics."""
+    count, on_time, delay_sum, delay_sq, headway_count, headway_sum, headway_sq = sums.tolist()
+    if count == 0:
+        return None
+    cumulative = np.cumsum(histogram)
+    median_bin = int(np.searchsorted(cumulative, count / 2))
+    typical = MIN_DEVIATION + (median_bin - 0.5) * BIN_SECONDS
+    stats = {
+        "samples": int(count),
+        "on_time_pct": round(100 * on_time / count, 1),
+        "typical_delay_seconds": round(min(max(typical, MIN_DEVIATION), MIN_DEVIATION + (BIN_COUNT - 2) * BIN_SECONDS)),
+        "mean_delay_seconds": round(delay_sum / count),
+        "delay_stddev_seconds": round(max(0.0, delay_sq / count - (delay_sum / count) ** 2) ** 0.5),
+        "headway_mean_seconds": None,
+        "headway_variance": None
+    }
+    if headway_count >= 2:
+        mean = headway_sum / headway_count
+        stats["headway_mean_seconds"] = round(mean)
+        # Seconds squared
+        stats["headway_variance"] = round(max(0.0, headway_sq / headway_count - mean * mean))
+    return stats
+
+
+def get_reliability(route_id, stop_id=None, hour=None, days=1, now=None):
+    """
+    Reliability of a route over the last few days, overall and per stop and hour.
+
+    Args:
+        route_id (str): Route id (GTFS or OneBusAway form)
+        stop_id (str, optional): Only this stop
+        hour (int, optional): Only this hour of the day (scheduled, local time)
+        days (int, optional): Days to include, ending today. Defaults to 1.
+        now (float, optional): Reference unix time. Defaults to current time.
+
+    Returns:
+        dict: Summary statistics and a row per stop and hour
+    """
+    now = now or time.time()
+    route_id = local_id(route_id)
+    stop_id = local_id(stop_id) if stop_id else None
+    today = datetime.fromtimestamp(now, LOCAL_TIMEZONE).date()
+
+    # Sum the matching groups across days; every statistic is additive
+    sums = {}
+    histograms = {}
+    for offset in range(days):
+        aggregates = get_day(today - timedelta(days=offset), now)
+        with aggregates.lock:
+            for (route, stop, group_hour), row in aggregates.index.items():
+                if route != route_id or (stop_id and stop != stop_id) or (hour is not None and group_hour != hour):
+                    continue
+                key = (stop, group_hour)
+                if key in sums:
+                    sums[key] = sums[key] + aggregates.sums[row]
+                    histograms[key] = histograms[key] + aggregates.histograms[row]
+                else:
+                    sums[key] = aggregates.sums[row].copy()
+                    histograms[key] = aggregates.histograms[row].copy()
+
+    groups = []
+    for stop, group_hour in sorted(sums):
+        stats = _summarize(sums[(stop, group_hour)], histograms[(stop, group_hour)])
+        if stats:
+            groups.append({"stop_id": stop, "hour": group_hour, **stats})
+
+    summary = None
+    if sums:
+        summary = _summarize(sum(sums.values()), sum(histograms.values()))
+    return {
+        "route_id": route_id,
+        "stop_id": stop_id,
+        "hour": hour,
+        "days": days,
+        "on_time_window_seconds": [-ON_TIME_EARLY_SECONDS, ON_TIME_LATE_SECONDS],
+        "summary": summary,
+        "by_stop_hour": groups
+    }
@@ -0,0 +1,170 @@
+from datetime import datetime, timedelta
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+import threading
+import time
+
+from config import settings
+from utils.lazy import lazy_import
+from utils.polyline import encode_polyline
+from ..profiling import upstream, record_cache
+from .gtfs_service import agency_timezone
+
+requests = lazy_import("requests")
+
+TOMTOM_ROUTING_URL = "https://api.tomtom.com/routing/1/calculateRoute"
+
+# TomTom travel modes we proxy
+TRAVEL_MODES = ("car", "pedestrian", "bicycle")
+
+# Origins/destinations are snapped to ~100 m so nearby requests share a cache entry
+ROUTE_COORD_DECIMALS = 3
+ROUTE_DEPARTURE_BUCKET = 15 * 60  # seconds
+
+# Driving times depend on live traffic; walking and cycling routes barely change
+ROUTE_CACHE_TTL = {
+    "car": timedelta(minutes=10),
+    "pedestrian": timedelta(hours=24),
+    "bicycle": timedelta(hours=24)
+}
+ROUTE_CACHE_SIZE = 2048
+
+# Simple memory cache
+cache = {}
+cache_expiry = {}
+
+# In-flight upstream requests, so concurrent identical requests share one call
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def quantize(value, decimals=ROUTE_COORD_DECIMALS):
+    """Snap a coordinate to the route cache grid."""
+    return round(value, decimals)
+
+
+def route_cache_key(from_lat, from_lon, to_lat, to_lon, mode, depart_at):
+    """Build the cache key for a quantized route request."""
+    bucket = int(depart_at // ROUTE_DEPARTURE_BUCKET) if mode == "car" else 0
+    return (f"route_{quantize(from_lat)}_{quantize(from_lon)}_"
+            f"{quantize(to_lat)}_{quantize(to_lon)}_{mode}_{bucket}")
+
+
+def _fetch_route(from_lat, from_lon, to_lat, to_lon, mode, depart_at):
+    """Call the TomTom routing API and compact the first route."""
+    url = f"{TOMTOM_ROUTING_URL}/{from_lat},{from_lon}:{to_lat},{to_lon}/json"
+    params = {
+        "key": settings.TRAFFIC_API_KEY,
+        "traffic": "true" if mode == "car" else "false",
+        "computeBestOrder": "false",
+        "routeType": "fastest",
+        "travelMode": mode
+    }
+    if mode == "car" and depart_at > time.time() + 60:
+        # With its UTC offset, so TomTom doesn't read it in the server's zone
+        params["departAt"] = datetime.fromtimestamp(depart_at, agency_timezone()).isoformat(timespec="seconds")
+
+    with upstream("tomtom_routing") as call:
+        response = requests.get(url, params=params, timeout=10)
+        call["bytes"] = len(response.content)
+    response.raise_for_status()
+    data = response.json()
+
+    routes = data.get("routes", [])
+    if not routes:
+        return {"error": "No route found"}
+    route = routes[0]
+    summary = route.get("summary", {})
+
+    points = []
+    for leg in route.get("legs", []):
+        points.extend((pt["latitude"], pt["longitude"]) for pt in leg.get("points", []))
+
+    return {
+        "mode": mode,
+        "polyline": encode_polyline(points),
+        "eta_seconds": summary.get("travelTimeInSeconds"),
+        "distance_meters": summary.get("lengthInMeters"),
+        "traffic_delay_seconds": summary.get("trafficDelayInSeconds", 0),
+        "departure_time": summary.get("departureTime"),
+        "arrival_time": summary.get("arrivalTime"),
+        "timestamp": datetime.now().isoformat(),
+        "source": "tomtom"
+    }
+
+
+def _store(cache_key, route_data, mode):
+    # Evict the entries closest to expiry once the cache is full
+    if len(cache) >= ROUTE_CACHE_SIZE:
+        for old_key in sorted(cache_expiry, key=cache_expiry.get)[:ROUTE_CACHE_SIZE // 4]:
+            cache.pop(old_key, None)
+            cache_expiry.pop(old_key, None)
+    cache[cache_key] = route_data
+    cache_expiry[cache_key] = datetime.now() + ROUTE_CACHE_TTL[mode]
+
+
+def get_route(from_lat, from_lon, to_lat, to_lon, mode="car", depart_at=None):
+    """
+    Get a route between two points through the shared route cache.
+
+    Requests are quantized before hitting TomTom, so the cached answer is
+    valid for everyone in the same origin/destination cells and departure
+    bucket. Concurrent identical misses wait on a single upstream call.
+
+    Args:
+        from_lat (float): Origin latitude
+        from_lon (float): Origin longitude
+        to_lat (float): Destination latitude
+        to_lon (float): Destination longitude
+        mode (str, optional): car, pedestrian or bicycle. Defaults to "car".
+        depart_at (float, optional): Departure as unix time. Defaults to now.
+
+    Returns:
+        dict: Route with an encoded polyline, or {"error": ...}
+    """
+    if mode not in TRAVEL_MODES:
+        return {"error": f"Unsupported travel mode: {mode}"}
+
+    depart_at = depart_at or time.time()
+    cache_key = route_cache_key(from_lat, from_lon, to_lat, to_lon, mode, depart_at)
+
+    # Check cache
+    if cache_key in cache and cache_expiry.get(cache_key, datetime.min) > datetime.now():
+        record_cache("route", "hit")
+        return {**cache[cache_key], "cached": True}
+
+    with _inflight_lock:
+        future = _inflight.get(cache_key)
+        leader = future is None
+        if leader:
+            future = Future()
+            _inflight[cache_key] = future
+
+    if not leader:
+        record_cache("route", "coalesced")
+        try:
+            return {**future.result(timeout=15), "cached": True}
+        except FutureTimeoutError:
+            print(f"Timed out waiting for route {cache_key}")
+            return {"error": "Route request timed out"}
+
+    record_cache("route", "miss")
+
+    route_data = {"error": "Route request failed"}
+    try:
+        route_data = _fetch_route(
+            quantize(from_lat), quantize(from_lon), quantize(to_lat), quantize(to_lon), mode, depart_at
+        )
+        if "error" not in route_data:
+            _store(cache_key, route_data, mode)
+    except requests.exceptions.RequestException as e:
+        print(f"Network error fetching route: {e}")
+        route_data = {"error": f"Network error: {str(e)}"}
+    except Exception as e:
+        print(f"Unexpected error fetching route: {e}")
+        route_data = {"error": f"Unexpected error: {str(e)}"}
+    finally:
+        future.set_result(route_data)
+        with _inflight_lock:
+            _inflight.pop(cache_key, None)
+
+    return {**route_data, "cached": False}
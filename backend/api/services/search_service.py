@@ -0,0 +1,344 @@
+"""
+Autocomplete over GTFS stops, routes and users' saved places.
+
+Names are normalized into tokens ("3rd Ave & Pike St" -> "3rd ave and pike
+st") and indexed in a sorted vocabulary whose postings are laid out in
+vocabulary order, so every document containing a token with a given prefix
+is one contiguous slice. Typos are caught through a trigram index over the
+vocabulary, verified with a bounded edit distance.
+
+Every query token has to match. Matches score by quality (exact, prefix,
+fuzzy), and when the caller's position is known, nearby results get a
+distance boost so the stop down the street beats its namesake across town.
+"""
+from bisect import bisect_left
+from datetime import datetime, timedelta
+import re
+import time
+import unicodedata
+
+from utils.lazy import lazy_import
+from .gtfs_service import get_gtfs_dataset
+from . import user_store
+
+np = lazy_import("numpy")
+
+KINDS = ("stop", "route", "place")
+STOP, ROUTE, PLACE = range(len(KINDS))
+
+# Street-name words are indexed in one canonical form so either spelling matches
+ABBREVIATIONS = {
+    "street": "st", "avenue": "ave", "av": "ave", "boulevard": "blvd", "road": "rd", "drive": "dr",
+    "place": "pl", "court": "ct", "lane": "ln", "parkway": "pkwy", "highway": "hwy",
+    "north": "n", "south": "s", "east": "e", "west": "w", "northeast": "ne", "northwest": "nw",
+    "southeast": "se", "southwest": "sw", "station": "sta",
+    "first": "1st", "second": "2nd", "third": "3rd", "fourth": "4th", "fifth": "5th",
+    "&": "and", "@": "and",
+}
+
+# Match quality per query token
+EXACT_SCORE = 1.0
+PREFIX_SCORE = 0.85
+FUZZY_SCORE = 0.5  # minus FUZZY_STEP per edit
+FUZZY_STEP = 0.15
+
+# Distance boost: up to GEO_WEIGHT for results at the caller's position,
+# fading over GEO_SCALE_METERS. Smaller than the gap between an exact and
+# a fuzzy match, so distance reorders equally good matches only.
+GEO_WEIGHT = 0.5
+GEO_SCALE_METERS = 3000.0
+# The caller's own saved places rank ahead of equally good stops
+PLACE_BONUS = 0.5
+
+PLACE_INDEX_TTL = timedelta(minutes=10)
+EARTH_RADIUS = 6371000
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+|&|@")
+
+
+def normalize(text):
+    """Lowercase, strip accents and split into canonical tokens."""
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode("ascii").lower()
+    return [ABBREVIATIONS.get(token, token) for token in _TOKEN_RE.findall(text)]
+
+
+def _trigrams(token):
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_edits(token):
+    """Typos tolerated in a query token of this length."""
+    if len(token) < 4:
+        return 0
+    return 1 if len(token) < 8 else 2
+
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance, or limit + 1 once it's certain to exceed limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class SearchIndex:
+    """
+    Token index over a fixed set of documents.
+
+    Args:
+        kinds: Kind code per document (STOP, ROUTE or PLACE)
+        ids: Id per document
+        names: Display name per document
+        lats, lons: Position per document (NaN when it has none)
+        extras: Extra response fields per document
+    """
+
+    def __init__(self, kinds, ids, names, lats, lons, extras):
+        self.kinds = np.asarray(kinds, dtype=np.int8)
+        self.ids = ids
+        self.names = names
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.extras = extras
+
+        postings = {}
+        for doc, name in enumerate(names):
+            for token in set(normalize(name)):
+                postings.setdefault(token, []).append(doc)
+        self.vocabulary = sorted(postings)
+        # Postings in vocabulary order: tokens sharing a prefix are one slice
+        lengths = [len(postings[token]) for token in self.vocabulary]
+        self.offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        self.docs = np.fromiter(
+            (doc for token in self.vocabulary for doc in postings[token]), dtype=np.int32, count=int(self.offsets[-1])
+        )
+
+        trigram_tokens = {}
+        for token_id, token in enumerate(self.vocabulary):
+            for trigram in _trigrams(token):
+                trigram_tokens.setdefault(trigram, []).append(token_id)
+        self.trigrams = {trigram: np.array(ids, dtype=np.int32) for trigram, ids in trigram_tokens.items()}
+
+    def __len__(self):
+        return len(self.names)
+
+    def _prefix_range(self, prefix):
+        lo = bisect_left(self.vocabulary, prefix)
+        hi = bisect_left(self.vocabulary, prefix + "\x7f", lo)
+        return lo, hi
+
+    def _fuzzy_tokens(self, token, as_prefix):
+        """Vocabulary ids within max_edits of a token (or of its start, for prefixes)."""
+        limit = max_edits(token)
+        if limit == 0:
+            return []
+        grams = [self.trigrams[g] for g in _trigrams(token) if g in self.trigrams]
+        if not grams:
+            return []
+        # Each edit breaks at most three trigrams
+        shared = np.bincount(np.concatenate(grams), minlength=len(self.vocabulary))
+        candidates = np.flatnonzero(shared >= max(1, len(_trigrams(token)) - 3 * limit - (2 if as_prefix else 0)))
+        matches = []
+        for token_id in candidates.tolist():
+            word = self.vocabulary[token_id]
+            distance = edit_distance(token, word, limit)
+            if as_prefix and distance > limit:
+                # "pik" should still find "pike": compare against the word's start
+                distance = min(edit_distance(token, word[:n], limit) for n in (len(token) - 1, len(token), len(token) + 1))
+            if 0 < distance <= limit:
+                matches.append((token_id, distance))
+        return matches
+
+    def token_scores(self, token, as_prefix):
+        """Best match score per document for one query token (0 where it doesn't match)."""
+        scores = np.zeros(len(self), dtype=np.float64)
+        lo, hi = self._prefix_range(token)
+        if as_prefix and hi > lo:
+            scores[self.docs[self.offsets[lo]:self.offsets[hi]]] = PREFIX_SCORE
+        if lo < len(self.vocabulary) and self.vocabulary[lo] == token:
+            scores[self.docs[self.offsets[lo]:self.offsets[lo + 1]]] = EXACT_SCORE
+        for token_id, distance in self._fuzzy_tokens(token, as_prefix):
+            docs = self.docs[self.offsets[token_id]:self.offsets[token_id + 1]]
+            scores[docs] = np.maximum(scores[docs], FUZZY_SCORE - FUZZY_STEP * (distance - 1))
+        return scores
+
+    def search(self, tokens, lat=None, lon=None, kinds=None, limit=10):
+        """
+        Rank documents for a tokenized query.
+
+        Returns:
+            list: (document, score, distance meters or None) for the best matches
+        """
+        if not tokens or len(self) == 0:
+            return []
+        total = np.zeros(len(self), dtype=np.float64)
+        matched = np.ones(len(self), dtype=bool)
+        for i, token in enumerate(tokens):
+            # Only the token being typed is completed; earlier ones are whole words
+            scores = self.token_scores(token, as_prefix=(i == len(tokens) - 1))
+            matched &= scores > 0
+            total += scores
+        if kinds is not None:
+            matched &= np.isin(self.kinds, list(kinds))
+        candidates = np.flatnonzero(matched)
+        if len(candidates) == 0:
+            return []
+
+        score = total[candidates]
+        score += np.where(self.kinds[candidates] == PLACE, PLACE_BONUS, 0.0)
+        distance = np.full(len(candidates), np.nan)
+        if lat is not None and lon is not None:
+            distance = _haversine(lat, lon, self.lats[candidates], self.lons[candidates])
+            score += np.where(np.isnan(distance), 0.0, GEO_WEIGHT * np.exp(-np.nan_to_num(distance) / GEO_SCALE_METERS))
+
+        order = np.argsort(-score, kind="stable")[:limit]
+        return [
+            (int(candidates[i]), float(score[i]), None if np.isnan(distance[i]) else float(distance[i]))
+            for i in order.tolist()
+        ]
+
+
+def _haversine(lat, lon, lats, lons):
+    dlat = np.radians(lats - lat)
+    dlon = np.radians(lons - lon)
+    a = np.sin(dlat / 2) ** 2 + np.cos(np.radians(lat)) * np.cos(np.radians(lats)) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+
+def build_transit_index(ds):
+    """Index every stop and route of a GTFS dataset."""
+    kinds, ids, names, lats, lons, extras = [], [], [], [], [], []
+    for stop_idx, stop_id in enumerate(ds.stop_ids):
+        kinds.append(STOP)
+        ids.append(stop_id)
+        names.append(ds.stop_names[stop_idx])
+        extras.append(None)
+    lats.extend(ds.stop_lat.tolist())
+    lons.extend(ds.stop_lon.tolist())
+
+    # Place each route at the middle of the stops it serves
+    stop_route = ds.trip_route[ds.st_trip]
+    served = np.unique(np.stack([stop_route, ds.st_stop], axis=1), axis=0)
+    counts = np.bincount(served[:, 0], minlength=len(ds.route_ids))
+    route_lat = np.bincount(served[:, 0], weights=ds.stop_lat[served[:, 1]], minlength=len(ds.route_ids))
+    route_lon = np.bincount(served[:, 0], weights=ds.stop_lon[served[:, 1]], minlength=len(ds.route_ids))
+    for route_idx, route_id in enumerate(ds.route_ids):
+        short_name, long_name = ds.route_short_names[route_idx], ds.route_long_names[route_idx]
+        kinds.append(ROUTE)
+        ids.append(route_id)
+        names.append(" ".join(part for part in (short_name, long_name) if part))
+        served_count = counts[route_idx]
+        lats.append(route_lat[route_idx] / served_count if served_count else np.nan)
+        lons.append(route_lon[route_idx] / served_count if served_count else np.nan)
+        extras.append({"short_name": short_name, "long_name": long_name})
+    return SearchIndex(kinds, ids, names, lats, lons, extras)
+
+
+# user id -> (SearchIndex over their saved places, built at)
+_place_indexes = {}
+
+
+def _build_logged_transit_index(ds):
+    started = time.perf_counter()
+    index = build_transit_index(ds)
+    print(f"Built search index: {len(index)} documents, "
+          f"{len(index.vocabulary)} tokens in {time.perf_counter() - started:.2f}s")
+    return index
+
+
+def get_transit_index():
+    """Return the stop/route index for the current GTFS dataset, building it on first use."""
+    ds = get_gtfs_dataset()
+    if ds is None:
+        return None
+    return ds.derived_value("search_index", _build_logged_transit_index)
+
+
+def get_place_index(user_id):
+    """Return the index over a user's saved places."""
+    entry = _place_indexes.get(user_id)
+    if entry is not None and entry[1] > datetime.now() - PLACE_INDEX_TTL:
+        return entry[0]
+    places = user_store.list_saved_places(user_id)
+    index = SearchIndex(
+        [PLACE] * len(places),
+        [place["id"] for place in places],
+        [place["name"] for place in places],
+        [place["lat"] for place in places],
+        [place["lon"] for place in places],
+        [{"address": place.get("address"), "category": place.get("category")} for place in places]
+    )
+    _place_indexes[user_id] = (index, datetime.now())
+    return index
+
+
+def invalidate_places(user_id):
+    """Drop a user's cached place index after their places change."""
+    _place_indexes.pop(user_id, None)
+
+
+def search(query, lat=None, lon=None, user_id=None, kinds=None, limit=10):
+    """
+    Autocomplete stops, routes and (for a signed-in user) saved places.
+
+    Args:
+        query (str): Text typed so far
+        lat (float, optional): Caller latitude, to rank nearby results first
+        lon (float, optional): Caller longitude
+        user_id (int, optional): Include this user's saved places
+        kinds (iterable, optional): Restrict to these kinds ("stop", "route", "place")
+        limit (int, optional): Maximum results. Defaults to 10.
+
+    Returns:
+        dict: Ranked results, and whether the transit index is still loading
+    """
+    started = time.perf_counter()
+    tokens = normalize(query)
+    kind_codes = None if kinds is None else {KINDS.index(kind) for kind in kinds}
+
+    indexes = []
+    transit_index = get_transit_index()
+    if transit_index is not None and (kind_codes is None or kind_codes & {STOP, ROUTE}):
+        indexes.append(transit_index)
+    if user_id is not None and (kind_codes is None or PLACE in kind_codes):
+        indexes.append(get_place_index(user_id))
+
+    hits = []
+    for index in indexes:
+        for doc, score, distance in index.search(tokens, lat, lon, kind_codes, limit):
+            hits.append((score, index, doc, distance))
+    hits.sort(key=lambda hit: -hit[0])
+
+    results = []
+    for score, index, doc, distance in hits[:limit]:
+        result = {
+            "type": KINDS[index.kinds[doc]],
+            "id": index.ids[doc],
+            "name": index.names[doc],
+            "lat": None if np.isnan(index.lats[doc]) else float(index.lats[doc]),
+            "lon": None if np.isnan(index.lons[doc]) else float(index.lons[doc]),
+            "distance_meters": None if distance is None else round(distance),
+            "score": round(score, 3)
+        }
+        if index.extras[doc]:
+            result.update(index.extras[doc])
+        results.append(result)
+
+    return {
+        "query": query,
+        "results": results,
+        "transit_loading": transit_index is None,
+        "took_ms": round((time.perf_counter() - started) * 1000, 2)
+    }
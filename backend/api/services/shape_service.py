@@ -0,0 +1,280 @@
+"""
+Simplified route geometry from GTFS shapes.txt.
+
+Each shape gets a Douglas-Peucker importance per point, once per dataset:
+the largest tolerance at which the point still survives simplification.
+Simplifying for a zoom level is then a threshold on that array, so every
+zoom costs one pass over the shape. Encoded polylines per (route, zoom)
+are cached for the life of the dataset, and a background thread fills the
+cache for every route and zoom when a dataset's shapes are first used.
+"""
+from math import cos, radians
+import threading
+import time
+
+from utils.lazy import lazy_import
+from utils.polyline import encode_polyline
+from .gtfs_service import get_gtfs_dataset
+from .delay_service import local_id
+
+np = lazy_import("numpy")
+
+SHAPE_MIN_ZOOM = 8
+SHAPE_MAX_ZOOM = 16
+# Allowed deviation, in screen pixels on 256 px tiles
+TOLERANCE_PIXELS = 1.0
+METERS_PER_PIXEL_ZOOM_0 = 156543.03
+# Points closer than this to the simplified line are dropped at every zoom,
+# which also stops the importance pass from descending into straight runs
+MIN_TOLERANCE_METERS = 0.5
+# Variants of a route within this many pixels of shapes already drawn are left out
+COVERAGE_PIXELS = 3
+
+# Route geometry only changes with the GTFS dataset
+SHAPE_MAX_AGE = 3600
+
+EARTH_RADIUS = 6371000
+
+_warm_thread = None
+
+
+def tolerance_meters(zoom, lat):
+    """Simplification tolerance for a zoom level at a latitude."""
+    return max(MIN_TOLERANCE_METERS, TOLERANCE_PIXELS * METERS_PER_PIXEL_ZOOM_0 * cos(radians(lat)) / 2 ** zoom)
+
+
+def douglas_peucker_importance(x, y, min_tolerance=MIN_TOLERANCE_METERS):
+    """
+    Douglas-Peucker importance of every point of a line (planar coordinates).
+
+    A point is kept by Douglas-Peucker at tolerance t exactly when its
+    importance is above t. Endpoints are infinitely important; points that
+    never matter above min_tolerance get 0.
+
+    Returns:
+        numpy.ndarray: Importance per point, in the units of x and y
+    """
+    n = len(x)
+    importance = np.zeros(n, dtype=np.float64)
+    importance[0] = importance[-1] = np.inf
+    stack = [(0, n - 1, np.inf)]
+    while stack:
+        first, last, parent = stack.pop()
+        if last - first < 2:
+            continue
+        ax, ay = x[first], y[first]
+        dx, dy = x[last] - ax, y[last] - ay
+        px, py = x[first + 1:last] - ax, y[first + 1:last] - ay
+        # Distance to the segment rather than the infinite line, so loops
+        # (first point == last point) still simplify sensibly
+        length_sq = dx * dx + dy * dy
+        t = np.clip((px * dx + py * dy) / length_sq, 0.0, 1.0) if length_sq > 0 else 0.0
+        distances = np.hypot(px - t * dx, py - t * dy)
+        i = int(np.argmax(distances))
+        if distances[i] <= min_tolerance:
+            continue
+        # A point can't outlive the split that exposed it
+        value = min(float(distances[i]), parent)
+        middle = first + 1 + i
+        importance[middle] = value
+        stack.append((first, middle, value))
+        stack.append((middle, last, value))
+    return importance
+
+
+def _densify(x, y, step):
+    """Points along a line no more than step apart."""
+    dx, dy = np.diff(x), np.diff(y)
+    counts = np.maximum(1, np.ceil(np.hypot(dx, dy) / step).astype(np.int64))
+    segments = np.repeat(np.arange(len(dx)), counts)
+    fraction = (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)) / np.repeat(counts, counts)
+    return (
+        np.append(x[segments] + fraction * dx[segments], x[-1]),
+        np.append(y[segments] + fraction * dy[segments], y[-1])
+    )
+
+
+def _cells(x, y, size):
+    """Grid cell codes of points."""
+    return (np.floor(y / size).astype(np.int64) << 32) + np.floor(x / size).astype(np.int64)
+
+
+class RouteShapes:
+    """
+    The shapes of a GtfsDataset grouped by route, with per-point
+    simplification importance computed on first use.
+    """
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        ds = dataset
+        # Planar projection (meters) around the middle of the feed
+        self.ref_lat = float(np.mean(ds.stop_lat)) if len(ds.stop_ids) else 0.0
+        self.x_scale = np.pi / 180 * EARTH_RADIUS * cos(radians(self.ref_lat))
+        self.y_scale = np.pi / 180 * EARTH_RADIUS
+
+        # route index -> shape indices, most used first
+        counts = {}
+        for trip_idx, shape_id in enumerate(ds.trip_shape_ids):
+            shape_idx = ds.shape_index.get(shape_id)
+            if shape_idx is not None:
+                key = (int(ds.trip_route[trip_idx]), shape_idx)
+                counts[key] = counts.get(key, 0) + 1
+        self.route_shapes = {}
+        for (route_idx, shape_idx), _ in sorted(counts.items(), key=lambda item: -item[1]):
+            self.route_shapes.setdefault(route_idx, []).append(shape_idx)
+
+        self.importance = [None] * len(ds.shape_ids)
+        self.polylines = {}  # (route index, zoom) -> encoded polylines
+        self.all_routes = {}  # zoom -> payload for every route
+
+    def points(self, shape_idx):
+        """A shape's (lats, lons)."""
+        lo, hi = self.dataset.shape_offsets[shape_idx], self.dataset.shape_offsets[shape_idx + 1]
+        return self.dataset.shape_lat[lo:hi], self.dataset.shape_lon[lo:hi]
+
+    def project(self, lats, lons):
+        return lons * self.x_scale, lats * self.y_scale
+
+    def shape_importance(self, shape_idx):
+        importance = self.importance[shape_idx]
+        if importance is None:
+            importance = douglas_peucker_importance(*self.project(*self.points(shape_idx)))
+            self.importance[shape_idx] = importance
+        return importance
+
+    def simplified(self, shape_idx, tolerance):
+        """A shape's (lats, lons) simplified to a tolerance in meters."""
+        lats, lons = self.points(shape_idx)
+        if len(lats) < 3:
+            return lats, lons
+        keep = self.shape_importance(shape_idx) > tolerance
+        return lats[keep], lons[keep]
+
+    def route_polylines(self, route_idx, zoom):
+        """
+        Encoded polylines drawing a route at a zoom level.
+
+        Shapes are taken most-used first; a variant that stays within
+        COVERAGE_PIXELS of what's already drawn adds nothing visible at this
+        zoom and is left out.
+        """
+        key = (route_idx, zoom)
+        polylines = self.polylines.get(key)
+        if polylines is not None:
+            return polylines
+
+        tolerance = tolerance_meters(zoom, self.ref_lat)
+        cell = COVERAGE_PIXELS * tolerance
+        covered = np.zeros(0, dtype=np.int64)
+        polylines = []
+        for shape_idx in self.route_shapes.get(route_idx, []):
+            lats, lons = self.simplified(shape_idx, tolerance)
+            if len(lats) < 2:
+                continue
+            x, y = _densify(*self.project(lats, lons), cell)
+            cells = np.unique(_cells(x, y, cell))
+            if len(covered):
+                near = np.zeros(len(cells), dtype=bool)
+                for row in (-1, 0, 1):
+                    for col in (-1, 0, 1):
+                        near |= np.isin(cells + (row << 32) + col, covered)
+                if near.all():
+                    continue
+            covered = np.union1d(covered, cells)
+            polylines.append(encode_polyline(zip(lats.tolist(), lons.tolist())))
+        self.polylines[key] = polylines
+        return polylines
+
+    def route_payload(self, route_idx, zoom):
+        ds = self.dataset
+        return {
+            "route_id": ds.route_ids[route_idx],
+            "short_name": ds.route_short_names[route_idx],
+            "long_name": ds.route_long_names[route_idx],
+            "color": ds.route_colors[route_idx],
+            "text_color": ds.route_text_colors[route_idx],
+            "polylines": self.route_polylines(route_idx, zoom)
+        }
+
+
+def _warm(route_shapes):
+    started = time.time()
+    for zoom in range(SHAPE_MIN_ZOOM, SHAPE_MAX_ZOOM + 1):
+        for route_idx in route_shapes.route_shapes:
+            # A newer dataset replaced this one
+            if route_shapes.dataset.retired:
+                return
+            route_shapes.route_polylines(route_idx, zoom)
+    print(f"Simplified {len(route_shapes.importance)} shapes for zooms {SHAPE_MIN_ZOOM}-{SHAPE_MAX_ZOOM} "
+          f"in {time.time() - started:.1f}s")
+
+
+def build_route_shapes(ds):
+    """Group a dataset's shapes and start simplifying them for every zoom in the background."""
+    global _warm_thread
+    route_shapes = RouteShapes(ds)
+    _warm_thread = threading.Thread(target=_warm, args=(route_shapes,), name="shape-simplify", daemon=True)
+    _warm_thread.start()
+    return route_shapes
+
+
+def get_route_shapes(ds=None):
+    """Return the RouteShapes for a dataset (default: the current one), or None while it's loading."""
+    ds = ds or get_gtfs_dataset()
+    if ds is None:
+        return None
+    return ds.derived_value("route_shapes", build_route_shapes)
+
+
+def clamp_zoom(zoom):
+    return min(SHAPE_MAX_ZOOM, max(SHAPE_MIN_ZOOM, zoom))
+
+
+def get_route_shape(route_id, zoom):
+    """
+    Get a route's geometry simplified for a zoom level.
+
+    Args:
+        route_id (str): Route id (GTFS or OneBusAway form)
+        zoom (int): Map zoom level; clamped to SHAPE_MIN_ZOOM..SHAPE_MAX_ZOOM
+
+    Returns:
+        dict or None: Route details with encoded polylines, an error for
+            an unknown route, or None while the GTFS dataset is loading
+    """
+    route_shapes = get_route_shapes()
+    if route_shapes is None:
+        return None
+    route_idx = route_shapes.dataset.route_index.get(local_id(route_id))
+    if route_idx is None:
+        return {"error": "Unknown route"}
+    zoom = clamp_zoom(zoom)
+    return {"zoom": zoom, **route_shapes.route_payload(route_idx, zoom)}
+
+
+def get_all_route_shapes(zoom):
+    """
+    Get every route's geometry simplified for a zoom level.
+
+    The payload is built once per zoom and dataset, and the same object is
+    returned afterwards so its encoded body is cached too.
+
+    Returns:
+        dict or None: {"zoom", "routes"}, or None while the GTFS dataset is loading
+    """
+    route_shapes = get_route_shapes()
+    if route_shapes is None:
+        return None
+    zoom = clamp_zoom(zoom)
+    payload = route_shapes.all_routes.get(zoom)
+    if payload is None:
+        payload = {
+            "zoom": zoom,
+            "routes": [
+                route_shapes.route_payload(route_idx, zoom)
+                for route_idx in sorted(route_shapes.route_shapes)
+            ]
+        }
+        route_shapes.all_routes[zoom] = payload
+    return payload
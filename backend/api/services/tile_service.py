@@ -0,0 +1,319 @@
+"""
+Vector tiles for the transit and traffic map layers.
+
+Stops and route lines come from the static GTFS dataset, so their tiles
+only change when the dataset is reloaded. Tiles up to
+TILE_PRERENDER_MAX_ZOOM over the feed's area are rendered on a background
+thread once the dataset loads and kept until the next one; other tiles
+are rendered on first request into a bounded cache. Incident tiles are
+cut from one traffic query per INCIDENT_QUERY_ZOOM tile and re-rendered
+only when that traffic entry changes.
+"""
+from math import ceil, cos, radians
+import threading
+import time
+
+from config import settings
+from utils.lazy import lazy_import
+from utils.mvt import encode_tile, lonlat_to_tile, tile_bounds, clip_line, POINT, LINESTRING, DEFAULT_EXTENT
+from .gtfs_service import get_gtfs_dataset
+from .shape_service import get_route_shapes, tolerance_meters
+from .traffic_service import get_traffic_data, traffic_cache_key, TRAFFIC_COORD_DECIMALS
+
+np = lazy_import("numpy")
+
+MAX_ZOOM = 18
+# Pixels drawn beyond each tile edge, so symbols and lines crossing it aren't cut off
+TILE_BUFFER = 64
+# Layers start at these zooms; below them they'd be an unreadable smear
+ROUTE_MIN_ZOOM = 8
+STOP_MIN_ZOOM = 13
+INCIDENT_MIN_ZOOM = 10
+# Incident tiles are cut from one traffic query per tile at this zoom, so
+# panning and zooming inside it never calls TomTom again
+INCIDENT_QUERY_ZOOM = 10
+
+# Transit tiles only change with the GTFS dataset
+TRANSIT_TILE_MAX_AGE = 3600
+
+_prerender_thread = None
+
+# (z, x, y) -> (traffic data the tile was cut from, bytes)
+_incident_tiles = {}
+
+
+def valid_tile(z, x, y):
+    """Check tile coordinates are in range."""
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def _buffered_bounds(z, x, y):
+    """Tile bounds widened by TILE_BUFFER pixels."""
+    west, south, east, north = tile_bounds(z, x, y)
+    pad_lon = (east - west) * TILE_BUFFER / DEFAULT_EXTENT
+    pad_lat = (north - south) * TILE_BUFFER / DEFAULT_EXTENT
+    return west - pad_lon, south - pad_lat, east + pad_lon, north + pad_lat
+
+
+def _clip(lats, lons, z, x, y):
+    """Project a line into a tile and clip it to the buffered tile."""
+    px, py = lonlat_to_tile(lats, lons, z, x, y)
+    return clip_line(list(zip(px.tolist(), py.tolist())), -TILE_BUFFER, DEFAULT_EXTENT + TILE_BUFFER)
+
+
+def build_route_lines(route_shapes):
+    """
+    Lines to draw for every route: its GTFS shapes, or for routes without
+    shapes the stop-to-stop path of each distinct stop pattern, skipping
+    patterns whose every hop is already drawn by a longer pattern.
+
+    Returns:
+        tuple: (route index per line, [(lats, lons, shape index or None)] per line,
+            (n, 4) bounding boxes as west, south, east, north)
+    """
+    ds = route_shapes.dataset
+    line_routes, lines, boxes = [], [], []
+    for route_idx, shapes in route_shapes.route_shapes.items():
+        for shape_idx in shapes:
+            lats, lons = route_shapes.points(shape_idx)
+            if len(lats) < 2:
+                continue
+            line_routes.append(route_idx)
+            lines.append((lats, lons, shape_idx))
+            boxes.append((lons.min(), lats.min(), lons.max(), lats.max()))
+
+    offsets = ds.trip_offsets
+    patterns = {}
+    for trip_idx in range(len(ds.trip_ids)):
+        lo, hi = offsets[trip_idx], offsets[trip_idx + 1]
+        route_idx = int(ds.trip_route[trip_idx])
+        if hi - lo >= 2 and route_idx not in route_shapes.route_shapes:
+            patterns.setdefault(ds.st_stop[lo:hi].tobytes(), (route_idx, lo, hi))
+
+    by_route = {}
+    for route_idx, lo, hi in patterns.values():
+        by_route.setdefault(route_idx, []).append(ds.st_stop[lo:hi])
+
+    for route_idx, stop_lists in by_route.items():
+        drawn = set()
+        for stops in sorted(stop_lists, key=len, reverse=True):
+            hops = set(zip(stops[:-1].tolist(), stops[1:].tolist()))
+            if hops <= drawn:
+                continue
+            drawn |= hops
+            lats, lons = ds.stop_lat[stops], ds.stop_lon[stops]
+            line_routes.append(route_idx)
+            lines.append((lats, lons, None))
+            boxes.append((lons.min(), lats.min(), lons.max(), lats.max()))
+    return np.array(line_routes, dtype=np.int32), lines, np.array(boxes, dtype=np.float64).reshape(-1, 4)
+
+
+def render_transit_tile(route_shapes, route_lines, z, x, y):
+    """Encode the "routes" and "stops" layers of one tile."""
+    ds = route_shapes.dataset
+    west, south, east, north = _buffered_bounds(z, x, y)
+    layers = []
+
+    if z >= ROUTE_MIN_ZOOM:
+        line_routes, lines, boxes = route_lines
+        hits = np.flatnonzero(
+            (boxes[:, 0] <= east) & (boxes[:, 2] >= west) & (boxes[:, 1] <= north) & (boxes[:, 3] >= south)
+        )
+        tolerance = tolerance_meters(z, route_shapes.ref_lat)
+        features = []
+        for line_idx in hits.tolist():
+            lats, lons, shape_idx = lines[line_idx]
+            if shape_idx is not None:
+                # Shapes carry far more points than a tile at this zoom can show
+                lats, lons = route_shapes.simplified(shape_idx, tolerance)
+            parts = _clip(lats, lons, z, x, y)
+            if not parts:
+                continue
+            route_idx = int(line_routes[line_idx])
+            features.append({
+                "id": line_idx,
+                "type": LINESTRING,
+                "geometry": parts,
+                "properties": {
+                    "route_id": ds.route_ids[route_idx],
+                    "short_name": ds.route_short_names[route_idx],
+                    "long_name": ds.route_long_names[route_idx],
+                    "route_type": int(ds.route_types[route_idx]),
+                    "color": ds.route_colors[route_idx],
+                    "text_color": ds.route_text_colors[route_idx]
+                }
+            })
+        layers.append(("routes", features))
+
+    if z >= STOP_MIN_ZOOM:
+        stops = np.flatnonzero(
+            (ds.stop_lon >= west) & (ds.stop_lon <= east) & (ds.stop_lat >= south) & (ds.stop_lat <= north)
+        )
+        px, py = lonlat_to_tile(ds.stop_lat[stops], ds.stop_lon[stops], z, x, y)
+        layers.append(("stops", [
+            {
+                "id": stop_idx,
+                "type": POINT,
+                "geometry": [[(sx, sy)]],
+                "properties": {"stop_id": ds.stop_ids[stop_idx], "name": ds.stop_names[stop_idx]}
+            }
+            for stop_idx, sx, sy in zip(stops.tolist(), px.tolist(), py.tolist())
+        ]))
+
+    return encode_tile(layers)
+
+
+def _covering_ranges(ds, z):
+    """Column and row ranges of the tiles at zoom z covering the dataset's stops."""
+    n = 2 ** z
+    left, top = lonlat_to_tile(ds.stop_lat.max(), ds.stop_lon.min(), z, 0, 0, 1)
+    right, bottom = lonlat_to_tile(ds.stop_lat.min(), ds.stop_lon.max(), z, 0, 0, 1)
+    xs = range(max(0, int(left)), min(n - 1, int(right)) + 1)
+    ys = range(max(0, int(top)), min(n - 1, int(bottom)) + 1)
+    return xs, ys
+
+
+def _tiles_covering(ds, z):
+    """Tiles at zoom z covering the dataset's stops."""
+    xs, ys = _covering_ranges(ds, z)
+    return [(x, y) for x in xs for y in ys]
+
+
+class TransitTiles:
+    """Route lines and rendered transit tiles for one GTFS dataset."""
+
+    def __init__(self, route_shapes):
+        self.route_shapes = route_shapes
+        self.route_lines = build_route_lines(route_shapes)
+        self.prerendered = {}  # (z, x, y) -> bytes, kept for the life of the dataset
+        self.rendered = {}  # every other tile, bounded by TILE_CACHE_SIZE
+        # Zoom -> (xs, ys) of the tiles kept in prerendered
+        self.covering = {
+            z: _covering_ranges(route_shapes.dataset, z)
+            for z in range(ROUTE_MIN_ZOOM, settings.TILE_PRERENDER_MAX_ZOOM + 1)
+        }
+
+    def is_prerendered(self, z, x, y):
+        """Whether a tile is one of the feed-area tiles kept for the life of the dataset."""
+        ranges = self.covering.get(z)
+        return ranges is not None and x in ranges[0] and y in ranges[1]
+
+    def tile(self, z, x, y):
+        key = (z, x, y)
+        tile = self.prerendered.get(key)
+        if tile is None:
+            tile = self.rendered.get(key)
+        if tile is None:
+            tile = render_transit_tile(self.route_shapes, self.route_lines, z, x, y)
+            if self.is_prerendered(z, x, y):
+                # Asked for before the prerender got there
+                self.prerendered[key] = tile
+            else:
+                if len(self.rendered) >= settings.TILE_CACHE_SIZE:
+                    self.rendered.pop(next(iter(self.rendered)), None)
+                self.rendered[key] = tile
+        return tile
+
+    def prerender(self):
+        started = time.time()
+        count = 0
+        ds = self.route_shapes.dataset
+        for z in range(ROUTE_MIN_ZOOM, settings.TILE_PRERENDER_MAX_ZOOM + 1):
+            for x, y in _tiles_covering(ds, z):
+                # A newer dataset replaced this one
+                if ds.retired:
+                    return
+                if (z, x, y) not in self.prerendered:
+                    self.prerendered[(z, x, y)] = render_transit_tile(self.route_shapes, self.route_lines, z, x, y)
+                    count += 1
+        print(f"Pre-rendered {count} transit tiles in {time.time() - started:.1f}s")
+
+
+def build_transit_tiles(ds):
+    """Set up a dataset's transit tiles and start pre-rendering them in the background."""
+    global _prerender_thread
+    tiles = TransitTiles(get_route_shapes(ds))
+    _prerender_thread = threading.Thread(target=tiles.prerender, name="tile-prerender", daemon=True)
+    _prerender_thread.start()
+    return tiles
+
+
+def get_transit_tile(z, x, y):
+    """
+    Get the transit vector tile z/x/y: a "routes" layer from zoom 8 and a
+    "stops" layer from zoom 13.
+
+    Returns:
+        bytes or None: The tile (empty when there's nothing to draw), or
+            None while the GTFS dataset is still loading
+    """
+    ds = get_gtfs_dataset()
+    if ds is None:
+        return None
+    return ds.derived_value("transit_tiles", build_transit_tiles).tile(z, x, y)
+
+
+def incident_query(z, x, y):
+    """The traffic query (lat, lon, radius) covering a tile's INCIDENT_QUERY_ZOOM ancestor."""
+    shift = z - INCIDENT_QUERY_ZOOM
+    west, south, east, north = tile_bounds(INCIDENT_QUERY_ZOOM, x >> shift, y >> shift)
+    lat = round((south + north) / 2, TRAFFIC_COORD_DECIMALS)
+    lon = round((west + east) / 2, TRAFFIC_COORD_DECIMALS)
+    # The traffic bounding box is a square of side 2 * radius; round up to whole kilometres
+    half_side = max((north - south) / 2 * 111111, (east - west) / 2 * 111111 * cos(radians(lat)))
+    return lat, lon, int(ceil((half_side + 1000) / 1000) * 1000)
+
+
+def render_incident_tile(incidents, z, x, y):
+    """Encode the "incidents" layer of one tile."""
+    west, south, east, north = _buffered_bounds(z, x, y)
+    features = []
+    for feature_id, incident in enumerate(incidents):
+        if len(incident.geometry) >= 4:
+            parts = _clip(np.array(incident.geometry[1::2]), np.array(incident.geometry[0::2]), z, x, y)
+            kind = LINESTRING
+        elif west <= incident.lon <= east and south <= incident.lat <= north:
+            parts = [[lonlat_to_tile(incident.lat, incident.lon, z, x, y)]]
+            kind = POINT
+        else:
+            continue
+        if not parts:
+            continue
+        features.append({
+            "id": feature_id,
+            "type": kind,
+            "geometry": parts,
+            "properties": {
+                "id": incident.id,
+                "type": incident.type,
+                "magnitude": incident.magnitude,
+                "delay": incident.delay,
+                "description": incident.description
+            }
+        })
+    return encode_tile([("incidents", features)])
+
+
+def get_incident_tile(z, x, y):
+    """
+    Get the traffic incidents vector tile z/x/y (empty below zoom 10).
+
+    Returns:
+        dict: {"tile": bytes, "cache_key": traffic cache key or None}, or an error
+    """
+    if z < INCIDENT_MIN_ZOOM:
+        return {"tile": b"", "cache_key": None}
+    lat, lon, radius = incident_query(z, x, y)
+    traffic = get_traffic_data(lat, lon, radius)
+    if "error" in traffic:
+        return traffic
+
+    key = (z, x, y)
+    entry = _incident_tiles.get(key)
+    # The traffic cache hands back the same dict until it refreshes
+    if entry is None or entry[0] is not traffic:
+        entry = (traffic, render_incident_tile(traffic["incidents"], z, x, y))
+        if len(_incident_tiles) >= settings.TILE_CACHE_SIZE:
+            _incident_tiles.pop(next(iter(_incident_tiles)), None)
+        _incident_tiles[key] = entry
+    return {"tile": entry[1], "cache_key": traffic_cache_key(lat, lon, radius)}
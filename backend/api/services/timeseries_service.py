@@ -0,0 +1,512 @@
+"""
+Append-only columnar store for historical observations.
+
+Services hand rows to record(), which only queues them; a background writer
+thread batches the queue every TIMESERIES_FLUSH_SECONDS and appends each
+column to its own file:
+
+    <root>/<series>/<YYYY-MM-DD>/<cell>/<column>.bin
+
+Days are UTC. Series with a position are split into 0.1 degree geo cells;
+arrivals are looked up by route and stop, so they only split by day.
+Each partition also keeps its committed row count in a ROWS_FILE, updated
+only after every column of a batch is written. Readers stop at that count,
+so a batch caught half-written is simply not visible yet, and a batch that
+fails partway is cut off every column before the next one is appended.
+Appends hold an flock on the partition's LOCK_FILE, so several worker
+processes can share a store without cutting off each other's rows.
+
+The writer also compacts old days: partitions older than
+TIMESERIES_COMPACT_AFTER_DAYS are downsampled to one row per key and
+TIMESERIES_COMPACT_BUCKET_SECONDS, and days past TIMESERIES_RETENTION_DAYS
+are deleted.
+"""
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+import fcntl
+import os
+import queue
+import shutil
+import threading
+import time
+
+from config import settings
+from utils.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+# Columns per series, in the order record() rows are given. Strings are
+# fixed-width bytes so every column is a flat array.
+SERIES = {
+    "incidents": (
+        ("ts", "<f8"), ("lat", "<f4"), ("lon", "<f4"), ("delay", "<f4"), ("magnitude", "<i1"), ("id", "S40")
+    ),
+    "arrivals": (
+        ("ts", "<f8"), ("scheduled", "<f8"), ("delay", "<f4"), ("route", "S16"), ("stop", "S16"), ("trip", "S24")
+    ),
+    "weather": (
+        ("ts", "<f8"), ("lat", "<f4"), ("lon", "<f4"), ("temperature", "<f4"), ("humidity", "<f4"),
+        ("wind_speed", "<f4"), ("pop", "<f4"), ("description", "S32")
+    ),
+}
+
+# Rows sharing these columns (and a time bucket) are merged when downsampling
+SERIES_KEYS = {
+    "incidents": ("id",),
+    "arrivals": ("route", "stop", "trip"),
+    "weather": ("lat", "lon"),
+}
+
+# Geo partition size for series with lat/lon columns
+CELL_DEGREES = 0.1
+UNPARTITIONED_CELL = "all"
+COMPACTED_MARKER = ".compacted"
+ROWS_FILE = "rows"
+LOCK_FILE = ".lock"
+COMPACT_INTERVAL_SECONDS = 3600
+
+_queue = None
+_writer_thread = None
+_writer_stop = threading.Event()
+# Set to flush before the interval is up, when the queue is filling
+_writer_wake = threading.Event()
+_writer_lock = threading.Lock()
+_stats = {"written": 0, "dropped": 0, "rejected": 0, "batches": 0, "compacted": 0, "expired": 0}
+
+
+def store_path():
+    return settings.TIMESERIES_PATH or os.path.join(settings.GTFS_DATA_DIR, "timeseries")
+
+
+def _dtype(series):
+    return np.dtype(list(SERIES[series]))
+
+
+def _day(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%d")
+
+
+def _cell_name(row, col):
+    return f"{row}_{col}"
+
+
+def record(series, rows):
+    """
+    Queue rows for the store without blocking.
+
+    Args:
+        series (str): One of SERIES
+        rows (list): Tuples in the series' column order
+
+    When the queue is full the rows are dropped (and counted) rather than
+    slowing down the request that produced them.
+    """
+    if not settings.TIMESERIES_ENABLED or not rows:
+        return
+    if _writer_thread is None or not _writer_thread.is_alive():
+        start_timeseries_writer()
+    try:
+        _queue.put_nowait((series, rows))
+    except queue.Full:
+        _stats["dropped"] += len(rows)
+    if _queue.qsize() >= _queue.maxsize // 2:
+        _writer_wake.set()
+
+
+def _partitions(data):
+    """Split a batch into (day, cell) partitions."""
+    days = np.floor(data["ts"] / 86400).astype(np.int64)
+    if "lat" in data.dtype.names:
+        rows = np.floor(data["lat"] / CELL_DEGREES).astype(np.int64)
+        cols = np.floor(data["lon"] / CELL_DEGREES).astype(np.int64)
+    else:
+        rows = cols = np.zeros(len(data), dtype=np.int64)
+    keys = np.stack([days, rows, cols], axis=1)
+    unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    for i, (day, row, col) in enumerate(unique.tolist()):
+        cell = _cell_name(row, col) if "lat" in data.dtype.names else UNPARTITIONED_CELL
+        yield _day(day * 86400), cell, data[inverse == i]
+
+
+def partition_rows(directory, dtype):
+    """
+    Rows committed to a partition.
+
+    Partitions written before row counts were kept fall back to the
+    shortest column.
+    """
+    try:
+        with open(os.path.join(directory, ROWS_FILE)) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        pass
+    sizes = []
+    for name in dtype.names:
+        path = os.path.join(directory, f"{name}.bin")
+        sizes.append(os.path.getsize(path) // dtype[name].itemsize if os.path.exists(path) else 0)
+    return min(sizes)
+
+
+def _truncate_columns(directory, dtype, count):
+    """Cut every column file back to count rows."""
+    for name in dtype.names:
+        path = os.path.join(directory, f"{name}.bin")
+        if os.path.exists(path):
+            os.truncate(path, count * dtype[name].itemsize)
+
+
+@contextmanager
+def _partition_lock(directory):
+    """
+    Hold an exclusive lock on a partition across processes.
+
+    Another process's uncommitted rows look like a torn tail, so without it
+    one writer's truncate would cut off the other's batch.
+    """
+    with open(os.path.join(directory, LOCK_FILE), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _append(series, day, cell, data):
+    """
+    Append rows to a partition, all columns or none.
+
+    Torn tails left by an earlier failed write are cut off first, and on
+    failure the columns are cut back to the committed row count.
+    """
+    directory = os.path.join(store_path(), series, day, cell)
+    os.makedirs(directory, exist_ok=True)
+    with _partition_lock(directory):
+        committed = partition_rows(directory, data.dtype)
+        try:
+            _truncate_columns(directory, data.dtype, committed)
+            for name in data.dtype.names:
+                with open(os.path.join(directory, f"{name}.bin"), "ab") as f:
+                    f.write(np.ascontiguousarray(data[name]).tobytes())
+                    f.flush()
+            tmp_path = os.path.join(directory, ROWS_FILE + ".tmp")
+            with open(tmp_path, "w") as f:
+                f.write(str(committed + len(data)))
+            os.replace(tmp_path, os.path.join(directory, ROWS_FILE))
+        except Exception:
+            try:
+                _truncate_columns(directory, data.dtype, committed)
+            except OSError as e:
+                # The next append truncates again before writing
+                print(f"Error rolling back {series} partition {day}/{cell}: {e}")
+            raise
+
+
+def _encode_row(row, dtype):
+    """A row with strings as UTF-8 cut to their column width, or None if it doesn't fit the dtype."""
+    values = []
+    for value, name in zip(row, dtype.names):
+        if isinstance(value, str) and dtype[name].kind == "S":
+            # Drop a multi-byte character the column width would split
+            value = value.encode("utf-8")[:dtype[name].itemsize].decode("utf-8", "ignore").encode("utf-8")
+        values.append(value)
+    try:
+        return np.array([tuple(values)], dtype=dtype)
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def _encode_rows(series, rows):
+    """
+    Rows as a structured array.
+
+    The whole batch is converted at once; only if that fails (a non-ASCII
+    string, a malformed row) is each row encoded on its own, and the rows
+    that still don't fit are counted as rejected.
+    """
+    dtype = _dtype(series)
+    try:
+        return np.array(rows, dtype=dtype)
+    except (TypeError, ValueError, OverflowError):
+        pass
+    encoded = []
+    for row in rows:
+        data = _encode_row(row, dtype) if isinstance(row, (tuple, list)) and len(row) == len(dtype.names) else None
+        if data is None:
+            _stats["rejected"] += 1
+        else:
+            encoded.append(data)
+    if len(encoded) < len(rows):
+        print(f"Rejected {len(rows) - len(encoded)} malformed {series} rows")
+    return np.concatenate(encoded) if encoded else np.empty(0, dtype=dtype)
+
+
+def write_batch(series, rows):
+    """Append rows to their partitions. Called from the writer thread."""
+    data = _encode_rows(series, rows)
+    if len(data) == 0:
+        return
+    for day, cell, part in _partitions(data):
+        _append(series, day, cell, part)
+    _stats["written"] += len(data)
+    _stats["batches"] += 1
+
+
+def flush():
+    """Write everything queued so far, one batch per series."""
+    if _queue is None:
+        return
+    pending = {}
+    while True:
+        try:
+            series, rows = _queue.get_nowait()
+        except queue.Empty:
+            break
+        pending.setdefault(series, []).extend(rows)
+    for series, rows in pending.items():
+        try:
+            write_batch(series, rows)
+        except Exception as e:
+            print(f"Error writing {len(rows)} {series} rows: {e}")
+
+
+def _read_partition(series, directory, first_row=0):
+    """Load a partition's committed rows from first_row on."""
+    dtype = _dtype(series)
+    count = max(0, partition_rows(directory, dtype) - first_row)
+    data = np.empty(count, dtype=dtype)
+    for name in dtype.names:
+        if count:
+            data[name] = np.fromfile(
+                os.path.join(directory, f"{name}.bin"), dtype=dtype[name], count=count,
+                offset=first_row * dtype[name].itemsize
+            )
+    return data
+
+
+def _partition_dirs(series, start, end):
+    """(cell, directory) of every partition on the UTC days from start to end."""
+    day = datetime.fromtimestamp(start, timezone.utc).date()
+    last_day = datetime.fromtimestamp(end, timezone.utc).date()
+    while day <= last_day:
+        day_dir = os.path.join(store_path(), series, day.isoformat())
+        day += timedelta(days=1)
+        if not os.path.isdir(day_dir):
+            continue
+        for cell in os.listdir(day_dir):
+            # Skip a compaction caught mid-swap
+            if not cell.endswith(".tmp"):
+                yield cell, os.path.join(day_dir, cell)
+
+
+def _cell_bounds(cell):
+    row, col = (int(v) for v in cell.split("_"))
+    return row * CELL_DEGREES, (row + 1) * CELL_DEGREES, col * CELL_DEGREES, (col + 1) * CELL_DEGREES
+
+
+def downsample(data, bucket_seconds, keys=None):
+    """
+    Merge rows into one per time bucket and key.
+
+    Numeric columns are averaged, other columns take the first row's value
+    and ts becomes the bucket start.
+
+    Args:
+        data: Structured array of a series' rows
+        bucket_seconds (int): Bucket width
+        keys (tuple, optional): Columns that keep rows apart within a
+            bucket. Defaults to () (one row per bucket).
+
+    Returns:
+        tuple: (downsampled structured array, rows merged into each)
+    """
+    keys = tuple(keys or ())
+    if len(data) == 0:
+        return data, np.zeros(0, dtype=np.int64)
+    bucket = np.floor(data["ts"] / bucket_seconds) * bucket_seconds
+    sort_keys = [bucket] + [data[k] for k in keys]
+    order = np.lexsort(sort_keys[::-1])
+    data, bucket = data[order], bucket[order]
+
+    change = np.zeros(len(data), dtype=bool)
+    change[0] = True
+    for column in [bucket] + [data[k] for k in keys]:
+        change[1:] |= column[1:] != column[:-1]
+    starts = np.flatnonzero(change)
+    counts = np.diff(np.append(starts, len(data)))
+
+    merged = data[starts].copy()
+    merged["ts"] = bucket[starts]
+    for name in data.dtype.names:
+        if name == "ts" or name in keys or data.dtype[name].kind not in "fiu":
+            continue
+        merged[name] = np.add.reduceat(data[name].astype(np.float64), starts) / counts
+    return merged, counts
+
+
+def scan(series, start, end, bbox=None, where=None, bucket_seconds=None, keys=None):
+    """
+    Read a time range from the store.
+
+    Args:
+        series (str): One of SERIES
+        start (float): Range start, unix time
+        end (float): Range end (exclusive), unix time
+        bbox (tuple, optional): (min_lat, min_lon, max_lat, max_lon); only
+            cells that overlap it are read
+        where (dict, optional): Column -> required value, e.g. {"route": "44"}
+        bucket_seconds (int, optional): Downsample into buckets of this width
+        keys (tuple, optional): Columns kept apart when downsampling
+
+    Returns:
+        dict: Column name -> array sorted by time (strings decoded), plus
+            "count" (rows merged per row) when downsampling
+    """
+    dtype = _dtype(series)
+    parts = []
+    for cell, directory in _partition_dirs(series, start, end):
+        if bbox is not None and cell != UNPARTITIONED_CELL:
+            min_lat, max_lat, min_lon, max_lon = _cell_bounds(cell)
+            if max_lat < bbox[0] or min_lat > bbox[2] or max_lon < bbox[1] or min_lon > bbox[3]:
+                continue
+        parts.append(_read_partition(series, directory))
+
+    data = np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+    mask = (data["ts"] >= start) & (data["ts"] < end)
+    if bbox is not None and "lat" in dtype.names:
+        mask &= (data["lat"] >= bbox[0]) & (data["lat"] <= bbox[2])
+        mask &= (data["lon"] >= bbox[1]) & (data["lon"] <= bbox[3])
+    for name, value in (where or {}).items():
+        mask &= data[name] == (value.encode("utf-8") if isinstance(value, str) else value)
+    data = data[mask]
+    data = data[np.argsort(data["ts"], kind="stable")]
+
+    counts = None
+    if bucket_seconds:
+        data, counts = downsample(data, bucket_seconds, keys)
+    result = {
+        name: np.char.decode(data[name], "utf-8", "replace") if dtype[name].kind == "S" else data[name]
+        for name in dtype.names
+    }
+    if counts is not None:
+        result["count"] = counts
+    return result
+
+
+def read_new(series, start, end, offsets):
+    """
+    Read the rows committed since the last call, for consumers that fold
+    rows in incrementally and shouldn't reread what they've seen.
+
+    Args:
+        series (str): One of SERIES
+        start (float): Partitions of the UTC days from start ...
+        end (float): ... to end are read; rows aren't filtered by time
+        offsets (dict): Partition directory -> rows already read, updated
+            in place. Keep it between calls.
+
+    Returns:
+        Structured array of the new rows in write order, strings as bytes
+    """
+    dtype = _dtype(series)
+    parts = []
+    for _, directory in _partition_dirs(series, start, end):
+        first_row = offsets.get(directory, 0)
+        data = _read_partition(series, directory, first_row)
+        if len(data):
+            parts.append(data)
+        offsets[directory] = first_row + len(data)
+    return np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+
+
+def compact(now=None):
+    """
+    Downsample old partitions and drop expired days.
+
+    Returns:
+        tuple: (partitions compacted, days deleted)
+    """
+    now = now or time.time()
+    today = datetime.fromtimestamp(now, timezone.utc).date()
+    compacted = expired = 0
+    for series in SERIES:
+        series_dir = os.path.join(store_path(), series)
+        if not os.path.isdir(series_dir):
+            continue
+        for day_name in sorted(os.listdir(series_dir)):
+            day_dir = os.path.join(series_dir, day_name)
+            try:
+                age = (today - datetime.strptime(day_name, "%Y-%m-%d").date()).days
+            except ValueError:
+                continue
+            if age > settings.TIMESERIES_RETENTION_DAYS:
+                shutil.rmtree(day_dir, ignore_errors=True)
+                expired += 1
+                continue
+            if age <= settings.TIMESERIES_COMPACT_AFTER_DAYS:
+                continue
+            for cell in os.listdir(day_dir):
+                cell_dir = os.path.join(day_dir, cell)
+                if cell.endswith(".tmp") or os.path.exists(os.path.join(cell_dir, COMPACTED_MARKER)):
+                    continue
+                data, _ = downsample(
+                    _read_partition(series, cell_dir),
+                    settings.TIMESERIES_COMPACT_BUCKET_SECONDS, SERIES_KEYS[series]
+                )
+                # Write the compacted columns beside the partition, then swap them in
+                tmp_dir = cell_dir + ".tmp"
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                _append(series, day_name, cell + ".tmp", data)
+                open(os.path.join(tmp_dir, COMPACTED_MARKER), "w").close()
+                shutil.rmtree(cell_dir)
+                os.replace(tmp_dir, cell_dir)
+                compacted += 1
+    _stats["compacted"] += compacted
+    _stats["expired"] += expired
+    return compacted, expired
+
+
+def timeseries_stats():
+    """Writer counters for the health check."""
+    return {**_stats, "queued": _queue.qsize() if _queue is not None else 0}
+
+
+def _writer_loop():
+    """Flush queued rows until stop_timeseries_writer() is called."""
+    last_compaction = 0.0
+    while not _writer_stop.is_set():
+        _writer_wake.wait(settings.TIMESERIES_FLUSH_SECONDS)
+        _writer_wake.clear()
+        flush()
+        if time.monotonic() - last_compaction > COMPACT_INTERVAL_SECONDS:
+            last_compaction = time.monotonic()
+            try:
+                compact()
+            except Exception as e:
+                print(f"Error compacting time-series store: {e}")
+    flush()
+
+
+def start_timeseries_writer():
+    """Start the background writer thread if it isn't running."""
+    global _queue, _writer_thread
+
+    if not settings.TIMESERIES_ENABLED:
+        return
+    with _writer_lock:
+        if _writer_thread is not None and _writer_thread.is_alive():
+            return
+
+        if _queue is None:
+            _queue = queue.Queue(maxsize=settings.TIMESERIES_QUEUE_SIZE)
+        _writer_stop.clear()
+        _writer_thread = threading.Thread(target=_writer_loop, name="timeseries-writer", daemon=True)
+        _writer_thread.start()
+
+
+def stop_timeseries_writer():
+    """Stop the writer, flushing whatever is still queued."""
+    _writer_stop.set()
+    _writer_wake.set()
+    if _writer_thread is not None:
+        _writer_thread.join(timeout=10)
@@ -1,18 +1,171 @@
-import requests
+from array import array
 from datetime import datetime, timedelta
-import sys
-import os
+import codecs
 import json
+import time
 from math import cos, radians
 
-# Add the parent directory to sys.path to import config
-sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 from config import settings
+from utils.lazy import lazy_import
+from utils.polyline import encode_polyline
+from .timeseries_service import record
+from ..profiling import upstream, record_cache
+
+requests = lazy_import("requests")
+
+# Requests are snapped to ~100 m so nearby users share cache entries
+TRAFFIC_COORD_DECIMALS = 3
+TRAFFIC_CACHE_TTL = timedelta(minutes=5)
+
+# Response body is decoded in chunks of this size
+STREAM_CHUNK_BYTES = 64 * 1024
 
 # Simple memory cache
 cache = {}
 cache_expiry = {}
 
+
+class Incident:
+    """
+    A traffic incident from TomTom, kept compact for the cache.
+
+    The full geometry is stored as a flat array of lon/lat doubles instead
+    of nested lists; incidents only become dicts when a response is encoded
+    (see to_dict).
+    """
+
+    __slots__ = ("id", "type", "magnitude", "description", "lat", "lon",
+                 "start_time", "end_time", "delay", "geometry")
+
+    def __init__(self, id, type, magnitude, description, lat, lon, start_time, end_time, delay, geometry):
+        self.id = id
+        self.type = type
+        self.magnitude = magnitude  # TomTom magnitudeOfDelay: 0 unknown, 1 minor .. 4 undefined/closure
+        self.description = description
+        self.lat = lat
+        self.lon = lon
+        self.start_time = start_time
+        self.end_time = end_time
+        self.delay = delay  # seconds
+        self.geometry = geometry  # array("d"): lon0, lat0, lon1, lat1, ...
+
+    @classmethod
+    def from_feature(cls, feature, default_lat, default_lon, index):
+        """Build an incident from one TomTom v5 incident feature."""
+        properties = feature.get("properties") or {}
+        events = properties.get("events") or []
+        geometry = feature.get("geometry") or {}
+
+        # Get description from events if available
+        description, event_type = "", ""
+        if events:
+            description = events[0].get("description", "")
+            event_type = str(events[0].get("code", ""))
+
+        coordinates = geometry.get("coordinates") or []
+        if geometry.get("type") == "Point":
+            coordinates = [coordinates] if len(coordinates) >= 2 else []
+        points = array("d")
+        for point in coordinates:
+            if isinstance(point, list) and len(point) >= 2:
+                points.append(point[0])
+                points.append(point[1])
+
+        # Position at the first point, or the search center if there's no geometry
+        lon, lat = (points[0], points[1]) if points else (default_lon, default_lat)
+        return cls(
+            properties.get("id", f"incident-{index}"),
+            event_type,
+            properties.get("magnitudeOfDelay", 0),
+            description,
+            lat,
+            lon,
+            properties.get("startTime", ""),
+            properties.get("endTime", ""),
+            properties.get("delay") or 0,
+            points
+        )
+
+    def to_dict(self):
+        """JSON form of the incident, with the geometry as an encoded polyline."""
+        geometry = self.geometry
+        return {
+            "id": self.id,
+            "type": self.type,
+            "severity": self.magnitude,
+            "description": self.description,
+            "location": {
+                "lat": self.lat,
+                "lon": self.lon
+            },
+            "polyline": encode_polyline(zip(geometry[1::2], geometry[0::2])),
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "delay": self.delay
+        }
+
+
+def iter_incidents(chunks):
+    """
+    Incrementally decode the "incidents" array of a TomTom response.
+
+    Only the unparsed tail of the body is buffered, and each incident is
+    yielded as soon as its closing brace has arrived.
+
+    Args:
+        chunks: Iterable of response body bytes
+
+    Yields:
+        dict: One incident feature at a time
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    key = '"incidents"'
+    buffer = ""
+    pos = 0
+    in_array = False
+    for chunk in chunks:
+        buffer = buffer[pos:] + text.decode(chunk)
+        pos = 0
+        if not in_array:
+            start = buffer.find(key)
+            bracket = buffer.find("[", start) if start >= 0 else -1
+            if bracket < 0:
+                # Keep enough of the tail to catch a key split across chunks
+                pos = start if start >= 0 else max(0, len(buffer) - len(key))
+                continue
+            pos = bracket + 1
+            in_array = True
+
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos == len(buffer):
+                break
+            if buffer[pos] == "]":
+                return
+            try:
+                feature, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The incident continues in the next chunk
+                break
+            yield feature
+
+    if in_array:
+        raise json.JSONDecodeError("Unterminated incidents array", buffer, pos)
+
+
+def traffic_cache_key(lat, lon, radius=5000):
+    """Build the cache key for a traffic request."""
+    return f"traffic_{lat}_{lon}_{radius}"
+
+def _counted(chunks, call):
+    """Pass chunks through, adding their size to an upstream call's "bytes"."""
+    call["bytes"] = 0
+    for chunk in chunks:
+        call["bytes"] += len(chunk)
+        yield chunk
+
 def get_traffic_data(lat, lon, radius=5000):
     """
     Get traffic data for a specific location and radius.
@@ -25,11 +178,13 @@ def get_traffic_data(lat, lon, radius=5000):
     Returns:
         dict: Traffic data for the location
     """
-    cache_key = f"traffic_{lat}_{lon}_{radius}"
+    cache_key = traffic_cache_key(lat, lon, radius)
     
     # Check cache
     if cache_key in cache and cache_expiry.get(cache_key, datetime.min) > datetime.now():
+        record_cache("traffic", "hit")
         return cache[cache_key]
+    record_cache("traffic", "miss")
     
     # Calculate bounding box - convert radius to approximate degrees
     # Approximately 111,111 meters per degree at the equator for latitude
@@ -48,64 +203,23 @@ def get_traffic_data(lat, lon, radius=5000):
     params = {
         "key": settings.TRAFFIC_API_KEY,
         "bbox": f"{min_lon},{min_lat},{max_lon},{max_lat}",
-        "fields": "{incidents{type,geometry{type,coordinates},properties{id,iconCategory,events{description,code,iconCategory},startTime,endTime,from,to}}}",
+        "fields": "{incidents{type,geometry{type,coordinates},properties{id,iconCategory,magnitudeOfDelay,events{description,code,iconCategory},startTime,endTime,from,to,delay}}}",
         "language": "en-US",
         "timeValidityFilter": "present"
     }
     
     try:
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        
-        data = response.json()
-          # Process the data with the new structure from v5 API
+        # Incidents are decoded one at a time as the body streams in, so a
+        # multi-megabyte metro-wide response never sits in memory whole
         incidents = []
-        if "incidents" in data:
-            for incident in data["incidents"]:
-                try:
-                    properties = incident.get("properties", {})
-                    events = properties.get("events", [])
-                    geometry = incident.get("geometry", {})
-                    
-                    # Get description from events if available
-                    description = ""
-                    event_type = ""
-                    if events and len(events) > 0:
-                        description = events[0].get("description", "")
-                        event_type = str(events[0].get("code", ""))
-                    
-                    # Extract coordinates from geometry if available
-                    coords_lat, coords_lon = lat, lon  # Default to search center
-                    if geometry and geometry.get("type") == "Point" and len(geometry.get("coordinates", [])) >= 2:
-                        # Point geometry: [lon, lat]
-                        coords_lon, coords_lat = geometry["coordinates"][0], geometry["coordinates"][1]
-                    elif geometry and geometry.get("type") == "LineString" and len(geometry.get("coordinates", [])) > 0:
-                        # LineString geometry: Take the first point [lon, lat]
-                        coords_lon, coords_lat = geometry["coordinates"][0][0], geometry["coordinates"][0][1]
-                    
-                    incident_data = {
-                        "id": properties.get("id", f"incident-{len(incidents)}"),
-                        "type": event_type,
-                        "severity": properties.get("magnitudeOfDelay", 0),
-                        "description": description,
-                        "location": {
-                            "lat": coords_lat,
-                            "lon": coords_lon
-                        },
-                        "start_time": properties.get("startTime", ""),
-                        "end_time": properties.get("endTime", ""),
-                        "delay": properties.get("delay", 0)
-                    }
-                    incidents.append(incident_data)
-                except Exception as e:
-                    print(f"Error processing incident: {e}")
-                    continue
-                    continue
-        
-        # Fallback response if no incidents are found
-        if not incidents:
-            incidents = []
-        
+        with upstream("tomtom_traffic") as call:
+            response = requests.get(url, params=params, timeout=10, stream=True)
+            response.raise_for_status()
+            with response:
+                chunks = _counted(response.iter_content(chunk_size=STREAM_CHUNK_BYTES), call)
+                for feature in iter_incidents(chunks):
+                    incidents.append(Incident.from_feature(feature, lat, lon, len(incidents)))
+
         traffic_data = {
             "incidents": incidents,
             "count": len(incidents),
@@ -113,9 +227,12 @@ def get_traffic_data(lat, lon, radius=5000):
             "source": "tomtom"
         }
         
+        now = time.time()
+        record("incidents", [(now, i.lat, i.lon, i.delay, i.magnitude, i.id) for i in incidents])
+
         # Cache the result for 5 minutes
         cache[cache_key] = traffic_data
-        cache_expiry[cache_key] = datetime.now() + timedelta(minutes=5)
+        cache_expiry[cache_key] = datetime.now() + TRAFFIC_CACHE_TTL
         
         return traffic_data
     
@@ -1,17 +1,34 @@
-import requests
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime, timedelta
-import sys
-import os
+import contextvars
 import math
 
-# Add the parent directory to sys.path to import config
-sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 from config import settings
+from utils.lazy import lazy_import
+from .gtfs_realtime_service import get_realtime_arrivals, is_realtime_fresh
+from .gtfs_service import get_gtfs_dataset, get_scheduled_arrivals
+from .delay_service import record_deviations
+from .provider_service import TransitProvider, PROVIDER_TYPES, get_provider_registry
+from ..profiling import upstream
+
+requests = lazy_import("requests")
+
+# Requests are snapped to ~100 m; arrivals change quickly so responses are only briefly cacheable
+TRANSIT_COORD_DECIMALS = 3
+TRANSIT_CACHE_TTL = timedelta(seconds=30)
 
 # Simple memory cache
 cache = {}
 cache_expiry = {}
 
+# GTFS-only providers list at most this many stops
+GTFS_PROVIDER_MAX_STOPS = 20
+# GTFS route_type values drawn as rail (tram, subway, rail)
+GTFS_RAIL_ROUTE_TYPES = (0, 1, 2)
+
+# Queries providers whose coverage overlaps at the same point concurrently
+_provider_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="transit-provider")
+
 def calculate_distance(lat1, lon1, lat2, lon2):
     """Calculate distance between two points in meters using Haversine formula."""
     R = 6371000  # Earth's radius in meters
@@ -76,22 +93,21 @@ def get_fallback_transit_data(lat, lon):
     nearby_stops.sort(key=lambda x: x["distance"])
     return nearby_stops[:3]  # Return top 3 closest
 
-def get_king_county_metro_stops(lat, lon, radius):
-    """Get nearby transit stops from King County Metro API with fallback."""
+def get_onebusaway_stops(lat, lon, radius, base_url=settings.KC_METRO_GTFS_RT_URL, key="TEST"):
+    """Get nearby transit stops from a OneBusAway API with fallback."""
     try:
-        # King County Metro GTFS-RT API endpoints
-        # Using OneBusAway API which serves King County Metro data
-        base_url = "https://api.pugetsound.onebusaway.org/api/where"
-          # Get stops near location
+        # Get stops near location
         stops_url = f"{base_url}/stops-for-location.json"
         params = {
             'lat': lat,
             'lon': lon,
             'radius': radius,
-            'key': 'TEST'  # OneBusAway allows TEST key for development
+            'key': key  # OneBusAway allows TEST key for development
         }
         
-        response = requests.get(stops_url, params=params, timeout=5)
+        with upstream("onebusaway_stops") as call:
+            response = requests.get(stops_url, params=params, timeout=5)
+            call["bytes"] = len(response.content)
         print(f"OneBusAway API response status: {response.status_code}")
         
         if response.status_code == 429:
@@ -139,7 +155,9 @@ def get_king_county_metro_stops(lat, lon, radius):
         for route_id in list(route_ids_seen)[:10]:  # Limit to 10 routes to avoid too many API calls
             try:
                 route_url = f"{base_url}/route/{route_id}.json"
-                route_response = requests.get(f"{route_url}?key=TEST", timeout=5)
+                with upstream("onebusaway_route") as call:
+                    route_response = requests.get(route_url, params={'key': key}, timeout=5)
+                    call["bytes"] = len(route_response.content)
                 
                 if route_response.status_code == 200:
                     route_data = route_response.json()
@@ -174,22 +192,23 @@ def get_king_county_metro_stops(lat, lon, radius):
         }
         
     except Exception as e:
-        print(f"Error fetching King County Metro stops: {e}")
+        print(f"Error fetching OneBusAway stops from {base_url}: {e}")
         return None
 
-def get_king_county_metro_arrivals(stop_id):
-    """Get real-time arrivals for a King County Metro stop with fallback."""
+def get_onebusaway_arrivals(stop_id, base_url=settings.KC_METRO_GTFS_RT_URL, key="TEST"):
+    """Get real-time arrivals for a stop from a OneBusAway API with fallback."""
     try:
-        base_url = "https://api.pugetsound.onebusaway.org/api/where"
         arrivals_url = f"{base_url}/arrivals-and-departures-for-stop/{stop_id}.json"
         
         params = {
-            'key': 'TEST',
+            'key': key,
             'minutesBefore': 5,
             'minutesAfter': 60
         }
         
-        response = requests.get(arrivals_url, params=params, timeout=5)
+        with upstream("onebusaway_arrivals") as call:
+            response = requests.get(arrivals_url, params=params, timeout=5)
+            call["bytes"] = len(response.content)
         
         if response.status_code == 429:
             print("Rate limited for arrivals - using fallback data")
@@ -206,6 +225,8 @@ def get_king_county_metro_arrivals(stop_id):
             return []
         
         arrivals_data = []
+        # (route, stop, trip, scheduled unix time, deviation seconds) for the delay histograms
+        deviations = []
         
         for arrival in data.get('data', {}).get('entry', {}).get('arrivalsAndDepartures', []):
             route_id = arrival.get('routeId', '')
@@ -227,8 +248,11 @@ def get_king_county_metro_arrivals(stop_id):
                 
                 # Determine status
                 status = "SCHEDULED"
-                if predicted_time:
-                    if abs(predicted_time - scheduled_time) < 60000:  # Within 1 minute
+                delay = None
+                if predicted_time and scheduled_time:
+                    delay = int((predicted_time - scheduled_time) / 1000)
+                    deviations.append((route_id, stop_id, arrival.get('tripId', ''), scheduled_time / 1000, delay))
+                    if abs(delay) < 60:  # Within 1 minute
                         status = "REAL_TIME"
                     else:
                         status = "DELAYED"
@@ -242,20 +266,27 @@ def get_king_county_metro_arrivals(stop_id):
                     "minutes_away": minutes_away,
                     "arrival_time": arrival_datetime.isoformat(),
                     "status": status,
-                    "real_time": bool(predicted_time)
+                    "real_time": bool(predicted_time),
+                    "delay": delay
                 })
         
+        record_deviations(deviations)
+        
         # Sort by arrival time
         arrivals_data.sort(key=lambda x: x['minutes_away'])
         
         return arrivals_data
         
     except Exception as e:
-        print(f"Error fetching King County Metro arrivals: {e}")
+        print(f"Error fetching OneBusAway arrivals from {base_url}: {e}")
         return []
 
 def get_fallback_arrivals_data(stop_id):
-    """Generate realistic fallback arrivals data."""
+    """Scheduled arrivals from the static GTFS timetable, or generated placeholder data if it isn't loaded."""
+    scheduled = get_scheduled_arrivals(stop_id)
+    if scheduled is not None:
+        return scheduled
+    
     now = datetime.now()
     arrivals = []
     
@@ -273,62 +304,210 @@ def get_fallback_arrivals_data(stop_id):
     
     return arrivals
 
-def is_seattle_area(lat, lon):
-    """Check if coordinates are in Seattle metro area."""
-    # Seattle area bounds (approximate)
-    # Note: For longitude, -122.5 is further west than -122.0
-    seattle_bounds = {
-        'north': 47.8,
-        'south': 47.4,
-        'east': -122.0,   # Eastern boundary (closer to 0)
-        'west': -122.5    # Western boundary (further from 0)
-    }
+def get_stop_arrivals(stop_id, base_url=settings.KC_METRO_GTFS_RT_URL, key="TEST"):
+    """
+    Get arrivals for a stop from local data when possible.
     
-    # For negative longitude values, west < lon < east means larger absolute value on west
-    return (seattle_bounds['south'] <= lat <= seattle_bounds['north'] and
-            seattle_bounds['west'] <= lon <= seattle_bounds['east'])
+    Uses the GTFS schedule adjusted by realtime deltas, then the realtime
+    index alone, and only then a per-stop OneBusAway call.
+    """
+    stop_arrivals = get_scheduled_arrivals(stop_id)
+    if not stop_arrivals and is_realtime_fresh():
+        stop_arrivals = get_realtime_arrivals(stop_id)
+    if not stop_arrivals:
+        stop_arrivals = get_onebusaway_arrivals(stop_id, base_url, key)
+    return stop_arrivals
+
+def _closest_stop_arrivals(stops, arrivals_for):
+    """Arrivals at the closest of a list of stops, labelled with the stop."""
+    if not stops:
+        return []
+    closest_stop = stops[0]
+    arrivals_data = []
+    # Only get arrivals for the closest stop to avoid rate limiting
+    for arrival in arrivals_for(closest_stop['id']) or []:
+        arrival['stop_id'] = closest_stop['id']
+        arrival['stop_name'] = closest_stop['name']
+        arrivals_data.append(arrival)
+    return arrivals_data
+
+class OneBusAwayProvider(TransitProvider):
+    """
+    A OneBusAway API instance.
+
+    Args:
+        url (str): API base, ending in /api/where
+        key (str): API key
+        static_gtfs (bool): The local GTFS feed is this agency's, so arrivals
+            come from the schedule and realtime index before OneBusAway
+    """
+
+    def __init__(self, name, coverage, url=settings.KC_METRO_GTFS_RT_URL, key="TEST", static_gtfs=False):
+        super().__init__(name, coverage)
+        self.url = url
+        self.key = key
+        self.static_gtfs = static_gtfs
+
+    def arrivals(self, stop_id):
+        if self.static_gtfs:
+            return get_stop_arrivals(stop_id, self.url, self.key)
+        return get_onebusaway_arrivals(stop_id, self.url, self.key)
+
+    def nearby(self, lat, lon, radius):
+        result = get_onebusaway_stops(lat, lon, radius, self.url, self.key)
+        if not result:
+            return None
+        if isinstance(result, list):
+            # Rate limited: placeholder stops only
+            result = {"stops": result, "routes": []}
+        stops = sorted(result.get('stops', []), key=lambda stop: stop.get('distance', 0))
+        return {
+            'stops': stops,
+            'routes': result.get('routes', []),
+            'arrivals': _closest_stop_arrivals(stops, self.arrivals)
+        }
+
+class GtfsProvider(TransitProvider):
+    """An agency served only by the local static GTFS feed (with GTFS-RT delays when fresh)."""
+
+    def nearby(self, lat, lon, radius):
+        ds = get_gtfs_dataset()
+        if ds is None:
+            return None
+        stop_idxs, distances = ds.nearby_stops(lat, lon, radius)
+        stops = []
+        route_idxs = set()
+        for stop_idx, distance in zip(stop_idxs[:GTFS_PROVIDER_MAX_STOPS].tolist(), distances.tolist()):
+            lo, hi = ds.stop_offsets[stop_idx], ds.stop_offsets[stop_idx + 1]
+            served = sorted(set(ds.trip_route[ds.st_trip[ds.stop_departure_rows[lo:hi]]].tolist()))
+            route_idxs.update(served)
+            stops.append({
+                "id": ds.stop_ids[stop_idx],
+                "name": ds.stop_names[stop_idx],
+                "location": {"lat": float(ds.stop_lat[stop_idx]), "lon": float(ds.stop_lon[stop_idx])},
+                "routes": [ds.route_ids[route_idx] for route_idx in served],
+                "distance": distance
+            })
+        routes = []
+        for route_idx in sorted(route_idxs):
+            short_name = ds.route_short_names[route_idx]
+            long_name = ds.route_long_names[route_idx]
+            routes.append({
+                "id": ds.route_ids[route_idx],
+                "route_name": short_name or long_name,
+                "long_name": long_name,
+                "short_name": short_name,
+                "type": "rail" if int(ds.route_types[route_idx]) in GTFS_RAIL_ROUTE_TYPES else "bus",
+                "color": ds.route_colors[route_idx],
+                "text_color": ds.route_text_colors[route_idx]
+            })
+        return {
+            'stops': stops,
+            'routes': routes,
+            'arrivals': _closest_stop_arrivals(stops, get_scheduled_arrivals)
+        }
+
+PROVIDER_TYPES["onebusaway"] = OneBusAwayProvider
+PROVIDER_TYPES["gtfs"] = GtfsProvider
+
+def _query_providers(providers, lat, lon, radius):
+    """
+    Ask each provider for transit near a point, concurrently when there are several.
+
+    Returns:
+        tuple: ([(provider, result)] in registration order, names of providers that failed)
+    """
+    if len(providers) == 1:
+        futures = None
+    else:
+        # Each query runs in a copy of the caller's context so it reports to the request's trace
+        futures = [
+            _provider_pool.submit(contextvars.copy_context().run, provider.nearby, lat, lon, radius)
+            for provider in providers
+        ]
+    results = []
+    unavailable = []
+    for i, provider in enumerate(providers):
+        try:
+            if futures is None:
+                result = provider.nearby(lat, lon, radius)
+            else:
+                result = futures[i].result(timeout=settings.TRANSIT_PROVIDER_TIMEOUT_SECONDS)
+        except FutureTimeoutError:
+            print(f"Transit provider {provider.name} timed out")
+            result = None
+        except Exception as e:
+            print(f"Error from transit provider {provider.name}: {e}")
+            result = None
+        if result is None:
+            unavailable.append(provider.name)
+        else:
+            results.append((provider, result))
+    return results, unavailable
+
+def merge_provider_results(results):
+    """
+    Merge results from overlapping providers.
+
+    Stops and routes are deduplicated by id, and stops also by name and
+    position (~10 m) so an agency reachable through two providers appears
+    once; earlier registered providers win. Arrivals are deduplicated by
+    route, headsign and minute.
+    """
+    stops, stop_places, routes, arrivals, arrival_keys = {}, set(), {}, [], set()
+    for provider, result in results:
+        for stop in result['stops']:
+            location = stop.get('location') or {"lat": stop.get('lat', 0), "lon": stop.get('lon', 0)}
+            place = (stop.get('name'), round(location['lat'], 4), round(location['lon'], 4))
+            if stop['id'] in stops or place in stop_places:
+                continue
+            stop_places.add(place)
+            stops[stop['id']] = {**stop, 'provider': provider.name}
+        for route in result['routes']:
+            routes.setdefault(route['id'], {**route, 'provider': provider.name})
+        for arrival in result['arrivals']:
+            key = (arrival.get('route_name'), arrival.get('headsign'), (arrival.get('arrival_time') or '')[:16])
+            if key in arrival_keys:
+                continue
+            arrival_keys.add(key)
+            arrivals.append({**arrival, 'provider': provider.name})
+    arrivals.sort(key=lambda arrival: arrival.get('minutes_away', 0))
+    return {
+        'stops': sorted(stops.values(), key=lambda stop: stop.get('distance', 0)),
+        'routes': list(routes.values()),
+        'arrivals': arrivals[:10]  # Return top 10 arrivals
+    }
 
 def get_transit_data(lat, lon, radius=800):
-    """Main function to get transit data."""
+    """
+    Get transit near a point from every provider whose coverage contains it.
+
+    Overlapping providers are queried concurrently and their results merged.
+
+    Returns:
+        dict: provider (names of the providers that answered, "None" if no
+            provider covers the point), providers, unavailable, stops,
+            routes and arrivals
+    """
     try:
-        print(f"get_transit_data called with lat={lat}, lon={lon}, radius={radius}")
-        seattle_check = is_seattle_area(lat, lon)
-        print(f"Seattle area check result: {seattle_check}")
-        
-        # Use King County Metro API for Seattle area
-        if seattle_check:
-            print("Using King County Metro API for Seattle area")
-            result = get_king_county_metro_stops(lat, lon, radius)
-            print(f"King County Metro API result: {result is not None}")
-            
-            if result:
-                stops = result.get('stops', [])
-                routes = result.get('routes', [])
-                  # Get arrivals for the closest stops
-                arrivals_data = []
-                # Only get arrivals for the closest stop to avoid rate limiting
-                if stops:
-                    closest_stop = stops[0]
-                    stop_arrivals = get_king_county_metro_arrivals(closest_stop['id'])
-                    for arrival in stop_arrivals:
-                        arrival['stop_id'] = closest_stop['id']
-                        arrival['stop_name'] = closest_stop['name']
-                        arrivals_data.append(arrival)
-                
-                return {
-                    'provider': 'King County Metro',
-                    'stops': stops,
-                    'routes': routes,
-                    'arrivals': arrivals_data[:10]  # Return top 10 arrivals
-                }
-        
-        # Fallback for non-Seattle areas - return empty but valid response
-        print("Area not supported by King County Metro API")
+        providers = get_provider_registry().providers_at(lat, lon)
+        if not providers:
+            return {
+                'provider': 'None',
+                'providers': [],
+                'unavailable': [],
+                'stops': [],
+                'routes': [],
+                'arrivals': []
+            }
+
+        results, unavailable = _query_providers(providers, lat, lon, radius)
+        names = [provider.name for provider, _ in results]
         return {
-            'provider': 'None',
-            'stops': [],
-            'routes': [],
-            'arrivals': []
+            'provider': ", ".join(names) if names else 'None',
+            'providers': names,
+            'unavailable': unavailable,
+            **merge_provider_results(results)
         }
         
     except Exception as e:
@@ -0,0 +1,579 @@
+from datetime import datetime, timedelta
+import time
+
+from utils.lazy import lazy_import
+from .gtfs_service import get_gtfs_dataset, equirectangular_distance
+from ..profiling import record_cache
+
+np = lazy_import("numpy")
+
+# Walking assumptions for access, egress and transfers
+WALK_SPEED = 1.3  # meters per second
+MAX_ACCESS_WALK = 800  # meters from origin/destination to a stop
+MAX_TRANSFER_WALK = 400  # meters between stops when transferring
+MIN_TRANSFER_SECONDS = 60
+MAX_ROUNDS = 5  # up to 4 transfers
+MAX_DEPARTURE_ITERATIONS = 40
+
+INF = 2**31 - 1  # int32 max; "not reached" label
+
+# Parent label kinds
+NO_PARENT, TRANSIT_PARENT, WALK_PARENT = 0, 1, 2
+
+# Early-morning queries are planned in the previous service day's frame so
+# after-midnight trips (times >= 24:00:00) are found
+OVERNIGHT_CUTOFF = 4 * 3600
+
+
+
+class RaptorTimetable:
+    """
+    Route patterns and footpaths derived from a GtfsDataset for RAPTOR.
+
+    Trips sharing the same stop sequence form a pattern. Each pattern holds
+    (trips x stops) arrival/departure matrices with trips sorted by first
+    departure, so boarding is a binary search down a column.
+    """
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.pattern_stops = []
+        self.pattern_trips = []
+        self.pattern_arrivals = []
+        self.pattern_departures = []
+        self.stop_patterns = [[] for _ in range(len(dataset.stop_ids))]
+        self.transfers = [[] for _ in range(len(dataset.stop_ids))]
+        self._build_patterns()
+        self._build_transfers()
+
+    def _build_patterns(self):
+        ds = self.dataset
+        offsets = ds.trip_offsets
+        groups = {}
+        for trip_idx in range(len(ds.trip_ids)):
+            lo, hi = offsets[trip_idx], offsets[trip_idx + 1]
+            if hi - lo < 2:
+                continue
+            groups.setdefault(ds.st_stop[lo:hi].tobytes(), []).append(trip_idx)
+
+        for trips in groups.values():
+            trips = np.array(trips, dtype=np.int32)
+            starts = offsets[trips]
+            n_stops = offsets[trips[0] + 1] - starts[0]
+            rows = starts[:, None] + np.arange(n_stops)
+            departures = ds.st_departure[rows]
+            order = np.argsort(departures[:, 0], kind="stable")
+
+            pattern_idx = len(self.pattern_stops)
+            stops = ds.st_stop[starts[0]:starts[0] + n_stops].copy()
+            self.pattern_stops.append(stops)
+            self.pattern_trips.append(trips[order])
+            self.pattern_departures.append(np.ascontiguousarray(departures[order].T))
+            self.pattern_arrivals.append(np.ascontiguousarray(ds.st_arrival[rows][order].T))
+            for position, stop_idx in enumerate(stops.tolist()):
+                self.stop_patterns[stop_idx].append((pattern_idx, position))
+
+    def _build_transfers(self):
+        ds = self.dataset
+        for stop_idx in range(len(ds.stop_ids)):
+            neighbors, distances = ds.nearby_stops(ds.stop_lat[stop_idx], ds.stop_lon[stop_idx], MAX_TRANSFER_WALK)
+            walk_times = (distances / WALK_SPEED).astype(np.int32) + MIN_TRANSFER_SECONDS
+            self.transfers[stop_idx] = [
+                (neighbor, walk) for neighbor, walk in zip(neighbors.tolist(), walk_times.tolist())
+                if neighbor != stop_idx
+            ]
+
+    def earliest_trip(self, pattern_idx, position, ready_time, active_trips):
+        """Index of the first running trip departing a pattern position at or after ready_time, or -1."""
+        column = self.pattern_departures[pattern_idx][position]
+        trips = self.pattern_trips[pattern_idx]
+        j = int(np.searchsorted(column, ready_time, side="left"))
+        while j < len(column):
+            if active_trips[trips[j]]:
+                return j
+            j += 1
+        return -1
+
+
+def build_raptor_timetable(dataset):
+    started = time.time()
+    timetable = RaptorTimetable(dataset)
+    print(f"Built RAPTOR timetable: {len(timetable.pattern_stops)} patterns in {time.time() - started:.1f}s")
+    return timetable
+
+
+def get_raptor_timetable():
+    """Return the RAPTOR timetable for the current GTFS dataset, building it on first use."""
+    dataset = get_gtfs_dataset()
+    if dataset is None:
+        return None
+    return dataset.derived_value("raptor_timetable", build_raptor_timetable)
+
+
+class RaptorState:
+    """Per-round labels and parent pointers for one query."""
+
+    def __init__(self, n_stops, rounds):
+        self.arrival = np.full((rounds + 1, n_stops), INF, dtype=np.int64)
+        self.best = np.full(n_stops, INF, dtype=np.int64)
+        self.parent_kind = np.zeros((rounds + 1, n_stops), dtype=np.int8)
+        # TRANSIT: pattern, trip row, boarding position, alighting position
+        # WALK: from stop, walk seconds
+        self.parent_a = np.zeros((rounds + 1, n_stops), dtype=np.int32)
+        self.parent_b = np.zeros((rounds + 1, n_stops), dtype=np.int32)
+        self.parent_c = np.zeros((rounds + 1, n_stops), dtype=np.int32)
+        self.parent_d = np.zeros((rounds + 1, n_stops), dtype=np.int32)
+
+
+def run_raptor(timetable, state, access, departure, active_trips, rounds, target_bound=None):
+    """
+    Run one RAPTOR query from the access stops, reusing labels already in
+    state (the rRAPTOR trick: later departures bound earlier ones).
+
+    Args:
+        timetable (RaptorTimetable): Patterns and transfers
+        state (RaptorState): Labels to update in place
+        access (list): (stop_idx, walk_seconds) pairs from the origin
+        departure (int): Departure time in service-day seconds
+        active_trips (np.ndarray): Boolean mask of trips running today
+        rounds (int): Maximum number of transit rides
+        target_bound (callable, optional): Returns the current best arrival at
+            the target, used to prune labels that can't improve on it
+    """
+    marked = set()
+    for stop_idx, walk in access:
+        t = departure + walk
+        if t < state.arrival[0, stop_idx]:
+            state.arrival[0, stop_idx] = t
+            state.parent_kind[0, stop_idx] = NO_PARENT
+            state.parent_d[0, stop_idx] = walk
+            if t < state.best[stop_idx]:
+                state.best[stop_idx] = t
+            marked.add(stop_idx)
+
+    for k in range(1, rounds + 1):
+        if not marked:
+            break
+
+        # Earliest marked position on each pattern
+        queue = {}
+        for stop_idx in marked:
+            for pattern_idx, position in timetable.stop_patterns[stop_idx]:
+                if position < queue.get(pattern_idx, INF):
+                    queue[pattern_idx] = position
+        marked = set()
+        previous = state.arrival[k - 1]
+        current = state.arrival[k]
+        bound = target_bound() if target_bound else INF
+
+        for pattern_idx, start in queue.items():
+            stops = timetable.pattern_stops[pattern_idx]
+            arrivals = timetable.pattern_arrivals[pattern_idx]
+            departures = timetable.pattern_departures[pattern_idx]
+            trip_row = -1
+            board_position = -1
+            for position in range(start, len(stops)):
+                stop_idx = stops[position]
+                if trip_row >= 0:
+                    arrival = arrivals[position][trip_row]
+                    if arrival < state.best[stop_idx] and arrival < bound:
+                        current[stop_idx] = arrival
+                        state.best[stop_idx] = arrival
+                        state.parent_kind[k, stop_idx] = TRANSIT_PARENT
+                        state.parent_a[k, stop_idx] = pattern_idx
+                        state.parent_b[k, stop_idx] = trip_row
+                        state.parent_c[k, stop_idx] = board_position
+                        state.parent_d[k, stop_idx] = position
+                        marked.add(stop_idx)
+                ready = previous[stop_idx]
+                if ready < INF and (trip_row < 0 or ready <= departures[position][trip_row]):
+                    earlier = timetable.earliest_trip(pattern_idx, position, ready, active_trips)
+                    if earlier >= 0 and (trip_row < 0 or earlier < trip_row):
+                        trip_row = earlier
+                        board_position = position
+
+        # Footpath transfers from stops improved by a ride this round
+        for stop_idx in list(marked):
+            base = current[stop_idx]
+            for neighbor, walk in timetable.transfers[stop_idx]:
+                t = base + walk
+                if t < state.best[neighbor] and t < current[neighbor]:
+                    current[neighbor] = t
+                    state.best[neighbor] = t
+                    state.parent_kind[k, neighbor] = WALK_PARENT
+                    state.parent_a[k, neighbor] = stop_idx
+                    state.parent_d[k, neighbor] = walk
+                    marked.add(neighbor)
+
+
+def _service_frame(dataset, departure_ts):
+    """Pick the service day whose frame a query should run in and its active trip mask."""
+    local = datetime.fromtimestamp(departure_ts, dataset.timezone)
+    service_date = local.date()
+    day_start = dataset.service_day_start(service_date)
+    if departure_ts - day_start < OVERNIGHT_CUTOFF:
+        service_date -= timedelta(days=1)
+        day_start = dataset.service_day_start(service_date)
+    active_trips = dataset.active_services(service_date)[dataset.trip_service]
+    return day_start, active_trips
+
+
+def _reconstruct(timetable, state, egress_stop, egress_walk, rounds_used, day_start, origin, destination):
+    """
+    Walk parent pointers back from an egress stop into a list of legs.
+
+    Returns:
+        tuple: (legs, departure time from the origin as unix time)
+    """
+    ds = timetable.dataset
+    legs = []
+    stop_idx = egress_stop
+    k = rounds_used
+
+    legs.append({
+        "mode": "walk",
+        "from": _stop_json(ds, stop_idx),
+        "to": {"name": "Destination", "lat": destination[0], "lon": destination[1]},
+        "duration_seconds": int(egress_walk)
+    })
+
+    while k > 0:
+        kind = state.parent_kind[k, stop_idx]
+        if kind == WALK_PARENT:
+            from_stop = int(state.parent_a[k, stop_idx])
+            legs.append({
+                "mode": "walk",
+                "from": _stop_json(ds, from_stop),
+                "to": _stop_json(ds, stop_idx),
+                "duration_seconds": int(state.parent_d[k, stop_idx])
+            })
+            stop_idx = from_stop
+            continue
+        if kind != TRANSIT_PARENT:
+            break
+        pattern_idx = int(state.parent_a[k, stop_idx])
+        trip_row = int(state.parent_b[k, stop_idx])
+        board_position = int(state.parent_c[k, stop_idx])
+        alight_position = int(state.parent_d[k, stop_idx])
+        stops = timetable.pattern_stops[pattern_idx]
+        trip_idx = int(timetable.pattern_trips[pattern_idx][trip_row])
+        route_idx = int(ds.trip_route[trip_idx])
+        board_stop = int(stops[board_position])
+        departure = day_start + int(timetable.pattern_departures[pattern_idx][board_position][trip_row])
+        arrival = day_start + int(timetable.pattern_arrivals[pattern_idx][alight_position][trip_row])
+        legs.append({
+            "mode": "transit",
+            "route_id": ds.route_ids[route_idx],
+            "route_name": ds.route_short_names[route_idx] or ds.route_long_names[route_idx],
+            "headsign": ds.trip_headsigns[trip_idx],
+            "trip_id": ds.trip_ids[trip_idx],
+            "from": _stop_json(ds, board_stop),
+            "to": _stop_json(ds, stop_idx),
+            "departure_time": datetime.fromtimestamp(departure, ds.timezone).isoformat(),
+            "arrival_time": datetime.fromtimestamp(arrival, ds.timezone).isoformat(),
+            "num_stops": alight_position - board_position,
+            "_departure": departure
+        })
+        stop_idx = board_stop
+        k -= 1
+
+    access_walk = int(state.parent_d[0, stop_idx])
+    legs.append({
+        "mode": "walk",
+        "from": {"name": "Origin", "lat": origin[0], "lon": origin[1]},
+        "to": _stop_json(ds, stop_idx),
+        "duration_seconds": access_walk
+    })
+    legs.reverse()
+    # Labels are shared across departure scans, so derive the departure from the first ride
+    first_ride = next((leg for leg in legs if leg["mode"] == "transit"), None)
+    departure = first_ride["_departure"] - access_walk if first_ride else day_start
+    for leg in legs:
+        leg.pop("_departure", None)
+    return legs, departure
+
+
+def _stop_json(ds, stop_idx):
+    return {
+        "id": ds.stop_ids[stop_idx],
+        "name": ds.stop_names[stop_idx],
+        "lat": float(ds.stop_lat[stop_idx]),
+        "lon": float(ds.stop_lon[stop_idx])
+    }
+
+
+def _access_stops(ds, lat, lon):
+    stops, distances = ds.nearby_stops(lat, lon, MAX_ACCESS_WALK)
+    walks = (distances / WALK_SPEED).astype(np.int32)
+    return list(zip(stops.tolist(), walks.tolist()))
+
+
+def plan_trip(from_lat, from_lon, to_lat, to_lon, depart_at=None, window_minutes=30, max_transfers=3):
+    """
+    Plan transit journeys between two points with range RAPTOR.
+
+    Every departure from the origin's access stops within the window is
+    scanned latest-first, keeping labels between scans, and the Pareto-optimal
+    journeys (later departure, earlier arrival, fewer transfers) are returned.
+
+    Args:
+        from_lat (float): Origin latitude
+        from_lon (float): Origin longitude
+        to_lat (float): Destination latitude
+        to_lon (float): Destination longitude
+        depart_at (float, optional): Earliest departure as unix time. Defaults to now.
+        window_minutes (int, optional): Departure window. Defaults to 30.
+        max_transfers (int, optional): Maximum transfers. Defaults to 3.
+
+    Returns:
+        dict: Journeys and query statistics, or None if no timetable is loaded
+    """
+    timetable = get_raptor_timetable()
+    if timetable is None:
+        return None
+    ds = timetable.dataset
+    started = time.perf_counter()
+
+    depart_at = depart_at or time.time()
+    rounds = min(max_transfers + 1, MAX_ROUNDS)
+    day_start, active_trips = _service_frame(ds, depart_at)
+    window_start = int(depart_at - day_start)
+    window_end = window_start + window_minutes * 60
+
+    access = _access_stops(ds, from_lat, from_lon)
+    egress = _access_stops(ds, to_lat, to_lon)
+    result = {"journeys": [], "origin_stops": len(access), "destination_stops": len(egress)}
+    if not access or not egress:
+        result["computed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
+    # Candidate departure times: each departure from an access stop, shifted back by the walk
+    departures = set()
+    for stop_idx, walk in access:
+        for departure_ts, _ in ds.departures_between(stop_idx, day_start + window_start + walk, day_start + window_end + walk):
+            departures.add(int(departure_ts - day_start) - walk)
+    departures = sorted(departures, reverse=True)[:MAX_DEPARTURE_ITERATIONS]
+
+    egress_stops = np.array([stop_idx for stop_idx, _ in egress], dtype=np.int64)
+    egress_walks = np.array([walk for _, walk in egress], dtype=np.int64)
+
+    def target_bound():
+        return int((state.best[egress_stops] + egress_walks).min())
+
+    state = RaptorState(len(ds.stop_ids), rounds)
+    best_by_round = [INF] * (rounds + 1)
+    journeys = []
+    for departure in departures:
+        run_raptor(timetable, state, access, departure, active_trips, rounds, target_bound)
+        for k in range(1, rounds + 1):
+            totals = state.arrival[k, egress_stops] + egress_walks
+            best = int(np.argmin(totals))
+            arrival = int(totals[best])
+            if arrival >= best_by_round[k] or arrival >= INF:
+                continue
+            best_by_round[k] = arrival
+            legs, journey_departure = _reconstruct(timetable, state, int(egress_stops[best]), int(egress_walks[best]), k,
+                                                   day_start, (from_lat, from_lon), (to_lat, to_lon))
+            journeys.append({
+                "departure": journey_departure,
+                "arrival": day_start + arrival,
+                "transfers": k - 1,
+                "legs": legs
+            })
+
+    # Keep the Pareto set: drop journeys beaten on departure, arrival and transfers
+    pareto = []
+    for journey in sorted(journeys, key=lambda j: (j["arrival"], j["transfers"], -j["departure"])):
+        if any(p["departure"] >= journey["departure"] and p["transfers"] <= journey["transfers"] for p in pareto):
+            continue
+        pareto.append(journey)
+
+    for journey in pareto:
+        result["journeys"].append({
+            "departure_time": datetime.fromtimestamp(journey["departure"], ds.timezone).isoformat(),
+            "arrival_time": datetime.fromtimestamp(journey["arrival"], ds.timezone).isoformat(),
+            "duration_minutes": round((journey["arrival"] - journey["departure"]) / 60),
+            "transfers": journey["transfers"],
+            "legs": journey["legs"]
+        })
+    result["departures_scanned"] = len(departures)
+    result["computed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+# Reachability results are shared by every origin in the same cell and departure bucket
+REACHABLE_ORIGIN_CELL = 0.0025  # degrees, roughly 250 m
+REACHABLE_DEPARTURE_BUCKET = 15 * 60  # seconds
+REACHABLE_PROFILE_WINDOW = 10  # minutes of departures folded into one profile
+REACHABLE_CACHE_SECONDS = 15 * 60
+REACHABLE_CACHE_SIZE = 512
+
+
+def build_reachable_cache(dataset):
+    """
+    An empty (cache, expiry) pair of dicts for a dataset's reachability results.
+
+    Results hold stop indices, which only mean something in the dataset
+    they were computed on, so the cache lives and dies with it.
+    """
+    return {}, {}
+
+
+def _profile_travel_times(timetable, lat, lon, departure_ts, budget_seconds):
+    """
+    One-to-all profile search: minimum travel time to every stop over the
+    departures in REACHABLE_PROFILE_WINDOW, so the answer doesn't hinge on
+    just missing a bus.
+
+    Returns:
+        tuple: (stop indices, travel seconds) for stops within the budget
+    """
+    ds = timetable.dataset
+    day_start, active_trips = _service_frame(ds, departure_ts)
+    window_start = int(departure_ts - day_start)
+    window_end = window_start + REACHABLE_PROFILE_WINDOW * 60
+
+    access = _access_stops(ds, lat, lon)
+    n_stops = len(ds.stop_ids)
+    travel = np.full(n_stops, INF, dtype=np.int64)
+    for stop_idx, walk in access:
+        travel[stop_idx] = walk
+    if not access:
+        return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64)
+
+    departures = {window_start}
+    for stop_idx, walk in access:
+        for departure_ts_, _ in ds.departures_between(stop_idx, day_start + window_start + walk, day_start + window_end + walk):
+            departures.add(int(departure_ts_ - day_start) - walk)
+    departures = sorted(departures, reverse=True)[:MAX_DEPARTURE_ITERATIONS]
+
+    state = RaptorState(n_stops, MAX_ROUNDS)
+    for departure in departures:
+        run_raptor(timetable, state, access, departure, active_trips, MAX_ROUNDS,
+                   lambda: departure + budget_seconds)
+        np.minimum(travel, state.best - departure, out=travel)
+
+    reached = np.flatnonzero(travel <= budget_seconds)
+    return reached.astype(np.int32), travel[reached]
+
+
+def _grid_cells(ds, lat, lon, stops, travel, budget_seconds, cell_size):
+    """
+    Convert stop travel times into an isochrone grid.
+
+    Each reachable stop stamps its walkable neighbourhood onto the grid with
+    one vectorized minimum over the covered block.
+    """
+    max_walk = min(budget_seconds * WALK_SPEED, MAX_ACCESS_WALK)
+    reach = max_walk
+    if len(stops):
+        reach += float(equirectangular_distance(lat, lon, ds.stop_lat[stops], ds.stop_lon[stops]).max())
+
+    lat_step = cell_size / 111111
+    lon_step = cell_size / (111111 * max(np.cos(np.radians(lat)), 0.01))
+    half_cells = int(np.ceil(reach / cell_size))
+    cell_lats = lat + np.arange(-half_cells, half_cells + 1) * lat_step
+    cell_lons = lon + np.arange(-half_cells, half_cells + 1) * lon_step
+    grid = np.full((len(cell_lats), len(cell_lons)), np.inf)
+
+    # Walking straight from the origin, then from every reachable stop
+    sources = [(lat, lon, 0.0)] + [
+        (float(ds.stop_lat[s]), float(ds.stop_lon[s]), float(t)) for s, t in zip(stops.tolist(), travel.tolist())
+    ]
+    radius_cells = int(np.ceil(max_walk / cell_size))
+    for source_lat, source_lon, source_time in sources:
+        row = int(round((source_lat - cell_lats[0]) / lat_step))
+        col = int(round((source_lon - cell_lons[0]) / lon_step))
+        r0, r1 = max(row - radius_cells, 0), min(row + radius_cells + 1, len(cell_lats))
+        c0, c1 = max(col - radius_cells, 0), min(col + radius_cells + 1, len(cell_lons))
+        if r0 >= r1 or c0 >= c1:
+            continue
+        dy = (cell_lats[r0:r1, None] - source_lat) * 111111
+        dx = (cell_lons[None, c0:c1] - source_lon) * 111111 * np.cos(np.radians(source_lat))
+        distance = np.sqrt(dx * dx + dy * dy)
+        walk_time = np.where(distance <= max_walk, source_time + distance / WALK_SPEED, np.inf)
+        np.minimum(grid[r0:r1, c0:c1], walk_time, out=grid[r0:r1, c0:c1])
+
+    rows, cols = np.nonzero(grid <= budget_seconds)
+    return [
+        {"lat": round(float(cell_lats[r]), 5), "lon": round(float(cell_lons[c]), 5), "minutes": round(float(grid[r, c]) / 60, 1)}
+        for r, c in zip(rows.tolist(), cols.tolist())
+    ]
+
+
+def get_reachable(lat, lon, depart_at=None, budget_minutes=30, include_grid=False, cell_size=250):
+    """
+    Find everything reachable by transit and walking within a time budget.
+
+    Results are cached per origin cell and departure bucket, so nearby
+    users asking around the same time share one profile search.
+
+    Args:
+        lat (float): Origin latitude
+        lon (float): Origin longitude
+        depart_at (float, optional): Departure as unix time. Defaults to now.
+        budget_minutes (int, optional): Travel time budget. Defaults to 30.
+        include_grid (bool, optional): Also return isochrone grid cells. Defaults to False.
+        cell_size (int, optional): Grid cell size in meters. Defaults to 250.
+
+    Returns:
+        dict: Reachable stops (and cells), or None if no timetable is loaded
+    """
+    timetable = get_raptor_timetable()
+    if timetable is None:
+        return None
+    ds = timetable.dataset
+    started = time.perf_counter()
+
+    depart_at = depart_at or time.time()
+    origin_lat = (np.floor(lat / REACHABLE_ORIGIN_CELL) + 0.5) * REACHABLE_ORIGIN_CELL
+    origin_lon = (np.floor(lon / REACHABLE_ORIGIN_CELL) + 0.5) * REACHABLE_ORIGIN_CELL
+    bucket = int(depart_at // REACHABLE_DEPARTURE_BUCKET) * REACHABLE_DEPARTURE_BUCKET
+    budget_seconds = budget_minutes * 60
+    cache_key = f"reachable_{origin_lat:.4f}_{origin_lon:.4f}_{bucket}_{budget_minutes}"
+    grid_key = f"{cache_key}_grid_{cell_size}"
+
+    reachable_cache, reachable_cache_expiry = ds.derived_value("reachable_cache", build_reachable_cache)
+    now = datetime.now()
+    cached = cache_key in reachable_cache and reachable_cache_expiry.get(cache_key, datetime.min) > now
+    record_cache("reachable", "hit" if cached else "miss")
+    if cached:
+        stops, travel = reachable_cache[cache_key]
+    else:
+        stops, travel = _profile_travel_times(timetable, origin_lat, origin_lon, bucket, budget_seconds)
+        _store_reachable(ds, cache_key, (stops, travel), now)
+
+    order = np.argsort(travel, kind="stable")
+    result = {
+        "origin": {"lat": round(float(origin_lat), 5), "lon": round(float(origin_lon), 5)},
+        "departure_time": datetime.fromtimestamp(bucket, ds.timezone).isoformat(),
+        "budget_minutes": budget_minutes,
+        "stops": [
+            {**_stop_json(ds, int(stops[i])), "minutes": round(int(travel[i]) / 60, 1)}
+            for i in order.tolist()
+        ],
+        "cached": cached
+    }
+
+    if include_grid:
+        if grid_key in reachable_cache and reachable_cache_expiry.get(grid_key, datetime.min) > now:
+            cells = reachable_cache[grid_key]
+        else:
+            cells = _grid_cells(ds, float(origin_lat), float(origin_lon), stops, travel, budget_seconds, cell_size)
+            _store_reachable(ds, grid_key, cells, now)
+        result["cell_size"] = cell_size
+        result["cells"] = cells
+
+    result["computed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+def _store_reachable(ds, key, value, now):
+    reachable_cache, reachable_cache_expiry = ds.derived_value("reachable_cache", build_reachable_cache)
+    # Drop the oldest entries once the cache is full
+    if len(reachable_cache) >= REACHABLE_CACHE_SIZE:
+        for old_key in sorted(reachable_cache_expiry, key=reachable_cache_expiry.get)[:REACHABLE_CACHE_SIZE // 4]:
+            reachable_cache.pop(old_key, None)
+            reachable_cache_expiry.pop(old_key, None)
+    reachable_cache[key] = value
+    reachable_cache_expiry[key] = now + timedelta(seconds=REACHABLE_CACHE_SECONDS)
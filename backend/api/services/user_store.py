@@ -0,0 +1,210 @@
+from contextlib import contextmanager
+import threading
+import sqlite3
+import queue
+
+from config import settings
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL UNIQUE,
+    email TEXT,
+    hashed_password TEXT NOT NULL,
+    disabled INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS saved_places (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    address TEXT,
+    category TEXT,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_saved_places_user ON saved_places(user_id);
+CREATE TABLE IF NOT EXISTS commute_profiles (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    origin_lat REAL NOT NULL,
+    origin_lon REAL NOT NULL,
+    destination_lat REAL NOT NULL,
+    destination_lon REAL NOT NULL,
+    window_start TEXT NOT NULL,
+    window_end TEXT NOT NULL,
+    days TEXT NOT NULL DEFAULT '12345',
+    mode TEXT NOT NULL DEFAULT 'car',
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_commute_profiles_user ON commute_profiles(user_id);
+"""
+
+# Queries are fixed strings so each pooled connection's statement cache
+# compiles them once and reuses the prepared statement afterwards
+SELECT_USER = "SELECT id, username, email, hashed_password, disabled FROM users WHERE username = ?"
+INSERT_USER = "INSERT OR IGNORE INTO users (username, email, hashed_password, disabled) VALUES (?, ?, ?, ?)"
+SELECT_PLACES = "SELECT id, name, lat, lon, address, category FROM saved_places WHERE user_id = ? ORDER BY id"
+INSERT_PLACE = "INSERT INTO saved_places (user_id, name, lat, lon, address, category) VALUES (?, ?, ?, ?, ?, ?)"
+DELETE_PLACE = "DELETE FROM saved_places WHERE id = ? AND user_id = ?"
+SELECT_COMMUTES = (
+    "SELECT id, user_id, name, origin_lat, origin_lon, destination_lat, destination_lon, "
+    "window_start, window_end, days, mode FROM commute_profiles WHERE user_id = ? ORDER BY id"
+)
+SELECT_ALL_COMMUTES = (
+    "SELECT id, user_id, name, origin_lat, origin_lon, destination_lat, destination_lon, "
+    "window_start, window_end, days, mode FROM commute_profiles ORDER BY id"
+)
+INSERT_COMMUTE = (
+    "INSERT INTO commute_profiles (user_id, name, origin_lat, origin_lon, destination_lat, "
+    "destination_lon, window_start, window_end, days, mode) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+DELETE_COMMUTE = "DELETE FROM commute_profiles WHERE id = ? AND user_id = ?"
+
+# Development account carried over from the old in-memory users_db
+SEED_USERS = [
+    ("testuser", "test@example.com", "testpassword123", 0),  # In a real app, this would be hashed
+]
+
+
+def sqlite_path(database_url):
+    """Extract the file path from a sqlite:/// database URL."""
+    prefix = "sqlite:///"
+    if not database_url.startswith(prefix):
+        raise ValueError(f"Unsupported DATABASE_URL (only SQLite is supported): {database_url}")
+    return database_url[len(prefix):] or ":memory:"
+
+
+class ConnectionPool:
+    """
+    Fixed-size pool of SQLite connections shared across request threads.
+
+    Connections are opened lazily up to the pool size and handed out
+    last-in-first-out, so a hot connection (with a warm statement cache)
+    is reused first.
+    """
+
+    def __init__(self, path, size=5):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=64)
+        try:
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA foreign_keys = ON")
+            if self.path != ":memory:":
+                conn.execute("PRAGMA journal_mode = WAL")
+                conn.execute("PRAGMA synchronous = NORMAL")
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection, committing on success and rolling back on error."""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._opened < self.size
+                if can_open:
+                    self._opened += 1
+            if can_open:
+                try:
+                    conn = self._open()
+                except Exception:
+                    # Give the slot back, or enough failed opens leave nothing to wait for
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+            else:
+                conn = self._idle.get(timeout=10)
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._idle.put(conn)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the shared connection pool, creating the schema on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                path = sqlite_path(settings.DATABASE_URL)
+                # Every :memory: connection is its own database, so it can't be pooled
+                size = 1 if path == ":memory:" else settings.DATABASE_POOL_SIZE
+                pool = ConnectionPool(path, size)
+                with pool.connection() as conn:
+                    conn.executescript(SCHEMA)
+                    for username, email, password, disabled in SEED_USERS:
+                        conn.execute(INSERT_USER, (username, email, password, disabled))
+                _pool = pool
+    return _pool
+
+
+def get_user(username):
+    """Look up a user row by username, or None."""
+    with get_pool().connection() as conn:
+        row = conn.execute(SELECT_USER, (username,)).fetchone()
+    return dict(row) if row else None
+
+
+def list_saved_places(user_id):
+    """Return a user's saved places."""
+    with get_pool().connection() as conn:
+        return [dict(row) for row in conn.execute(SELECT_PLACES, (user_id,))]
+
+
+def add_saved_place(user_id, name, lat, lon, address=None, category=None):
+    """Save a place for a user and return its id."""
+    with get_pool().connection() as conn:
+        return conn.execute(INSERT_PLACE, (user_id, name, lat, lon, address, category)).lastrowid
+
+
+def delete_saved_place(user_id, place_id):
+    """Delete one of a user's saved places. Returns True if it existed."""
+    with get_pool().connection() as conn:
+        return conn.execute(DELETE_PLACE, (place_id, user_id)).rowcount > 0
+
+
+def list_commute_profiles(user_id):
+    """Return a user's commute profiles."""
+    with get_pool().connection() as conn:
+        return [dict(row) for row in conn.execute(SELECT_COMMUTES, (user_id,))]
+
+
+def list_all_commute_profiles():
+    """Return every user's commute profiles, for batch jobs."""
+    with get_pool().connection() as conn:
+        return [dict(row) for row in conn.execute(SELECT_ALL_COMMUTES)]
+
+
+def add_commute_profile(user_id, name, origin_lat, origin_lon, destination_lat, destination_lon,
+                        window_start, window_end, days="12345", mode="car"):
+    """Save a commute profile for a user and return its id."""
+    with get_pool().connection() as conn:
+        return conn.execute(INSERT_COMMUTE, (
+            user_id, name, origin_lat, origin_lon, destination_lat, destination_lon,
+            window_start, window_end, days, mode
+        )).lastrowid
+
+
+def delete_commute_profile(user_id, profile_id):
+    """Delete one of a user's commute profiles. Returns True if it existed."""
+    with get_pool().connection() as conn:
+        return conn.execute(DELETE_COMMUTE, (profile_id, user_id)).rowcount > 0
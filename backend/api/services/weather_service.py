@@ -1,75 +1,314 @@
-import requests
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import contextvars
 from datetime import datetime, timedelta
+from math import atan2, cos, degrees, floor, radians, sin
+import threading
+import time
 import json
-import os
-import sys
 
-# Add the parent directory to sys.path to import config
-sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 from config import settings
+from utils.lazy import lazy_import
+from .timeseries_service import record
+from .gtfs_service import agency_isoformat
+from ..profiling import upstream, record_cache
 
-# Simple memory cache
+requests = lazy_import("requests")
+
+# Requests are snapped to ~1 km; weather doesn't vary below that
+WEATHER_COORD_DECIMALS = 2
+WEATHER_CACHE_TTL = timedelta(minutes=15)
+WEATHER_FORECAST_TTL = timedelta(hours=1)
+
+# Departures closer than this get current conditions instead of the forecast
+FORECAST_MIN_LEAD_SECONDS = 30 * 60
+FORECAST_STEP_SECONDS = 3600
+
+# Fields blended between grid nodes; everything else comes from the nearest node
+NUMERIC_FIELDS = ("temperature", "feels_like", "humidity", "pressure", "wind_speed", "wind_u", "wind_v", "pop")
+
+# Simple memory cache, holding both grid nodes and interpolated points
 cache = {}
 cache_expiry = {}
 
-def get_weather_data(lat, lon):
+# In-flight grid node requests, so concurrent misses share one upstream call
+_inflight = {}
+_inflight_lock = threading.Lock()
+# Fetches the (up to four) missing nodes around a point in parallel
+_node_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="weather-grid")
+
+
+def weather_cache_key(lat, lon, hour=None):
+    """Build the cache key for a weather request, optionally for a forecast hour."""
+    if hour is None:
+        return f"weather_{lat}_{lon}"
+    return f"weather_{lat}_{lon}_{hour}"
+
+
+def forecast_hour(at):
+    """
+    Forecast hour (unix time, on the hour) for a departure time, or None when
+    the departure is close enough that current conditions apply.
+    """
+    if at is None or at - time.time() < FORECAST_MIN_LEAD_SECONDS:
+        return None
+    return int(round(at / FORECAST_STEP_SECONDS) * FORECAST_STEP_SECONDS)
+
+
+def grid_nodes(lat, lon):
+    """
+    The grid nodes surrounding a point with their bilinear weights.
+
+    Nodes sit every WEATHER_GRID_DEGREES; nodes with no weight (a point on a
+    grid line) are left out so they aren't fetched.
+
+    Returns:
+        list: ((row, col), weight) pairs, weights summing to 1
+    """
+    step = settings.WEATHER_GRID_DEGREES
+    y, x = lat / step, lon / step
+    row, col = floor(y), floor(x)
+    fy, fx = y - row, x - col
+    weighted = [
+        ((row, col), (1 - fy) * (1 - fx)),
+        ((row + 1, col), fy * (1 - fx)),
+        ((row, col + 1), (1 - fy) * fx),
+        ((row + 1, col + 1), fy * fx)
+    ]
+    return [(node, weight) for node, weight in weighted if weight > 1e-9]
+
+
+def _node_coordinates(node):
+    step = settings.WEATHER_GRID_DEGREES
+    return round(node[0] * step, 6), round(node[1] * step, 6)
+
+
+def _sample(entry):
+    """Flatten an OpenWeatherMap current or forecast entry into one sample."""
+    main = entry["main"]
+    wind = entry.get("wind", {})
+    speed = wind.get("speed", 0.0)
+    direction = radians(wind.get("deg", 0.0))
+    return {
+        "dt": entry["dt"],
+        "temperature": main["temp"],
+        "feels_like": main["feels_like"],
+        "humidity": main["humidity"],
+        "pressure": main["pressure"],
+        "wind_speed": speed,
+        # Directions are blended as vectors so 350° and 10° average to 0°, not 180°
+        "wind_u": speed * sin(direction),
+        "wind_v": speed * cos(direction),
+        "pop": entry.get("pop", 0.0),
+        "description": entry["weather"][0]["description"],
+        "icon": entry["weather"][0]["icon"]
+    }
+
+
+def _blend(weighted):
+    """Weighted average of samples; text fields come from the heaviest sample."""
+    total = sum(weight for _, weight in weighted)
+    nearest = max(weighted, key=lambda item: item[1])[0]
+    blended = dict(nearest)
+    for field in NUMERIC_FIELDS:
+        blended[field] = sum(sample[field] * weight for sample, weight in weighted) / total
+    return blended
+
+
+def _fetch_current(node):
+    lat, lon = _node_coordinates(node)
+    with upstream("openweathermap_current") as call:
+        response = requests.get("https://api.openweathermap.org/data/2.5/weather", params={
+            "lat": lat,
+            "lon": lon,
+            "appid": settings.WEATHER_API_KEY,
+            "units": "imperial"  # Use imperial units for US (Fahrenheit)
+        }, timeout=10)
+        call["bytes"] = len(response.content)
+    response.raise_for_status()
+    data = response.json()
+    sample = _sample(data)
+    sample["location"] = {"name": data["name"], "country": data["sys"]["country"]}
+    record("weather", [(
+        time.time(), lat, lon, sample["temperature"], sample["humidity"], sample["wind_speed"], sample["pop"],
+        sample["description"]
+    )])
+    return sample
+
+
+def _fetch_forecast(node):
+    """
+    Fetch a node's forecast and resample it to hourly steps.
+
+    OpenWeatherMap's free forecast comes in 3-hour steps; the hours between
+    are interpolated linearly so lookups are a single index.
+    """
+    lat, lon = _node_coordinates(node)
+    with upstream("openweathermap_forecast") as call:
+        response = requests.get("https://api.openweathermap.org/data/2.5/forecast", params={
+            "lat": lat,
+            "lon": lon,
+            "appid": settings.WEATHER_API_KEY,
+            "units": "imperial"
+        }, timeout=10)
+        call["bytes"] = len(response.content)
+    response.raise_for_status()
+    data = response.json()
+
+    steps = [_sample(entry) for entry in data["list"]]
+    if not steps:
+        raise ValueError("Empty forecast")
+    start = steps[0]["dt"] - steps[0]["dt"] % FORECAST_STEP_SECONDS
+    hours = []
+    after = 0
+    for ts in range(start, steps[-1]["dt"] + 1, FORECAST_STEP_SECONDS):
+        while after < len(steps) - 1 and steps[after]["dt"] < ts:
+            after += 1
+        before = max(0, after - 1) if steps[after]["dt"] > ts else after
+        span = steps[after]["dt"] - steps[before]["dt"]
+        fraction = (ts - steps[before]["dt"]) / span if span else 0.0
+        fraction = min(1.0, max(0.0, fraction))
+        hour = _blend([(steps[before], 1 - fraction), (steps[after], fraction)])
+        hour["dt"] = ts
+        hours.append(hour)
+    return {"start": start, "hours": hours, "location": {"name": data["city"]["name"], "country": data["city"]["country"]}}
+
+
+def _get_node(layer, node):
+    """
+    Return a cached grid node for a layer ("current" or "forecast"),
+    fetching it on a miss. Concurrent misses wait on a single upstream call.
+
+    Returns:
+        dict or None: The node data, or None if it couldn't be fetched
+    """
+    cache_key = f"weather_{layer}_{node[0]}_{node[1]}"
+    if cache_key in cache and cache_expiry.get(cache_key, datetime.min) > datetime.now():
+        record_cache("weather_node", "hit")
+        return cache[cache_key]
+
+    with _inflight_lock:
+        future = _inflight.get(cache_key)
+        leader = future is None
+        if leader:
+            future = Future()
+            _inflight[cache_key] = future
+
+    if not leader:
+        record_cache("weather_node", "coalesced")
+        try:
+            return future.result(timeout=15)
+        except FutureTimeoutError:
+            # Same as a failed fetch: the node drops out of the blend
+            print(f"Timed out waiting for weather grid node {cache_key}")
+            return None
+
+    record_cache("weather_node", "miss")
+    node_data = None
+    try:
+        if layer == "current":
+            node_data = _fetch_current(node)
+            ttl = WEATHER_CACHE_TTL
+        else:
+            node_data = _fetch_forecast(node)
+            ttl = WEATHER_FORECAST_TTL
+        cache[cache_key] = node_data
+        cache_expiry[cache_key] = datetime.now() + ttl
+    except Exception as e:
+        print(f"Error fetching weather grid node {cache_key}: {e}")
+    finally:
+        future.set_result(node_data)
+        with _inflight_lock:
+            _inflight.pop(cache_key, None)
+    return node_data
+
+
+def _get_nodes(layer, nodes):
+    """Fetch several grid nodes, running the cache misses in parallel."""
+    if len(nodes) == 1:
+        return [_get_node(layer, nodes[0])]
+    # Each task runs in a copy of the caller's context so it reports to the request's trace
+    contexts = [contextvars.copy_context() for _ in nodes]
+    return list(_node_pool.map(lambda context, node: context.run(_get_node, layer, node), contexts, nodes))
+
+
+def _node_expiry(layer, nodes):
+    """When the earliest of a set of cached grid nodes expires."""
+    return min(cache_expiry.get(f"weather_{layer}_{row}_{col}", datetime.now()) for row, col in nodes)
+
+
+def get_weather_data(lat, lon, at=None):
     """
     Get weather data for a specific location.
-    
+
+    Weather is fetched for the nodes of a fixed WEATHER_GRID_DEGREES grid and
+    interpolated bilinearly from the four nodes around the point, so upstream
+    calls scale with the area covered rather than with the number of users.
+
     Args:
         lat (float): Latitude
         lon (float): Longitude
-        
+        at (float, optional): Departure as unix time. Departures more than
+            half an hour out use the hourly forecast layer. Defaults to now.
+
     Returns:
         dict: Weather data for the location
     """
-    cache_key = f"weather_{lat}_{lon}"
-    
+    hour = forecast_hour(at)
+    cache_key = weather_cache_key(lat, lon, hour)
+
     # Check cache
     if cache_key in cache and cache_expiry.get(cache_key, datetime.min) > datetime.now():
+        record_cache("weather", "hit")
         return cache[cache_key]
-    
-    # Call OpenWeatherMap API
-    url = f"https://api.openweathermap.org/data/2.5/weather"
-    params = {
-        "lat": lat,
-        "lon": lon,
-        "appid": settings.WEATHER_API_KEY,
-        "units": "imperial"  # Use imperial units for US (Fahrenheit)
+    record_cache("weather", "miss")
+
+    layer = "current" if hour is None else "forecast"
+    weighted = grid_nodes(lat, lon)
+    nodes = [node for node, _ in weighted]
+    samples = []
+    location = None
+    for (node, weight), node_data in zip(weighted, _get_nodes(layer, nodes)):
+        if node_data is None:
+            continue
+        if hour is None:
+            sample = node_data
+        else:
+            index = (hour - node_data["start"]) // FORECAST_STEP_SECONDS
+            if not 0 <= index < len(node_data["hours"]):
+                continue
+            sample = node_data["hours"][index]
+        samples.append((sample, weight))
+        if location is None or weight > location[1]:
+            location = (node_data["location"], weight)
+
+    if not samples:
+        if hour is not None:
+            return {"error": "No forecast available for the requested time"}
+        return {"error": "Weather data unavailable"}
+
+    # Missing nodes drop out and the remaining weights are renormalized
+    blended = _blend(samples)
+    weather_data = {
+        "temperature": round(blended["temperature"], 1),
+        "feels_like": round(blended["feels_like"], 1),
+        "description": blended["description"],
+        "icon": blended["icon"],
+        "conditions": {
+            "humidity": round(blended["humidity"]),
+            "wind_speed": round(blended["wind_speed"], 1),
+            "wind_direction": round(degrees(atan2(blended["wind_u"], blended["wind_v"])) % 360),
+            "pressure": round(blended["pressure"])
+        },
+        "location": location[0],
+        "timestamp": datetime.now().isoformat(),
+        "source": "openweathermap"
     }
-    
-    try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        
-        data = response.json()
-        
-        # Process the data into a simpler format
-        weather_data = {
-            "temperature": data["main"]["temp"],
-            "feels_like": data["main"]["feels_like"],
-            "description": data["weather"][0]["description"],
-            "icon": data["weather"][0]["icon"],
-            "conditions": {
-                "humidity": data["main"]["humidity"],
-                "wind_speed": data["wind"]["speed"],
-                "wind_direction": data["wind"]["deg"],
-                "pressure": data["main"]["pressure"]
-            },
-            "location": {
-                "name": data["name"],
-                "country": data["sys"]["country"]
-            },
-            "timestamp": datetime.now().isoformat(),
-            "source": "openweathermap"
-        }
-        
-        # Cache the result for 15 minutes
-        cache[cache_key] = weather_data
-        cache_expiry[cache_key] = datetime.now() + timedelta(minutes=15)
-        
-        return weather_data
-    
-    except Exception as e:
-        print(f"Error fetching weather data: {e}")
-        return {"error": str(e)}
+    if hour is not None:
+        weather_data["forecast_time"] = agency_isoformat(hour)
+        weather_data["precipitation_probability"] = round(blended["pop"], 2)
+
+    # Cache the point until the first of its grid nodes goes stale
+    cache[cache_key] = weather_data
+    cache_expiry[cache_key] = _node_expiry(layer, nodes)
+
+    return weather_data
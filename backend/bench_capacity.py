@@ -0,0 +1,550 @@
+"""
+Capacity-planning load simulator.
+
+Builds a synthetic commuter population inside the Seattle coverage polygon
+of the default transit provider (the bounds is_seattle_area used to hard-code),
+with homes clustered around residential neighbourhoods and workplaces
+around job centres. Each commuter opens the app on the way to work, on the
+way home and sometimes in between. While the app is open it polls the way
+frontend/src/hooks/useLocationData.js does: weather, traffic and transit on
+open, then every 15, 5 and 10 minutes. Coordinates are rounded as the
+frontend rounds them.
+
+The busiest hour of the day is then replayed through the ASGI app in
+process, after a warm-up period:
+- Upstream APIs are stubbed, with a fixed latency plus jitter and a count
+  of calls per API.
+- Service clocks run on simulated time, so cache TTLs behave as they would
+  over the real hour.
+- Each instance size (threadpool workers per process) gets its own replay.
+
+For each instance size the script reports throughput, latency, requests
+shed by admission control, cache hit rate (requests answered without an
+upstream call) and upstream calls per minute, and how many instances the
+peak minute needs. A second replay splits the same traffic round-robin
+across fleets of instances, each with its own caches. That shows how the
+hit rate and upstream load change as the fleet scales out.
+
+Throughput is measured in process, without HTTP parsing or the network, so
+it is an upper bound for a real instance.
+
+Run this script from the backend directory:
+python bench_capacity.py [--population 2000] [--threads 8,16,40] [--fleet 1,2,4]
+"""
+
+import sys
+import os
+import argparse
+import asyncio
+import contextlib
+import contextvars
+import json
+import math
+import random
+import time
+from datetime import datetime
+
+# Add the project to path so we can import modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from config import settings
+
+# Keep the replay self-contained: no GTFS download, realtime feed or disk writes
+settings.GTFS_STATIC_ENABLED = False
+settings.GTFS_PRELOAD = False
+settings.GTFS_RT_ENABLED = False
+settings.TIMESERIES_ENABLED = False
+settings.ALERTS_ENABLED = False
+settings.FAST_RESPONSES_ENABLED = True
+
+import anyio
+import httpx
+import requests
+
+from api.main import app
+from api import responses
+from api.services import weather_service, traffic_service, transit_service
+from api.services.provider_service import point_in_polygon
+
+# Polling cadence of useLocationData.js, in seconds
+POLL_SECONDS = {"weather": 15 * 60, "traffic": 5 * 60, "transit": 10 * 60}
+
+# (lat, lon, spread in km, weight)
+HOME_CLUSTERS = [
+    (47.668, -122.384, 1.5, 8),   # Ballard
+    (47.623, -122.319, 1.0, 9),   # Capitol Hill
+    (47.661, -122.313, 1.0, 7),   # University District
+    (47.561, -122.387, 2.0, 6),   # West Seattle
+    (47.568, -122.311, 1.2, 4),   # Beacon Hill
+    (47.708, -122.325, 1.5, 5),   # Northgate
+    (47.637, -122.357, 1.0, 5),   # Queen Anne
+    (47.559, -122.287, 1.2, 4),   # Columbia City
+    (47.651, -122.350, 0.8, 4),   # Fremont
+    (47.719, -122.296, 1.5, 3),   # Lake City
+    (47.610, -122.200, 2.0, 7),   # Bellevue
+    (47.676, -122.206, 1.5, 4),   # Kirkland
+    (47.482, -122.209, 2.0, 4),   # Renton
+]
+WORK_CLUSTERS = [
+    (47.606, -122.335, 0.6, 30),  # Downtown
+    (47.625, -122.338, 0.6, 15),  # South Lake Union
+    (47.607, -122.324, 0.5, 6),   # First Hill
+    (47.655, -122.304, 0.8, 8),   # University of Washington
+    (47.615, -122.196, 0.8, 12),  # Downtown Bellevue
+    (47.640, -122.130, 1.0, 8),   # Redmond campuses
+    (47.580, -122.334, 0.8, 5),   # SODO
+]
+# Share of homes and workplaces spread uniformly instead of clustered
+BACKGROUND_SHARE = 0.15
+
+# Share of commuters who open the app on a given weekday
+DAILY_ACTIVE_SHARE = 0.8
+# Optional sessions: (probability, earliest start hour, latest start hour, at work)
+EXTRA_SESSIONS = [(0.3, 11.0, 14.0, True), (0.2, 19.0, 22.5, False)]
+
+# GPS noise on the reported location, in meters
+LOCATION_NOISE_METERS = 30
+
+# Instances are sized to run the peak minute at this utilization
+UTILIZATION_TARGET = 0.7
+
+# Upstream calls made while serving the current request
+_calls = contextvars.ContextVar("upstream_calls", default=None)
+
+_real_datetime = datetime
+
+
+class SimClock:
+    """Simulated wall clock, only ever moving forward."""
+
+    def __init__(self, start):
+        self.now = start
+
+    def advance(self, ts):
+        if ts > self.now:
+            self.now = ts
+
+
+class StubResponse:
+    """Just enough of requests.Response for the services."""
+
+    def __init__(self, payload, status_code=200):
+        self.content = json.dumps(payload).encode("utf-8")
+        self.status_code = status_code
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} from stub")
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class StubUpstreams:
+    """
+    Stands in for the requests module in the services: answers each
+    upstream API with a plausible payload after latency_ms (plus up to 50%
+    jitter), noting the call on the current request.
+    """
+
+    exceptions = requests.exceptions
+
+    def __init__(self, latency_ms, seed=0):
+        self.latency = latency_ms / 1000
+        self.random = random.Random(seed)
+
+    def get(self, url, params=None, timeout=None, stream=False, **kwargs):
+        params = params or {}
+        if "openweathermap" in url:
+            name, payload = "openweathermap", self.weather(params)
+        elif "tomtom" in url:
+            name, payload = "tomtom", self.traffic(params)
+        elif "stops-for-location" in url:
+            name, payload = "onebusaway", self.stops(params)
+        elif "/route/" in url:
+            name, payload = "onebusaway", self.route(url)
+        elif "arrivals-and-departures" in url:
+            name, payload = "onebusaway", self.arrivals(url)
+        else:
+            raise requests.exceptions.ConnectionError(f"No stub for {url}")
+        calls = _calls.get()
+        if calls is not None:
+            calls.append(name)
+        time.sleep(self.latency * (1 + 0.5 * self.random.random()))
+        return StubResponse(payload)
+
+    def weather(self, params):
+        return {
+            "main": {"temp": 55.0, "feels_like": 53.0, "humidity": 70, "pressure": 1015},
+            "wind": {"speed": 6.0, "deg": 200},
+            "weather": [{"description": "light rain", "icon": "10d"}],
+            "dt": int(time_source()),
+            "name": "Seattle",
+            "sys": {"country": "US"}
+        }
+
+    def traffic(self, params):
+        west, south, east, north = (float(v) for v in params["bbox"].split(","))
+        incidents = []
+        for i in range(12):
+            lon = west + (east - west) * (i + 0.5) / 12
+            lat = south + (north - south) * ((i * 7) % 12 + 0.5) / 12
+            incidents.append({
+                "type": "Feature",
+                "geometry": {"type": "LineString", "coordinates": [[lon, lat], [lon + 0.002, lat + 0.001]]},
+                "properties": {
+                    "id": f"stub-{lat:.3f}-{lon:.3f}",
+                    "magnitudeOfDelay": i % 4,
+                    "events": [{"description": "Slow traffic", "code": 101}],
+                    "delay": 60 * (i % 5)
+                }
+            })
+        return {"incidents": incidents}
+
+    def stops(self, params):
+        lat, lon = float(params["lat"]), float(params["lon"])
+        stops = []
+        for i in range(8):
+            stops.append({
+                "id": f"1_{abs(hash((round(lat, 3), round(lon, 3), i))) % 100000}",
+                "name": f"Stub Stop {i}",
+                "lat": lat + (i - 4) * 0.0006,
+                "lon": lon + (i % 3 - 1) * 0.0008,
+                "routeIds": [f"1_{100000 + (int(lat * 100) * 7 + int(-lon * 100) + i + k) % 60}" for k in range(3)]
+            })
+        return {"code": 200, "data": {"list": stops}}
+
+    def route(self, url):
+        route_id = url.rsplit("/", 1)[1].split(".")[0]
+        return {"code": 200, "data": {"entry": {"shortName": route_id[-2:], "longName": f"Route {route_id}"}}}
+
+    def arrivals(self, url):
+        now_ms = int(time_source() * 1000)
+        entries = []
+        for i in range(6):
+            scheduled = now_ms + (3 + i * 6) * 60000
+            entries.append({
+                "routeId": f"1_{100000 + i}",
+                "routeShortName": str(10 + i),
+                "tripHeadsign": "Downtown",
+                "tripId": f"1_trip{i}",
+                "scheduledArrivalTime": scheduled,
+                "predictedArrivalTime": scheduled + 60000 * (i % 3)
+            })
+        return {"code": 200, "data": {"entry": {"arrivalsAndDepartures": entries}}}
+
+
+def time_source():
+    return _clock.now if _clock is not None else time.time()
+
+
+_clock = None
+
+
+class SimDatetime(_real_datetime):
+    """datetime whose now() reads the simulated clock."""
+
+    @classmethod
+    def now(cls, tz=None):
+        return _real_datetime.fromtimestamp(time_source(), tz)
+
+
+def install_stubs(latency_ms, start):
+    """Point the services at the stub upstreams and the simulated clock."""
+    global _clock
+    _clock = SimClock(start)
+    stub = StubUpstreams(latency_ms)
+    for module in (weather_service, traffic_service, transit_service):
+        module.requests = stub
+    for name, module in list(sys.modules.items()):
+        if name.startswith("api") and getattr(module, "datetime", None) is _real_datetime:
+            module.datetime = SimDatetime
+    return _clock
+
+
+def reset_caches():
+    """Start an instance cold: empty service and encoded-body caches."""
+    for module in (weather_service, traffic_service, transit_service):
+        module.cache.clear()
+        module.cache_expiry.clear()
+    responses._encoded_cache.clear()
+
+
+def _cluster_point(rng, clusters, coverage, bounds):
+    """A point drawn from weighted gaussian clusters (or uniformly), inside the coverage."""
+    south, west, north, east = bounds
+    weights = [c[3] for c in clusters]
+    while True:
+        if rng.random() < BACKGROUND_SHARE:
+            lat, lon = rng.uniform(south, north), rng.uniform(west, east)
+        else:
+            c_lat, c_lon, spread_km, _ = rng.choices(clusters, weights)[0]
+            lat = rng.gauss(c_lat, spread_km / 111.1)
+            lon = rng.gauss(c_lon, spread_km / (111.1 * math.cos(math.radians(c_lat))))
+        if point_in_polygon(lat, lon, coverage):
+            return lat, lon
+
+
+def make_population(size, seed=1):
+    """
+    Commuters with a home and a workplace inside the default provider's coverage.
+
+    Returns:
+        list: (home (lat, lon), work (lat, lon)) per commuter
+    """
+    rng = random.Random(seed)
+    coverage = settings.TRANSIT_PROVIDERS[0]["coverage"]
+    lats = [lat for lat, _ in coverage]
+    lons = [lon for _, lon in coverage]
+    bounds = (min(lats), min(lons), max(lats), max(lons))
+    return [
+        (_cluster_point(rng, HOME_CLUSTERS, coverage, bounds), _cluster_point(rng, WORK_CLUSTERS, coverage, bounds))
+        for _ in range(size)
+    ]
+
+
+def _sessions(rng, home, work):
+    """(start hour, minutes open, location) for one commuter's day."""
+    if rng.random() > DAILY_ACTIVE_SHARE:
+        return []
+    sessions = [
+        (min(11.0, max(5.5, rng.gauss(7.9, 0.8))), rng.uniform(15, 50), home),
+        (min(21.0, max(14.5, rng.gauss(17.4, 1.0))), rng.uniform(15, 50), work),
+    ]
+    for probability, earliest, latest, at_work in EXTRA_SESSIONS:
+        if rng.random() < probability:
+            sessions.append((rng.uniform(earliest, latest), rng.uniform(5, 20), work if at_work else home))
+    return sessions
+
+
+def make_requests(population, day_start, seed=2):
+    """
+    A day of requests from the population, sorted by time.
+
+    Returns:
+        list: (unix time, kind, path, params) tuples
+    """
+    rng = random.Random(seed)
+    events = []
+    for home, work in population:
+        for start_hour, minutes, (lat, lon) in _sessions(rng, home, work):
+            noise = LOCATION_NOISE_METERS / 111111
+            lat = lat + rng.gauss(0, noise)
+            lon = lon + rng.gauss(0, noise / math.cos(math.radians(lat)))
+            start = day_start + start_hour * 3600
+            end = start + minutes * 60
+            # Rounded like weatherSlice / trafficSlice / transitSlice
+            params = {
+                "weather": {"lat": round(lat, 2), "lon": round(lon, 2)},
+                "traffic": {"lat": round(lat, 3), "lon": round(lon, 3), "radius": 5000},
+                "transit": {"lat": round(lat, 3), "lon": round(lon, 3), "radius": 500},
+            }
+            for kind, interval in POLL_SECONDS.items():
+                ts = start
+                while ts < end:
+                    events.append((ts, kind, f"/api/{kind}/", params[kind]))
+                    ts += interval
+    events.sort(key=lambda event: event[0])
+    return events
+
+
+def hourly_profile(events, day_start):
+    counts = [0] * 24
+    for ts, *_ in events:
+        counts[min(23, int((ts - day_start) // 3600))] += 1
+    return counts
+
+
+def peak_minute(events):
+    """(minute start, requests/s, requests/s by kind) of the busiest minute."""
+    minutes = {}
+    for ts, kind, *_ in events:
+        bucket = minutes.setdefault(int(ts // 60) * 60, {})
+        bucket[kind] = bucket.get(kind, 0) + 1
+    start, kinds = max(minutes.items(), key=lambda item: sum(item[1].values()))
+    return start, sum(kinds.values()) / 60, {kind: count / 60 for kind, count in kinds.items()}
+
+
+def busiest_window(events, minutes):
+    """Start of the busiest `minutes`-long window, on a 5-minute grid."""
+    step = 300
+    counts = {}
+    for ts, *_ in events:
+        bucket = int(ts // step) * step
+        counts[bucket] = counts.get(bucket, 0) + 1
+    span = minutes * 60 // step
+    return max(counts, key=lambda start: sum(counts.get(start + i * step, 0) for i in range(span)))
+
+
+async def replay(events, threads, clients, clock, measure_from):
+    """
+    Send events through the app with `clients` concurrent callers and a
+    threadpool of `threads` workers, as fast as the instance allows.
+
+    Returns:
+        dict: Per-kind counts, latencies and upstream calls for events at or
+            after measure_from, plus the wall time they took
+    """
+    anyio.to_thread.current_default_thread_limiter().total_tokens = threads
+    stats = {kind: {"count": 0, "ok": 0, "shed": 0, "hits": 0, "latency": [], "calls": {}} for kind in POLL_SECONDS}
+    position = 0
+    wall = {}
+
+    async def caller(client):
+        nonlocal position
+        while position < len(events):
+            ts, kind, path, params = events[position]
+            position += 1
+            clock.advance(ts)
+            measured = ts >= measure_from
+            if measured and "start" not in wall:
+                wall["start"] = time.perf_counter()
+            calls = []
+            _calls.set(calls)
+            started = time.perf_counter()
+            response = await client.get(path, params=params)
+            if not measured:
+                continue
+            entry = stats[kind]
+            entry["count"] += 1
+            entry["latency"].append(time.perf_counter() - started)
+            if response.status_code == 200:
+                entry["ok"] += 1
+                entry["hits"] += not calls
+            elif response.status_code == 503 and "retry-after" in response.headers:
+                entry["shed"] += 1
+            for name in calls:
+                entry["calls"][name] = entry["calls"].get(name, 0) + 1
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://capacity.test") as client:
+        await asyncio.gather(*(caller(client) for _ in range(clients)))
+    wall["seconds"] = time.perf_counter() - wall.get("start", time.perf_counter())
+    return {"kinds": stats, "seconds": wall["seconds"]}
+
+
+def run_replay(events, threads, clients, clock, measure_from):
+    """replay() on a fresh event loop, with the services' log prints silenced."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return asyncio.run(replay(events, threads, clients, clock, measure_from))
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def summarize(result, window_minutes):
+    kinds = result["kinds"]
+    count = sum(k["count"] for k in kinds.values())
+    ok = sum(k["ok"] for k in kinds.values())
+    calls = {}
+    for k in kinds.values():
+        for name, n in k["calls"].items():
+            calls[name] = calls.get(name, 0) + n
+    latency = [value for k in kinds.values() for value in k["latency"]]
+    return {
+        "count": count,
+        "throughput": ok / result["seconds"] if result["seconds"] else 0.0,
+        "p50": _percentile(latency, 0.5) * 1000,
+        "p95": _percentile(latency, 0.95) * 1000,
+        "shed": sum(k["shed"] for k in kinds.values()) / max(count, 1),
+        "hit_rate": {kind: k["hits"] / max(k["ok"], 1) for kind, k in kinds.items()},
+        "overall_hit_rate": sum(k["hits"] for k in kinds.values()) / max(ok, 1),
+        "calls_per_minute": {name: n / window_minutes for name, n in sorted(calls.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--population", type=int, default=2000, help="Commuters to simulate")
+    parser.add_argument("--threads", default="8,16,40", help="Instance sizes: threadpool workers per process")
+    parser.add_argument("--clients", type=int, default=64, help="Concurrent callers during replay")
+    parser.add_argument("--fleet", default="1,2,4", help="Fleet sizes to replay with per-instance caches")
+    parser.add_argument("--window-minutes", type=int, default=60, help="Length of the replayed peak window")
+    parser.add_argument("--warmup-minutes", type=int, default=15, help="Replayed before the window, not measured")
+    parser.add_argument("--upstream-ms", type=float, default=120, help="Stubbed upstream latency")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    day_start = _real_datetime.combine(_real_datetime.now().date(), _real_datetime.min.time()).timestamp()
+    population = make_population(args.population, args.seed)
+    events = make_requests(population, day_start, args.seed + 1)
+
+    print(f"Population: {args.population:,} commuters, {len(events):,} requests over the day")
+    hourly = hourly_profile(events, day_start)
+    scale = max(hourly) / 50 or 1
+    for hour, count in enumerate(hourly):
+        if count:
+            print(f"  {hour:02d}:00 {count:>8,} {'#' * int(count / scale)}")
+    peak_start, peak_rps, peak_kinds = peak_minute(events)
+    peak_label = _real_datetime.fromtimestamp(peak_start).strftime("%H:%M")
+    kinds_label = ", ".join(f"{kind} {rps:.1f}" for kind, rps in sorted(peak_kinds.items()))
+    print(f"Peak minute {peak_label}: {peak_rps:.1f} req/s ({kinds_label})\n")
+
+    window_start = busiest_window(events, args.window_minutes)
+    warmup_start = window_start - args.warmup_minutes * 60
+    window_end = window_start + args.window_minutes * 60
+    window = [event for event in events if warmup_start <= event[0] < window_end]
+    print(f"Replaying {_real_datetime.fromtimestamp(window_start):%H:%M}-{_real_datetime.fromtimestamp(window_end):%H:%M} "
+          f"({args.warmup_minutes} min warm-up, {len(window):,} requests), upstream latency {args.upstream_ms:.0f} ms, "
+          f"{args.clients} concurrent callers\n")
+
+    clock = install_stubs(args.upstream_ms, warmup_start)
+
+    # Saturate one instance: what it sustains bounds how many the peak needs
+    print("Instance throughput: as fast as admission control lets requests through")
+    print(f"{'threads':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'shed':>6}  instances for the peak minute")
+    for threads in [int(value) for value in args.threads.split(",")]:
+        reset_caches()
+        clock.now = warmup_start
+        summary = summarize(run_replay(window, threads, args.clients, clock, window_start), args.window_minutes)
+        instances = math.ceil(peak_rps / (summary["throughput"] * UTILIZATION_TARGET)) if summary["throughput"] else 0
+        print(f"{threads:>7} {summary['throughput']:>8.1f} {summary['p50']:>8.1f} {summary['p95']:>8.1f} "
+              f"{summary['shed']:>6.1%}  {instances:>5} at {UTILIZATION_TARGET:.0%} utilization")
+
+    # Cache behavior at the simulated pace: admission control off so nothing is
+    # shed, and round-robin balancing gives every instance a slice of everyone
+    settings.ADMISSION_CONTROL_ENABLED = False
+    threads = max(int(value) for value in args.threads.split(","))
+    print("\nCaches and upstream load over the window (round-robin, caches per instance)")
+    print(f"{'instances':>9} {'hits':>6} {'weather':>8} {'traffic':>8} {'transit':>8}  upstream calls/min")
+    for size in [int(value) for value in args.fleet.split(",")]:
+        merged = None
+        for shard in range(size):
+            reset_caches()
+            clock.now = warmup_start
+            result = run_replay(window[shard::size], threads, args.clients, clock, window_start)
+            if merged is None:
+                merged = result
+                continue
+            merged["seconds"] += result["seconds"]
+            for kind, entry in result["kinds"].items():
+                target = merged["kinds"][kind]
+                for key in ("count", "ok", "shed", "hits"):
+                    target[key] += entry[key]
+                target["latency"] += entry["latency"]
+                for name, n in entry["calls"].items():
+                    target["calls"][name] = target["calls"].get(name, 0) + n
+        summary = summarize(merged, args.window_minutes)
+        hits = summary["hit_rate"]
+        calls = ", ".join(f"{name} {rate:,.0f}" for name, rate in summary["calls_per_minute"].items())
+        print(f"{size:>9} {summary['overall_hit_rate']:>6.1%} {hits['weather']:>8.1%} {hits['traffic']:>8.1%} "
+              f"{hits['transit']:>8.1%}  {calls}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark script for the response serialization and compression paths.
+Compares the default JSON path with the fast path on a large synthetic
+traffic payload, reporting bytes/sec and CPU time per response.
+
+Run this script from the backend directory:
+python bench_responses.py [incident_count]
+"""
+
+import sys
+import os
+import json
+import time
+from datetime import datetime
+
+# Add the project to path so we can import modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from api.responses import encode_json, encode_msgpack, encoded_body, compress, orjson, brotli, msgpack
+
+def make_traffic_payload(count):
+    """Build a traffic response shaped like get_traffic_data's output."""
+    incidents = []
+    for i in range(count):
+        incidents.append({
+            "id": f"incident-{i}",
+            "type": str(i % 14),
+            "severity": i % 5,
+            "description": "Stationary traffic between Mercer St and Denny Way",
+            "location": {"lat": 47.6 + i * 1e-4, "lon": -122.33 - i * 1e-4},
+            "start_time": "2025-05-01T07:30:00Z",
+            "end_time": "2025-05-01T09:00:00Z",
+            "delay": 120 + i
+        })
+    return {
+        "incidents": incidents,
+        "count": len(incidents),
+        "timestamp": datetime.now().isoformat(),
+        "source": "tomtom"
+    }
+
+def measure(name, fn, iterations):
+    """Run fn repeatedly and print throughput and CPU cost per response."""
+    fn()  # warm up
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    size = 0
+    for _ in range(iterations):
+        size = len(fn())
+    cpu = (time.process_time() - cpu_start) / iterations
+    wall = (time.perf_counter() - wall_start) / iterations
+    print(f"{name:<34} {size:>10,} B {cpu * 1000:>9.3f} ms CPU {size / wall / 1e6:>10.1f} MB/s")
+
+def bench_responses(count=2000, iterations=50):
+    """Benchmark each serialization path for one payload size."""
+    payload = make_traffic_payload(count)
+    print(f"Payload: {count} incidents (orjson={'yes' if orjson else 'no'}, brotli={'yes' if brotli else 'no'}, "
+          f"msgpack={'yes' if msgpack else 'no'})\n")
+
+    measure("default json.dumps", lambda: json.dumps(payload).encode("utf-8"), iterations)
+    measure("fast encoder", lambda: encode_json(payload), iterations)
+    measure("fast encoder + gzip", lambda: compress(encode_json(payload), "gzip"), iterations)
+    if brotli is not None:
+        measure("fast encoder + br", lambda: compress(encode_json(payload), "br"), iterations)
+    if msgpack is not None:
+        measure("msgpack", lambda: encode_msgpack(payload), iterations)
+        measure("msgpack + gzip", lambda: compress(encode_msgpack(payload), "gzip"), iterations)
+
+    # Cache hits reuse the bytes stored next to the service cache entry
+    encoded_body(payload, "gzip", "bench")
+    measure("cached hit (gzip)", lambda: encoded_body(payload, "gzip", "bench")[0], iterations)
+
+if __name__ == "__main__":
+    bench_responses(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,113 @@
+"""
+Cold start benchmark for the API.
+
+Measures how long `import api.main` takes in a fresh interpreter (with a
+`-X importtime` breakdown of the slowest modules) and how long a freshly
+spawned uvicorn server takes to answer its first /api/health request.
+Exits non-zero when either exceeds IMPORT_BUDGET_MS / STARTUP_BUDGET_MS,
+so it can run as a CI gate.
+
+Run this script from the backend directory:
+python bench_startup.py [runs]
+"""
+
+import sys
+import os
+import socket
+import subprocess
+import time
+import urllib.request
+
+from config import settings
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def measure_import(runs):
+    """Return the best wall time (ms) for importing api.main in a new interpreter."""
+    code = "import time; t = time.perf_counter(); import api.main; print((time.perf_counter() - t) * 1000)"
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return min(timings)
+
+
+def slowest_imports(limit=10):
+    """Return the slowest top-level imports reported by -X importtime."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import api.main"],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    ).stderr
+
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name = name[1:]
+        # Only count packages imported directly, their children are included in the total
+        if name.startswith("  ") and not name.startswith("   "):
+            modules.append((int(cumulative) / 1000, name.strip()))
+    modules.sort(reverse=True)
+    return modules[:limit]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_first_response(timeout=30):
+    """Spawn uvicorn and return ms until /api/health first answers 200."""
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/api/health"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return (time.perf_counter() - start) * 1000
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError(f"Server did not answer {url} within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+
+    print("Slowest imports (cumulative ms):")
+    for cumulative_ms, name in slowest_imports():
+        print(f"  {cumulative_ms:8.1f}  {name}")
+
+    import_ms = measure_import(runs)
+    startup_ms = measure_first_response()
+
+    print(f"\nimport api.main:     {import_ms:8.1f} ms (budget {settings.IMPORT_BUDGET_MS} ms)")
+    print(f"first /api/health:   {startup_ms:8.1f} ms (budget {settings.STARTUP_BUDGET_MS} ms)")
+
+    failed = False
+    if import_ms > settings.IMPORT_BUDGET_MS:
+        print("FAIL: import time is over budget")
+        failed = True
+    if startup_ms > settings.STARTUP_BUDGET_MS:
+        print("FAIL: time to first response is over budget")
+        failed = True
+    if not failed:
+        print("OK: startup is within budget")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
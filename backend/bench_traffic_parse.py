@@ -0,0 +1,116 @@
+"""
+Benchmark script for parsing TomTom incident responses.
+Compares the previous path (response.json() plus a dict per incident) with
+the streaming parser and compact Incident records on a synthetic
+metro-wide payload, reporting parse time, peak memory during the parse
+and memory still held by the parsed result.
+
+Run this script from the backend directory:
+python bench_traffic_parse.py [incident_count] [points_per_incident]
+"""
+
+import sys
+import os
+import json
+import time
+import tracemalloc
+
+# Add the project to path so we can import modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from api.services.traffic_service import iter_incidents, Incident, STREAM_CHUNK_BYTES
+
+def make_tomtom_body(count, points):
+    """Build a TomTom v5 incidentDetails response body as bytes."""
+    incidents = []
+    for i in range(count):
+        lat, lon = 47.5 + (i % 300) * 1e-3, -122.4 + (i // 300) * 1e-3
+        incidents.append({
+            "type": "Feature",
+            "geometry": {
+                "type": "LineString",
+                "coordinates": [[lon + k * 1e-4, lat + k * 5e-5] for k in range(points)]
+            },
+            "properties": {
+                "id": f"a1b2c3d4e5f6{i:08d}",
+                "iconCategory": 6,
+                "magnitudeOfDelay": i % 5,
+                "events": [{"description": "Stationary traffic", "code": 101, "iconCategory": 6}],
+                "startTime": "2025-05-01T07:30:00Z",
+                "endTime": "2025-05-01T09:00:00Z",
+                "from": "Mercer St",
+                "to": "Denny Way",
+                "delay": 60 + i % 900
+            }
+        })
+    return json.dumps({"incidents": incidents}).encode("utf-8")
+
+def legacy_parse(body, lat, lon):
+    """The previous get_traffic_data parse: whole-body json plus a dict per incident."""
+    data = json.loads(body.decode("utf-8"))
+    incidents = []
+    for incident in data.get("incidents", []):
+        try:
+            properties = incident.get("properties", {})
+            events = properties.get("events", [])
+            geometry = incident.get("geometry", {})
+            description = events[0].get("description", "") if events else ""
+            event_type = str(events[0].get("code", "")) if events else ""
+            coords_lat, coords_lon = lat, lon
+            if geometry.get("type") == "LineString" and geometry.get("coordinates"):
+                coords_lon, coords_lat = geometry["coordinates"][0][0], geometry["coordinates"][0][1]
+            incidents.append({
+                "id": properties.get("id", f"incident-{len(incidents)}"),
+                "type": event_type,
+                "severity": properties.get("magnitudeOfDelay", 0),
+                "description": description,
+                "location": {"lat": coords_lat, "lon": coords_lon},
+                "start_time": properties.get("startTime", ""),
+                "end_time": properties.get("endTime", ""),
+                "delay": properties.get("delay", 0)
+            })
+        except Exception as e:
+            print(f"Error processing incident: {e}")
+    return incidents
+
+def streaming_parse(body, lat, lon):
+    """The current parse: chunked streaming decode into Incident records."""
+    chunks = (body[i:i + STREAM_CHUNK_BYTES] for i in range(0, len(body), STREAM_CHUNK_BYTES))
+    incidents = []
+    for feature in iter_incidents(chunks):
+        incidents.append(Incident.from_feature(feature, lat, lon, len(incidents)))
+    return incidents
+
+def measure(name, parse, body, runs=3):
+    """Print best parse time, traced peak memory and retained result size."""
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        parse(body, 47.6, -122.33)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    result = parse(body, 47.6, -122.33)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<22} {best * 1000:>9.1f} ms {peak / 1e6:>10.1f} MB peak {retained / 1e6:>10.1f} MB retained "
+          f"({len(result)} incidents)")
+    return result
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    points = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    body = make_tomtom_body(count, points)
+    print(f"Payload: {count} incidents x {points} points, {len(body) / 1e6:.1f} MB\n")
+
+    legacy = measure("response.json + dicts", legacy_parse, body)
+    records = measure("streaming + records", streaming_parse, body)
+
+    # Both paths must agree on everything the old path kept
+    for old, new in zip(legacy, records):
+        converted = new.to_dict()
+        converted.pop("polyline")
+        assert converted == old, (old, converted)
+    print("\nOutputs match (records additionally keep the full geometry)")
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,7 @@ class Settings(BaseSettings):
     
     # Database configuration - Using SQLite for simplicity
     DATABASE_URL: str = "sqlite:///./site.db"
+    DATABASE_POOL_SIZE: int = 5
     
     # API keys
     WEATHER_API_KEY: str = Field(default_factory=lambda: os.environ.get("WEATHER_API_KEY", "32aa402c1136ae5ad8c7413f1abbadc6"))
@@ -16,7 +17,108 @@ class Settings(BaseSettings):
     KC_METRO_GTFS_URL: str = "https://kingcounty.gov/~/media/depts/metro/schedules/gtfs/current-feed.zip"
     KC_METRO_GTFS_RT_URL: str = "https://api.pugetsound.onebusaway.org/api/where"
     
+    # GTFS-Realtime feeds (URLs or local paths to recorded .pb files)
+    GTFS_RT_ENABLED: bool = True
+    GTFS_RT_TRIP_UPDATES_URL: str = "https://s3.amazonaws.com/kcm-alerts-realtime-prod/tripupdates.pb"
+    GTFS_RT_VEHICLE_POSITIONS_URL: str = "https://s3.amazonaws.com/kcm-alerts-realtime-prod/vehiclepositions.pb"
+    GTFS_RT_POLL_SECONDS: int = 30
+    GTFS_RT_MAX_AGE_SECONDS: int = 180
+    
+    # Transit providers, each answering for points inside its coverage polygon
+    # ([lat, lon] vertices). Types: "onebusaway" (url, key; static_gtfs when the
+    # local GTFS feed is the same agency's) and "gtfs" (the local feed only).
+    # Overlapping providers are queried concurrently and merged.
+    TRANSIT_PROVIDERS: list = [
+        {
+            "name": "King County Metro",
+            "type": "onebusaway",
+            "url": "https://api.pugetsound.onebusaway.org/api/where",
+            "key": "TEST",
+            "static_gtfs": True,
+            "coverage": [[47.4, -122.5], [47.8, -122.5], [47.8, -122.0], [47.4, -122.0]]
+        }
+    ]
+    TRANSIT_PROVIDER_TIMEOUT_SECONDS: int = 10
+    
+    # Static GTFS schedule (zip file or extracted directory; downloaded from KC_METRO_GTFS_URL if empty)
+    GTFS_STATIC_ENABLED: bool = True
+    GTFS_STATIC_PATH: str = ""
+    GTFS_DATA_DIR: str = "./data"
+    # Parsed feeds are saved as immutable snapshots under GTFS_DATA_DIR/snapshots,
+    # built in a separate process and memory-mapped (shared by all workers)
+    GTFS_SNAPSHOT_PROCESS: bool = True
+    # Check for a new feed this often and hot-swap it in (0 disables)
+    GTFS_REFRESH_HOURS: int = 24
+    # Arrival delay histograms snapshot (defaults to GTFS_DATA_DIR/delay_histograms.npz)
+    DELAY_HISTOGRAM_PATH: str = ""
+    # Historical observations store (defaults to GTFS_DATA_DIR/timeseries)
+    TIMESERIES_ENABLED: bool = True
+    TIMESERIES_PATH: str = ""
+    TIMESERIES_FLUSH_SECONDS: int = 5
+    TIMESERIES_QUEUE_SIZE: int = 10000
+    TIMESERIES_COMPACT_AFTER_DAYS: int = 7
+    TIMESERIES_COMPACT_BUCKET_SECONDS: int = 900
+    TIMESERIES_RETENTION_DAYS: int = 90
+    # Load GTFS data and start the realtime consumer at startup instead of on first use
+    GTFS_PRELOAD: bool = False
+    
+    # Cold start budgets checked by bench_startup.py
+    IMPORT_BUDGET_MS: int = 1500
+    STARTUP_BUDGET_MS: int = 3000
+    
+    # Response fast path: orjson encoding, cached encoded bodies and gzip/brotli
+    FAST_RESPONSES_ENABLED: bool = False
+    COMPRESSION_MIN_BYTES: int = 1024
+    GZIP_LEVEL: int = 6
+    BROTLI_QUALITY: int = 4
+    
+    # Admission control: concurrent requests per endpoint prefix. Limited
+    # handlers run in the threadpool (40 threads), so the total stays below
+    # that to leave threads for cache hits and health checks.
+    ADMISSION_CONTROL_ENABLED: bool = True
+    ADMISSION_LIMITS: dict = {
+        "/api/weather": 8,
+        "/api/traffic": 8,
+        "/api/transit": 6,
+        "/api/transit/plan": 3,
+        "/api/transit/reachable": 3,
+        "/api/route": 8,
+        "/api/recommendations": 3,
+        "/api/commute": 4,
+    }
+    ADMISSION_MAX_QUEUE: int = 32
+    ADMISSION_MAX_QUEUE_MS: int = 2000
+    ADMISSION_RETRY_AFTER_SECONDS: int = 2
+    
+    # Weather is fetched on a fixed grid (~11 x 7.5 km around Seattle) and
+    # interpolated between nodes, so upstream calls scale with area, not users
+    WEATHER_GRID_DEGREES: float = 0.1
+    
+    # Vector tiles: static transit tiles up to this zoom are rendered when
+    # GTFS data loads; deeper tiles are rendered on demand into a bounded cache
+    TILE_PRERENDER_MAX_ZOOM: int = 13
+    TILE_CACHE_SIZE: int = 4096
+    
+    # Commute alerts: evaluate every saved commute profile on a background cycle
+    ALERTS_ENABLED: bool = False
+    ALERT_INTERVAL_SECONDS: int = 300
+    ALERT_LOOKAHEAD_MINUTES: int = 30
+    ALERT_TRAFFIC_DELAY_MINUTES: int = 10
+    ALERT_TRANSIT_DELAY_MINUTES: int = 5
+    
+    # Diagnostics: users allowed into /api/admin (profiler, slow requests)
+    ADMIN_USERS: list = []
+    # Requests slower than this are kept, with upstream timings, in a ring buffer
+    REQUEST_TRACE_ENABLED: bool = True
+    SLOW_REQUEST_MS: int = 1000
+    SLOW_REQUEST_BUFFER: int = 200
+    # Sampling profiler limits; low rates are cheap enough to run in production
+    PROFILER_DEFAULT_HZ: int = 20
+    PROFILER_MAX_HZ: int = 250
+    PROFILER_MAX_SECONDS: int = 600
+    
     # Security
+    TOKEN_CACHE_SIZE: int = 1024
     SECRET_KEY: str = Field(default_factory=lambda: os.environ.get("SECRET_KEY", "your-secret-key-for-dev-replace-in-production"))
       # CORS
     CORS_ORIGINS: list = ["*", "https://urbancommuteassistant.netlify.app"]
@@ -0,0 +1,38 @@
+"""
+Tests for recording arrival deviations into the delay histograms.
+
+Run this script from the backend directory:
+python -m pytest test_delay_service.py
+"""
+
+import sys
+import os
+
+import pytest
+
+# Add the project to path so we can import modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from api.services import delay_service
+from api.services.delay_service import DelayHistograms, record_deviations, time_bucket
+
+T = 1792512000.0
+
+
+@pytest.fixture
+def recorded(monkeypatch):
+    """Fresh histograms and seen set; returns the rows sent to the arrivals series."""
+    rows = []
+    monkeypatch.setattr(delay_service, "_histograms", DelayHistograms())
+    monkeypatch.setattr(delay_service, "_seen", {})
+    monkeypatch.setattr(delay_service, "record", lambda series, batch: rows.extend(batch))
+    return rows
+
+
+def test_same_arrival_counted_once_across_feeds(recorded):
+    # OneBusAway reports the arrival first, then GTFS-Realtime with bare ids
+    assert record_deviations([("1_100228", "1_75403", "1_5551", T, 45)], now=T) == 1
+    assert record_deviations([("100228", "75403", "5551", T, 45)], now=T + 30) == 0
+
+    assert [row[3:] for row in recorded] == [("100228", "75403", "5551")]
+    _, samples = delay_service.get_histograms().lookup(("100228", "75403", time_bucket(T)))
+    assert samples == 1
@@ -0,0 +1,79 @@
+"""
+Tests for service days and departure lookups in the static GTFS dataset.
+
+Run this script from the backend directory:
+python -m pytest test_gtfs_service.py
+"""
+
+import sys
+import os
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+
+# Add the project to path so we can import modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from api.services.gtfs_service import load_gtfs_dataset
+
+PACIFIC = ZoneInfo("America/Los_Angeles")
+
+# One stop served every day of 2026: a late trip past midnight and an early one
+FEED = {
+    "agency.txt": "agency_id,agency_name,agency_url,agency_timezone\n"
+                  "1,Test Transit,https://example.com,America/Los_Angeles\n",
+    "stops.txt": "stop_id,stop_name,stop_lat,stop_lon\n"
+                 "A,First Ave,47.6000,-122.3300\n"
+                 "B,Second Ave,47.6100,-122.3300\n",
+    "routes.txt": "route_id,route_short_name,route_long_name,route_type\n"
+                  "R,1,Test Route,3\n",
+    "calendar.txt": "service_id,monday,tuesday,wednesday,thursday,friday,saturday,sunday,start_date,end_date\n"
+                    "ALL,1,1,1,1,1,1,1,20260101,20261231\n",
+    "trips.txt": "route_id,service_id,trip_id\n"
+                 "R,ALL,early\n"
+                 "R,ALL,late\n",
+    "stop_times.txt": "trip_id,arrival_time,departure_time,stop_id,stop_sequence\n"
+                      "early,05:30:00,05:30:00,A,1\n"
+                      "early,05:40:00,05:40:00,B,2\n"
+                      "late,24:30:00,24:30:00,A,1\n"
+                      "late,24:40:00,24:40:00,B,2\n"
+}
+
+
+@pytest.fixture(scope="module")
+def dataset(tmp_path_factory):
+    feed_dir = tmp_path_factory.mktemp("gtfs")
+    for name, contents in FEED.items():
+        (feed_dir / name).write_text(contents)
+    return load_gtfs_dataset(str(feed_dir))
+
+
+def _ts(*args):
+    return datetime(*args, tzinfo=PACIFIC).timestamp()
+
+
+@pytest.mark.parametrize("service_date", [date(2026, 3, 8), date(2026, 11, 1), date(2026, 10, 20)])
+def test_service_day_start_is_noon_minus_12h(dataset, service_date):
+    """On DST change days the reference point is not local midnight."""
+    noon = _ts(service_date.year, service_date.month, service_date.day, 12)
+    assert dataset.service_day_start(service_date) == noon - 12 * 3600
+
+
+def test_departures_on_dst_change_day(dataset):
+    # 05:30 on the spring-forward day is 05:30 PDT, though the day started in PST
+    stop_idx = dataset.stop_index["A"]
+    departures = dataset.departures_between(stop_idx, _ts(2026, 3, 8, 5), _ts(2026, 3, 8, 6))
+    assert [ts for ts, _ in departures] == [_ts(2026, 3, 8, 5, 30)]
+
+
+def test_departures_window_crossing_midnight(dataset):
+    """A late evening window reaches the previous day's 24:30 trip and the next day's early trip."""
+    stop_idx = dataset.stop_index["A"]
+    departures = dataset.departures_between(stop_idx, _ts(2026, 10, 20, 23), _ts(2026, 10, 21, 6))
+    assert [ts for ts, _ in departures] == [_ts(2026, 10, 21, 0, 30), _ts(2026, 10, 21, 5, 30)]
+
+
+def test_next_departure_in_next_service_day(dataset):
+    stop_idx = dataset.stop_index["A"]
+    assert dataset.next_departure(stop_idx, _ts(2026, 10, 21, 1), _ts(2026, 10, 21, 8)) == _ts(2026, 10, 21, 5, 30)
+    assert dataset.next_departure(stop_idx, _ts(2026, 10, 21, 1), _ts(2026, 10, 21, 5)) is None
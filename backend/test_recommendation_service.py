@@ -0,0 +1,74 @@
+"""
+Tests for mode scoring in the recommendation service.
+
+Run this script from the backend directory:
+python -m pytest test_recommendation_service.py
+"""
+
+import sys
+import os
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+# Add the project to path so we can import modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from config import settings
+
+# Score from the fallback transit estimate rather than downloading the timetable
+settings.GTFS_STATIC_ENABLED = False
+
+from api.services.recommendation_service import score_commutes, weather_penalty, MODES, BIKE, DRIVE
+
+PACIFIC = ZoneInfo("America/Los_Angeles")
+
+# Capitol Hill to Downtown Seattle
+COMMUTE = {
+    "origin_lat": 47.6230,
+    "origin_lon": -122.3190,
+    "destination_lat": 47.6062,
+    "destination_lon": -122.3321
+}
+
+
+def _minutes(result):
+    return {mode["mode"]: mode["minutes"] for mode in result["modes"]}
+
+
+def test_weather_override():
+    """A known weather description is applied to the commute it came with."""
+    dry, wet = score_commutes([COMMUTE, {**COMMUTE, "weather": "light rain"}], now=1_800_000_000)
+
+    assert wet["features"]["weather"] == "light rain"
+    # Weather changes the cost of a mode, not its travel time
+    assert _minutes(wet) == _minutes(dry)
+
+    confidence = {mode["mode"]: mode["confidence"] for mode in wet["modes"]}
+    dry_confidence = {mode["mode"]: mode["confidence"] for mode in dry["modes"]}
+    assert confidence["bike"] < dry_confidence["bike"]
+
+
+def test_weather_override_shared_description():
+    """Commutes with the same description get the same penalty row."""
+    results = score_commutes([{**COMMUTE, "weather": "snow"}] * 3 + [COMMUTE], now=1_800_000_000)
+
+    assert [result["features"]["weather"] for result in results[:3]] == ["snow"] * 3
+    assert results[0]["modes"] == results[1]["modes"] == results[2]["modes"]
+
+
+def test_weather_penalty():
+    penalty = weather_penalty("heavy snow", temperature=20.0)
+    assert len(penalty) == len(MODES)
+    assert penalty[BIKE] > penalty[DRIVE]
+    assert not weather_penalty("clear sky", temperature=60.0).any()
+
+
+def test_rush_hour_in_local_time_across_dst():
+    """Departures are bucketed by the UTC offset on their own date, not today's."""
+    def depart(month, hour):
+        return {**COMMUTE, "depart_at": datetime(2026, month, 15, hour, 30, tzinfo=PACIFIC).timestamp()}
+
+    winter_peak, summer_peak, summer_evening = score_commutes(
+        [depart(1, 18), depart(7, 18), depart(7, 19)], now=1_800_000_000
+    )
+    assert _minutes(winter_peak)["drive"] == _minutes(summer_peak)["drive"]
+    assert _minutes(summer_peak)["drive"] > _minutes(summer_evening)["drive"]
@@ -0,0 +1,118 @@
+"""
+Tests for the route reliability aggregates.
+
+Run this script from the backend directory:
+python -m pytest test_reliability_service.py
+"""
+
+import sys
+import os
+from datetime import date, datetime
+
+import numpy as np
+import pytest
+
+# Add the project to path so we can import modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from config import settings
+from api.services import timeseries_service
+from api.services.delay_service import LOCAL_TIMEZONE
+from api.services.reliability_service import (
+    DayReliability, SUM_COLUMNS, ON_TIME_EARLY_SECONDS, ON_TIME_LATE_SECONDS, _summarize
+)
+
+DAY = date(2026, 10, 20)
+
+
+def _ts(hour, minute=0, second=0):
+    return datetime(DAY.year, DAY.month, DAY.day, hour, minute, second, tzinfo=LOCAL_TIMEZONE).timestamp()
+
+
+def _add(day, arrivals, route=b"44", stop=b"29247"):
+    """Fold (scheduled, delay) pairs for one route and stop into a day."""
+    scheduled = np.array([s for s, _ in arrivals], dtype=np.float64)
+    delay = np.array([d for _, d in arrivals], dtype=np.float64)
+    day.add(np.array([route] * len(arrivals), dtype="S16"), np.array([stop] * len(arrivals), dtype="S16"),
+            scheduled, delay)
+
+
+def _stats(day, route="44", stop="29247", hour=8):
+    row = day.index[(route, stop, hour)]
+    return _summarize(day.sums[row], day.histograms[row])
+
+
+def test_on_time_window_edges():
+    day = DayReliability(DAY)
+    _add(day, [
+        (_ts(8, 0), -ON_TIME_EARLY_SECONDS),      # on time, just
+        (_ts(8, 10), -ON_TIME_EARLY_SECONDS - 1),  # early
+        (_ts(8, 20), ON_TIME_LATE_SECONDS),       # on time, just
+        (_ts(8, 30), ON_TIME_LATE_SECONDS + 1)     # late
+    ])
+
+    stats = _stats(day)
+    assert stats["samples"] == 4
+    assert stats["on_time_pct"] == 50.0
+    assert stats["mean_delay_seconds"] == round((-60 - 61 + 300 + 301) / 4)
+
+
+def test_groups_by_local_scheduled_hour():
+    day = DayReliability(DAY)
+    _add(day, [(_ts(8, 59), 0), (_ts(9, 0), 0)])
+    assert sorted(hour for _, _, hour in day.index) == [8, 9]
+
+
+def test_headways_carry_over_between_batches():
+    day = DayReliability(DAY)
+    _add(day, [(_ts(8, 0), 0), (_ts(8, 10), 60)])
+    # The first arrival of the next batch measures from the last one of this
+    _add(day, [(_ts(8, 20), 0), (_ts(8, 30), 0)])
+
+    stats = _stats(day)
+    headways = [660, 540, 600]
+    assert stats["headway_mean_seconds"] == round(sum(headways) / 3)
+    assert stats["headway_variance"] == round(np.var(headways))
+
+
+def test_headways_kept_apart_per_stop():
+    day = DayReliability(DAY)
+    _add(day, [(_ts(8, 0), 0)], stop=b"1")
+    _add(day, [(_ts(8, 5), 0)], stop=b"2")
+    _add(day, [(_ts(8, 10), 0)], stop=b"1")
+
+    assert day.sums[day.index[("44", "1", 8)], SUM_COLUMNS.index("headway_count")] == 1
+    assert day.sums[day.index[("44", "2", 8)], SUM_COLUMNS.index("headway_count")] == 0
+    # One headway isn't enough for a variance
+    assert _stats(day, stop="1")["headway_variance"] is None
+
+
+def test_summarize_empty_group():
+    assert _summarize(np.zeros(len(SUM_COLUMNS)), np.zeros(1, dtype=np.int32)) is None
+
+
+def test_refresh_reads_only_new_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "TIMESERIES_PATH", str(tmp_path))
+
+    def arrival(scheduled, delay, recorded=None):
+        return (recorded or scheduled + delay, scheduled, delay, "44", "29247", "trip")
+
+    day = DayReliability(DAY)
+    timeseries_service.write_batch("arrivals", [arrival(_ts(8, 0), 30), arrival(_ts(8, 10), 30)])
+    day.refresh(now=_ts(8, 30))
+    assert _stats(day)["samples"] == 2
+
+    # Nothing new: the aggregates don't change
+    day.refresh(now=_ts(8, 40))
+    assert _stats(day)["samples"] == 2
+
+    # A row recorded long after an earlier refresh still counts, once;
+    # rows scheduled on another day don't
+    timeseries_service.write_batch("arrivals", [
+        arrival(_ts(8, 20), 400, recorded=_ts(8, 50)),
+        arrival(_ts(8, 20) + 86400, 0)
+    ])
+    day.refresh(now=_ts(9, 0))
+    stats = _stats(day)
+    assert stats["samples"] == 3
+    assert stats["on_time_pct"] == round(100 * 2 / 3, 1)
+    assert sum(day.offsets.values()) == 4
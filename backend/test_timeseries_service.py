@@ -0,0 +1,89 @@
+"""
+Tests for writing to and reading from the time-series store.
+
+Run this script from the backend directory:
+python -m pytest test_timeseries_service.py
+"""
+
+import sys
+import os
+import builtins
+import fcntl
+import threading
+
+import pytest
+
+# Add the project to path so we can import modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from config import settings
+from api.services import timeseries_service
+
+T = 1792512000.0
+
+
+def _weather(ts, temperature, description="light rain"):
+    return (ts, 47.61, -122.33, temperature, 70.0, 5.0, 0.2, description)
+
+
+@pytest.fixture(autouse=True)
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "TIMESERIES_PATH", str(tmp_path))
+    return tmp_path
+
+
+def test_failed_write_leaves_columns_aligned(monkeypatch):
+    timeseries_service.write_batch("weather", [_weather(T, 50.0)])
+
+    # The disk fills up after some columns of the next batch are written
+    real_open = builtins.open
+
+    def failing_open(path, mode="r", *args, **kwargs):
+        if mode == "ab" and str(path).endswith("humidity.bin"):
+            raise OSError(28, "No space left on device")
+        return real_open(path, mode, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, "open", failing_open)
+    with pytest.raises(OSError):
+        timeseries_service.write_batch("weather", [_weather(T + 1, 51.0)])
+    monkeypatch.setattr(builtins, "open", real_open)
+
+    timeseries_service.write_batch("weather", [_weather(T + 2, 52.0, "clear sky")])
+
+    rows = timeseries_service.scan("weather", T - 60, T + 60)
+    assert (rows["ts"] - T).tolist() == [0.0, 2.0]
+    assert rows["temperature"].tolist() == [50.0, 52.0]
+    assert rows["humidity"].tolist() == [70.0, 70.0]
+    assert rows["description"].tolist() == ["light rain", "clear sky"]
+
+
+def test_rows_encoded_individually():
+    """A non-ASCII or malformed row doesn't cost the rest of the batch."""
+    timeseries_service.write_batch("weather", [
+        _weather(T, 50.0),
+        _weather(T + 1, 51.0, "pluie légère"),
+        _weather(T + 2, 52.0, "é" * 40),
+        ("not a row",)
+    ])
+
+    rows = timeseries_service.scan("weather", T - 60, T + 60)
+    # Long strings are cut at the column width, never inside a character
+    assert rows["description"].tolist() == ["light rain", "pluie légère", "é" * 16]
+    assert timeseries_service.timeseries_stats()["rejected"] >= 1
+
+
+def test_append_waits_for_partition_lock(store):
+    timeseries_service.write_batch("weather", [_weather(T, 50.0)])
+    [cell_dir] = [path.parent for path in store.rglob(timeseries_service.ROWS_FILE)]
+
+    # Another worker process is partway through its own append
+    with open(cell_dir / timeseries_service.LOCK_FILE, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        writer = threading.Thread(target=timeseries_service.write_batch, args=("weather", [_weather(T + 1, 51.0)]))
+        writer.start()
+        writer.join(0.2)
+        assert writer.is_alive()
+        fcntl.flock(lock, fcntl.LOCK_UN)
+    writer.join(5)
+
+    rows = timeseries_service.scan("weather", T - 60, T + 60)
+    assert rows["temperature"].tolist() == [50.0, 51.0]
@@ -30,7 +30,7 @@ def test_traffic_service():
     
     # Print result
     print("\nTraffic Service Result:")
-    print(json.dumps(result, indent=2))
+    print(json.dumps(result, indent=2, default=lambda record: record.to_dict()))
     
     # Check for error
     if "error" in result:
@@ -0,0 +1,154 @@
+"""
+Tests for the RAPTOR trip planner over a small GTFS feed.
+
+Run this script from the backend directory:
+python -m pytest test_trip_planner.py
+"""
+
+import sys
+import os
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+
+# Add the project to path so we can import modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from api.services import gtfs_service
+from api.services.gtfs_service import load_gtfs_dataset, agency_timestamp
+from api.services.trip_planner_service import plan_trip, get_reachable
+
+PACIFIC = ZoneInfo("America/Los_Angeles")
+
+# Route 1 runs A -> B, route 2 runs C -> D from a stop across the street
+# from B, and the express runs A -> D without a transfer but later.
+FEED = {
+    "agency.txt": "agency_id,agency_name,agency_url,agency_timezone\n"
+                  "1,Test Transit,https://example.com,America/Los_Angeles\n",
+    "stops.txt": "stop_id,stop_name,stop_lat,stop_lon\n"
+                 "A,Pike St,47.6000,-122.3300\n"
+                 "B,Denny Way,47.6100,-122.3300\n"
+                 "C,Denny Way NB,47.6102,-122.3302\n"
+                 "D,Mercer St,47.6200,-122.3300\n",
+    "routes.txt": "route_id,route_short_name,route_long_name,route_type\n"
+                  "R1,1,Local,3\n"
+                  "R2,2,Connector,3\n"
+                  "X,X,Express,3\n",
+    "calendar.txt": "service_id,monday,tuesday,wednesday,thursday,friday,saturday,sunday,start_date,end_date\n"
+                    "WK,1,1,1,1,1,0,0,20260101,20261231\n",
+    "trips.txt": "route_id,service_id,trip_id,trip_headsign\n"
+                 "R1,WK,r1_0800,Denny Way\n"
+                 "R1,WK,r1_0815,Denny Way\n"
+                 "R2,WK,r2_0820,Mercer St\n"
+                 "R2,WK,r2_0835,Mercer St\n"
+                 "X,WK,x_0825,Mercer St\n",
+    "stop_times.txt": "trip_id,arrival_time,departure_time,stop_id,stop_sequence\n"
+                      "r1_0800,08:00:00,08:00:00,A,1\n"
+                      "r1_0800,08:10:00,08:10:00,B,2\n"
+                      "r1_0815,08:15:00,08:15:00,A,1\n"
+                      "r1_0815,08:25:00,08:25:00,B,2\n"
+                      "r2_0820,08:20:00,08:20:00,C,1\n"
+                      "r2_0820,08:30:00,08:30:00,D,2\n"
+                      "r2_0835,08:35:00,08:35:00,C,1\n"
+                      "r2_0835,08:45:00,08:45:00,D,2\n"
+                      "x_0825,08:25:00,08:25:00,A,1\n"
+                      "x_0825,08:50:00,08:50:00,D,2\n"
+}
+
+ORIGIN = (47.6000, -122.3300)
+DESTINATION = (47.6200, -122.3300)
+
+
+@pytest.fixture(autouse=True)
+def dataset(tmp_path_factory, monkeypatch):
+    feed_dir = tmp_path_factory.mktemp("gtfs")
+    for name, contents in FEED.items():
+        (feed_dir / name).write_text(contents)
+    ds = load_gtfs_dataset(str(feed_dir))
+    monkeypatch.setattr(gtfs_service, "_dataset", ds)
+    return ds
+
+
+@pytest.fixture
+def utc_server(monkeypatch):
+    """Run with the server's own zone set to UTC, as on the hosting platform."""
+    monkeypatch.setenv("TZ", "UTC")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_naive_departure_is_agency_local_time(utc_server):
+    assert agency_timestamp(datetime(2026, 10, 20, 8, 5)) == datetime(2026, 10, 20, 8, 5, tzinfo=PACIFIC).timestamp()
+    assert agency_timestamp("2026-10-20T15:05:00+00:00") == datetime(2026, 10, 20, 8, 5, tzinfo=PACIFIC).timestamp()
+
+
+def test_plan_with_transfer(utc_server):
+    result = plan_trip(*ORIGIN, *DESTINATION, agency_timestamp(datetime(2026, 10, 20, 7, 55)), window_minutes=10)
+
+    journey = result["journeys"][0]
+    assert journey["departure_time"] == "2026-10-20T08:00:00-07:00"
+    assert journey["arrival_time"] == "2026-10-20T08:30:00-07:00"
+    assert journey["transfers"] == 1
+    assert [leg["mode"] for leg in journey["legs"]] == ["walk", "transit", "walk", "transit", "walk"]
+    rides = [leg for leg in journey["legs"] if leg["mode"] == "transit"]
+    assert [leg["trip_id"] for leg in rides] == ["r1_0800", "r2_0820"]
+    assert rides[1]["departure_time"] == "2026-10-20T08:20:00-07:00"
+
+
+def test_plan_keeps_pareto_journeys():
+    """A later departure without a transfer survives next to the earlier, faster journeys."""
+    result = plan_trip(*ORIGIN, *DESTINATION, agency_timestamp(datetime(2026, 10, 20, 7, 55)), window_minutes=40)
+
+    journeys = [(j["departure_time"][11:16], j["arrival_time"][11:16], j["transfers"]) for j in result["journeys"]]
+    assert journeys == [("08:00", "08:30", 1), ("08:15", "08:45", 1), ("08:25", "08:50", 0)]
+
+
+def test_plan_off_service_day():
+    # Saturday: the weekday service doesn't run
+    result = plan_trip(*ORIGIN, *DESTINATION, agency_timestamp(datetime(2026, 10, 24, 7, 55)), window_minutes=40)
+    assert result["journeys"] == []
+
+
+def test_plan_limits_transfers():
+    result = plan_trip(*ORIGIN, *DESTINATION, agency_timestamp(datetime(2026, 10, 20, 7, 55)), window_minutes=40,
+                       max_transfers=0)
+    assert [j["transfers"] for j in result["journeys"]] == [0]
+
+
+def test_reachable_departure_time(utc_server):
+    result = get_reachable(*ORIGIN, agency_timestamp(datetime(2026, 10, 20, 8, 5)), budget_minutes=30)
+
+    assert result["departure_time"] == "2026-10-20T08:00:00-07:00"
+    # The origin is snapped to its cell center, a short walk from A
+    reached = {stop["id"]: stop["minutes"] for stop in result["stops"]}
+    assert reached["A"] < 5
+    assert reached["A"] < reached["B"] <= 30
+
+
+def test_reachable_cache_not_shared_across_datasets(monkeypatch, tmp_path):
+    depart_at = agency_timestamp(datetime(2026, 10, 20, 8, 5))
+    assert get_reachable(*ORIGIN, depart_at, budget_minutes=30)["cached"] is False
+    assert get_reachable(*ORIGIN, depart_at, budget_minutes=30)["cached"] is True
+
+    # A newer feed lists fewer stops, in a different order
+    feed = {
+        **FEED,
+        "stops.txt": "stop_id,stop_name,stop_lat,stop_lon\n"
+                     "B,Denny Way,47.6100,-122.3300\n"
+                     "A,Pike St (relocated),47.6000,-122.3300\n",
+        "stop_times.txt": "trip_id,arrival_time,departure_time,stop_id,stop_sequence\n"
+                          "r1_0800,08:00:00,08:00:00,A,1\n"
+                          "r1_0800,08:10:00,08:10:00,B,2\n"
+                          "r1_0815,08:15:00,08:15:00,A,1\n"
+                          "r1_0815,08:25:00,08:25:00,B,2\n"
+    }
+    for name, contents in feed.items():
+        (tmp_path / name).write_text(contents)
+    monkeypatch.setattr(gtfs_service, "_dataset", load_gtfs_dataset(str(tmp_path)))
+
+    result = get_reachable(*ORIGIN, depart_at, budget_minutes=30)
+    assert result["cached"] is False
+    assert {stop["id"]: stop["name"] for stop in result["stops"]} == {"A": "Pike St (relocated)", "B": "Denny Way"}
@@ -0,0 +1,41 @@
+"""
+Deferred imports for heavy dependencies.
+
+Modules like requests, numpy and jwt add noticeable time to a cold start,
+but most requests don't need all of them. lazy_import returns a stand-in
+that performs the real import on first attribute access.
+"""
+import importlib
+import threading
+
+
+class LazyModule:
+    """Module proxy that imports the target module the first time it's used."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        # Only called for attributes not yet copied onto the proxy, so after
+        # the first lookup hot loops pay a plain attribute access
+        value = getattr(self._load(), attr)
+        self.__dict__[attr] = value
+        return value
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_import(name):
+    """Return a proxy for a module that is imported on first attribute access."""
+    return LazyModule(name)
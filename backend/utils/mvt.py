@@ -0,0 +1,230 @@
+"""
+Mapbox Vector Tile encoding (spec version 2.1).
+
+A small hand-written protobuf writer covering just the messages a tile
+needs (Tile, Layer, Feature, Value), so no protobuf compiler or extra
+dependency is involved. Geometry is given in tile pixel coordinates,
+0..extent with (0, 0) at the top-left corner; lonlat_to_tile and
+clip_line help get it there.
+"""
+from math import atan, degrees, pi, sinh
+import struct
+
+from .lazy import lazy_import
+
+np = lazy_import("numpy")
+
+DEFAULT_EXTENT = 4096
+
+# Feature geometry types
+POINT = 1
+LINESTRING = 2
+
+# Geometry commands
+_MOVE_TO = 1
+_LINE_TO = 2
+
+
+def tile_bounds(z, x, y):
+    """Bounds of a tile in degrees: (west, south, east, north)."""
+    n = 2 ** z
+    west = x / n * 360 - 180
+    east = (x + 1) / n * 360 - 180
+    north = degrees(atan(sinh(pi * (1 - 2 * y / n))))
+    south = degrees(atan(sinh(pi * (1 - 2 * (y + 1) / n))))
+    return west, south, east, north
+
+
+def lonlat_to_tile(lat, lon, z, x, y, extent=DEFAULT_EXTENT):
+    """
+    Project points to pixel coordinates within tile z/x/y (Web Mercator).
+
+    Works on scalars or numpy arrays; coordinates are fractional and fall
+    outside 0..extent for points beyond the tile.
+    """
+    n = 2 ** z
+    world_x = (np.asarray(lon) + 180) / 360 * n
+    world_y = (1 - np.log(np.tan(np.pi / 4 + np.radians(lat) / 2)) / np.pi) / 2 * n
+    return (world_x - x) * extent, (world_y - y) * extent
+
+
+def _clip_segment(x0, y0, x1, y1, lo, hi):
+    """Liang-Barsky: the part of a segment inside the square lo..hi, or None."""
+    t0, t1 = 0.0, 1.0
+    dx, dy = x1 - x0, y1 - y0
+    for p, q in ((-dx, x0 - lo), (dx, hi - x0), (-dy, y0 - lo), (dy, hi - y0)):
+        if p == 0:
+            if q < 0:
+                return None
+            continue
+        t = q / p
+        if p < 0:
+            if t > t1:
+                return None
+            t0 = max(t0, t)
+        else:
+            if t < t0:
+                return None
+            t1 = min(t1, t)
+    return (x0 + t0 * dx, y0 + t0 * dy), (x0 + t1 * dx, y0 + t1 * dy)
+
+
+def clip_line(points, lo, hi):
+    """
+    Clip a line to the square lo..hi (in pixels).
+
+    Returns:
+        list: The pieces of the line inside the square, each a list of (x, y)
+    """
+    parts = []
+    current = None
+    for (x0, y0), (x1, y1) in zip(points, points[1:]):
+        clipped = _clip_segment(x0, y0, x1, y1, lo, hi)
+        if clipped is None:
+            current = None
+            continue
+        start, end = clipped
+        # A segment starting exactly where the last one ended continues the piece
+        if current is None or current[-1] != start:
+            current = [start]
+            parts.append(current)
+        current.append(end)
+    return parts
+
+
+def _varint(value, out):
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _zigzag(value):
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def _field_bytes(field, data, out):
+    _varint(field << 3 | 2, out)
+    _varint(len(data), out)
+    out += data
+
+
+def _field_varint(field, value, out):
+    _varint(field << 3, out)
+    _varint(value, out)
+
+
+def _field_packed(field, values, out):
+    packed = bytearray()
+    for value in values:
+        _varint(value, packed)
+    _field_bytes(field, packed, out)
+
+
+def _value(value):
+    """Encode a Value message."""
+    out = bytearray()
+    if isinstance(value, bool):
+        _field_varint(7, int(value), out)
+    elif isinstance(value, int):
+        if value >= 0:
+            _field_varint(5, value, out)
+        else:
+            _field_varint(6, _zigzag(value), out)
+    elif isinstance(value, float):
+        _varint(3 << 3 | 1, out)
+        out += struct.pack("<d", value)
+    else:
+        _field_bytes(1, str(value).encode("utf-8"), out)
+    return bytes(out)
+
+
+def _geometry(kind, parts):
+    """Geometry commands for a feature, with coordinates rounded to whole pixels."""
+    commands = []
+    cx = cy = 0
+    if kind == POINT:
+        points = [(int(round(x)), int(round(y))) for part in parts for x, y in part]
+        if points:
+            commands.append(_MOVE_TO | len(points) << 3)
+        for px, py in points:
+            commands += (_zigzag(px - cx), _zigzag(py - cy))
+            cx, cy = px, py
+        return commands
+
+    for part in parts:
+        points = []
+        for x, y in part:
+            point = (int(round(x)), int(round(y)))
+            # Vertices that round onto the same pixel add nothing
+            if not points or point != points[-1]:
+                points.append(point)
+        if len(points) < 2:
+            continue
+        commands.append(_MOVE_TO | 1 << 3)
+        for i, (px, py) in enumerate(points):
+            if i == 1:
+                commands.append(_LINE_TO | (len(points) - 1) << 3)
+            commands += (_zigzag(px - cx), _zigzag(py - cy))
+            cx, cy = px, py
+    return commands
+
+
+def _layer(name, features, extent):
+    keys, values = {}, {}
+    encoded = []
+    for feature in features:
+        geometry = _geometry(feature["type"], feature["geometry"])
+        if not geometry:
+            continue
+        tags = []
+        for key, value in (feature.get("properties") or {}).items():
+            if value is None:
+                continue
+            tags.append(keys.setdefault(key, len(keys)))
+            # Keyed by type too, so 1, 1.0 and True stay distinct values
+            tags.append(values.setdefault((type(value), value), len(values)))
+        out = bytearray()
+        if feature.get("id") is not None:
+            _field_varint(1, feature["id"], out)
+        if tags:
+            _field_packed(2, tags, out)
+        _field_varint(3, feature["type"], out)
+        _field_packed(4, geometry, out)
+        encoded.append(out)
+    if not encoded:
+        return None
+
+    out = bytearray()
+    _field_varint(15, 2, out)
+    _field_bytes(1, name.encode("utf-8"), out)
+    for feature in encoded:
+        _field_bytes(2, feature, out)
+    for key in keys:
+        _field_bytes(3, key.encode("utf-8"), out)
+    for _, value in values:
+        _field_bytes(4, _value(value), out)
+    _field_varint(5, extent, out)
+    return out
+
+
+def encode_tile(layers, extent=DEFAULT_EXTENT):
+    """
+    Encode a vector tile.
+
+    Args:
+        layers: (name, features) pairs. Each feature is a dict with "type"
+            (POINT or LINESTRING), "geometry" (a list of parts, each a list
+            of (x, y) pixel coordinates) and optional "id" (non-negative int)
+            and "properties" (str/int/float/bool values; None is skipped).
+        extent (int, optional): Tile size in pixels. Defaults to 4096.
+
+    Returns:
+        bytes: The tile; layers with no drawable features are left out
+    """
+    out = bytearray()
+    for name, features in layers:
+        layer = _layer(name, features, extent)
+        if layer is not None:
+            _field_bytes(3, layer, out)
+    return bytes(out)
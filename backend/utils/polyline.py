@@ -0,0 +1,52 @@
+"""
+Encoded polyline helpers (Google polyline algorithm format).
+
+Coordinates are (lat, lon) pairs. Precision 5 matches what Leaflet and
+most mapping clients decode by default.
+"""
+
+
+def _encode_value(value, out):
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        out.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    out.append(chr(value + 63))
+
+
+def encode_polyline(points, precision=5):
+    """Encode a sequence of (lat, lon) pairs as a polyline string."""
+    factor = 10 ** precision
+    out = []
+    prev_lat = prev_lon = 0
+    for lat, lon in points:
+        lat_i = int(round(lat * factor))
+        lon_i = int(round(lon * factor))
+        _encode_value(lat_i - prev_lat, out)
+        _encode_value(lon_i - prev_lon, out)
+        prev_lat, prev_lon = lat_i, lon_i
+    return "".join(out)
+
+
+def decode_polyline(encoded, precision=5):
+    """Decode a polyline string into a list of (lat, lon) pairs."""
+    factor = 10 ** precision
+    points = []
+    index = lat = lon = 0
+    length = len(encoded)
+    while index < length:
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lon += deltas[1]
+        points.append((lat / factor, lon / factor))
+    return points
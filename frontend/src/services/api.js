@@ -23,18 +23,23 @@ api.interceptors.request.use(
   (error) => Promise.reject(error)
 );
 
+// Snap coordinates to the same grid the backend uses, so identical
+// requests from nearby users share browser/CDN cache entries
+const roundCoord = (value, decimals) => Number(Number(value).toFixed(decimals));
+
 // API service object
 const apiService = {
   // Weather endpoints
-  getWeather: (lat, lon) => api.get('/api/weather', { params: { lat, lon } }),
+  getWeather: (lat, lon) =>
+    api.get('/api/weather', { params: { lat: roundCoord(lat, 2), lon: roundCoord(lon, 2) } }),
   
   // Traffic endpoints
   getTraffic: (lat, lon, radius = 5000) => 
-    api.get('/api/traffic', { params: { lat, lon, radius } }),
+    api.get('/api/traffic', { params: { lat: roundCoord(lat, 3), lon: roundCoord(lon, 3), radius } }),
   
   // Transit endpoints
   getTransit: (lat, lon, radius = 500) => 
-    api.get('/api/transit', { params: { lat, lon, radius } }),
+    api.get('/api/transit', { params: { lat: roundCoord(lat, 3), lon: roundCoord(lon, 3), radius } }),
   // User endpoints
   login: (username, password) => 
     api.post('/api/users/token', { username, password }),
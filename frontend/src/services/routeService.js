@@ -1,30 +1,74 @@
-// TomTom Routing API utility
+// Routing utility, proxied through the backend route cache
 // Usage: getRouteTomTom([lat1, lng1], [lat2, lng2])
 import axios from 'axios';
 
-const TOMTOM_API_KEY = import.meta.env.VITE_TOMTOM_API_KEY;
-const BASE_URL = 'https://api.tomtom.com/routing/1/calculateRoute';
+const API_BASE_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
+
+// Decode a Google encoded polyline into [lat, lng] pairs
+export function decodePolyline(encoded, precision = 5) {
+  const factor = 10 ** precision;
+  const coords = [];
+  let index = 0;
+  let lat = 0;
+  let lng = 0;
+  while (index < encoded.length) {
+    const deltas = [];
+    for (let i = 0; i < 2; i++) {
+      let shift = 0;
+      let result = 0;
+      let byte;
+      do {
+        byte = encoded.charCodeAt(index++) - 63;
+        result |= (byte & 0x1f) << shift;
+        shift += 5;
+      } while (byte >= 0x20);
+      deltas.push(result & 1 ? ~(result >> 1) : result >> 1);
+    }
+    lat += deltas[0];
+    lng += deltas[1];
+    coords.push([lat / factor, lng / factor]);
+  }
+  return coords;
+}
 
 export async function getRouteTomTom(from, to, travelMode = 'car') { // Add travelMode parameter
-  if (!TOMTOM_API_KEY) throw new Error('TomTom API key not set');
-  const url = `${BASE_URL}/${from[0]},${from[1]}:${to[0]},${to[1]}/json`;
   const params = {
-    key: TOMTOM_API_KEY,
-    traffic: false,
-    computeBestOrder: false,
-    routeType: 'fastest',
-    travelMode: travelMode, // Use the travelMode parameter
+    from_lat: from[0],
+    from_lon: from[1],
+    to_lat: to[0],
+    to_lon: to[1],
+    mode: travelMode,
   };
-  const response = await axios.get(url, { params });
-  // Extract polyline and ETA from response
-  const route = response.data.routes?.[0];
-  const points = route?.legs?.[0]?.points;
-  const summary = route?.summary;
-  if (!points) throw new Error('No route found');
+  const response = await axios.get(`${API_BASE_URL}/api/route/`, { params });
+  const route = response.data;
+  if (!route?.polyline) throw new Error('No route found');
   // ETA in seconds
-  const etaSeconds = summary?.travelTimeInSeconds;
   return {
-    coords: points.map(pt => [pt.latitude, pt.longitude]),
-    etaSeconds: etaSeconds || null,
+    coords: decodePolyline(route.polyline),
+    etaSeconds: route.eta_seconds || null,
+  };
+}
+
+// Compare driving, transit, cycling and walking in one request. Options come
+// back ranked by ETA adjusted for live incidents and weather.
+export async function compareCommute(from, to, departAt = null) {
+  const params = {
+    from_lat: from[0],
+    from_lon: from[1],
+    to_lat: to[0],
+    to_lon: to[1],
+  };
+  if (departAt) params.depart_at = departAt.toISOString();
+  const response = await axios.get(`${API_BASE_URL}/api/commute/compare`, { params });
+  const comparison = response.data;
+  return {
+    bestMode: comparison.best_mode,
+    options: comparison.options.map((option) => ({
+      ...option,
+      coords: option.polyline ? decodePolyline(option.polyline) : null,
+      etaSeconds: Math.round(option.adjusted_minutes * 60),
+    })),
+    unavailable: comparison.unavailable,
+    weather: comparison.weather,
   };
 }
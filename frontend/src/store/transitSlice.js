@@ -10,7 +10,8 @@ export const fetchTransitData = createAsyncThunk(
   async ({ lat, lng, radius = 500 }, { rejectWithValue }) => {
     try {
       const response = await axios.get(`${API_BASE_URL}/api/transit`, {
-        params: { lat, lon: lng, radius }
+        // Rounded to the backend's cache grid so nearby users share cached responses
+        params: { lat: Number(Number(lat).toFixed(3)), lon: Number(Number(lng).toFixed(3)), radius }
       });
       return response.data;
     } catch (error) {
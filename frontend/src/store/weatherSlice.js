@@ -10,7 +10,8 @@ export const fetchWeatherData = createAsyncThunk(
   async ({ lat, lng }, { rejectWithValue }) => {
     try {
       const response = await axios.get(`${API_BASE_URL}/api/weather`, {
-        params: { lat, lon: lng }
+        // Rounded to the backend's cache grid so nearby users share cached responses
+        params: { lat: Number(Number(lat).toFixed(2)), lon: Number(Number(lng).toFixed(2)) }
       });
       return response.data;
     } catch (error) {